@@ -15,55 +15,36 @@ sys.path.append("..")
 import script.gtfs_controller as gtfs
 import script.analysis.geo_analysis as geo_analysis
 from script.GTFSGraph import GTFSGraph
-from script.gtfs_controller import (
-    build_network,
-    filter_service_id_by_date,
-    filter_service_id_by_date_v2,
-)
+from script.analysis.spatial_index import build_stop_index
+from script.gtfs_controller import build_network
 
 
 def get_sel_ids(obj, the_date):
-    sel_sids = set()
-    try:
-        services = obj.dfs["calendar.txt"].copy()
-        services = filter_service_id_by_date(
-            services=services,
-            the_date=the_date
-        )
-        # selected service ids
-        sel_sids.update(services["service_id"].tolist())
-        print(f"after 'calendar.txt': {len(sel_sids)}")
-    except:
-        print("calendar.txt not found or failed to process!")
-    
-    try:
-        services = obj.dfs["calendar_dates.txt"].copy()
-        sids_included, sids_excluded = filter_service_id_by_date_v2(
-            services=services,
-            the_date=the_date
-        )
-        sel_sids.update(sids_included)
-        sel_sids.difference_update(set(sids_excluded))
-        print(f"after 'calendar_dates.txt': {len(sel_sids)}")
-    except:
-        print("calendar_dates.txt not found to extract service ids!")
-    return list(sel_sids)
+    # services are resolved from the precompiled calendar of the controller
+    sel_sids = obj.get_service_ids_by_date(the_date)
+    print(f"active services on {the_date}: {len(sel_sids)}")
+    return sel_sids
+
+
+def get_stop_index(obj, stops, backend="balltree"):
+    # reuse the spatial index built with the network
+    if obj.stop_index is None:
+        obj.stop_index = build_stop_index(stops, backend=backend)
+    return obj.stop_index
 
 
 def analyze_od_tt(obj, stops, orig_loc, dest_loc, depart_min, bw_mile, cutoff):
-    stop_orig_ids, __ = geo_analysis.find_nei_stops_given_coords(
-        stops = stops,
-        locs = [orig_loc],
-        bw_mile = bw_mile,
-        return_all_neighbors=True
+    matches = get_stop_index(obj, stops).query_radius(
+        [orig_loc[0], dest_loc[0]],
+        [orig_loc[1], dest_loc[1]],
+        bw_mile=bw_mile,
     )
-    stop_dest_ids, __ = geo_analysis.find_nei_stops_given_coords(
-        stops = stops,
-        locs = [dest_loc],
-        bw_mile = bw_mile,
-        return_all_neighbors=True
-    )
-    
+    stop_orig_ids = matches.get(0)[0].tolist()
+    stop_dest_ids = matches.get(1)[0].tolist()
+    return analyze_od_tt_by_stops(obj, stop_orig_ids, stop_dest_ids, depart_min, cutoff)
+
+
+def analyze_od_tt_by_stops(obj, stop_orig_ids, stop_dest_ids, depart_min, cutoff):
     pth, __ = obj.query_od_stops_time(
         stop_orig_ids=stop_orig_ids,
         stop_dest_ids=stop_dest_ids,
@@ -89,32 +70,31 @@ def graph_query_all_times(
     coords: list[tuple[float, float]], 
     depart_min: float,
     cutoff: float,
-    bw_mile: float = 0.5
+    bw_mile: float = 0.5,
+    walk_speed: float = float("inf"),  # mph, inf: the stops within bw_mile are reached without walking
 ) -> list[float]:
-    times = []
-    ODs = list(itertools.permutations(coords, 2))
-    ODs = [OD for OD in ODs if OD[0] != OD[1]]
+    # one matrix for all coordinate pairs (with access/egress walks if walk_speed is finite)
+    get_stop_index(obj, stops)
+    od = obj.query_od_matrix(
+        depart_min=depart_min,
+        cutoff=cutoff,
+        orig_coords=coords,
+        dest_coords=coords,
+        bw_mile=bw_mile,
+        walk_speed=walk_speed,
+    )
+    ODs = list(itertools.permutations(range(len(coords)), 2))
+    ODs = [(i, j) for i, j in ODs if coords[i] != coords[j]]
     ttt_lst = []
     tts_moving = []  # either walking or traveling
-    for orig_coord, dest_coord in ODs:
-        try:
-            tt_travel, tt_wait, tt_walk, ttt = analyze_od_tt(
-                obj,
-                stops,
-                orig_loc = orig_coord,
-                dest_loc = dest_coord,
-                depart_min = depart_min,
-                bw_mile = bw_mile,
-                cutoff=cutoff
-            )
-            ttt_lst.append(ttt)
-            tts_moving.append(tt_travel+tt_walk)
-        except:
-            print(f"path not found: {orig_coord}, {dest_coord}")
+    for i, j in ODs:
+        if np.isnan(od.total[i, j]):
+            print(f"path not found: {coords[i]}, {coords[j]}")
             ttt_lst.append(-1)
             tts_moving.append(-1)
-        print(".", end="")
-    print()
+            continue
+        ttt_lst.append(od.total[i, j])
+        tts_moving.append(od.transit[i, j] + od.walk[i, j])
     return ttt_lst, tts_moving
 
 
@@ -1,6 +1,7 @@
 import streamlit as st
 
 from script.gtfs_controller import GTFSController
+import script.feed_merge as feed_merge
 import script.util.agency_init as agency_ut
 import script.util.io_tools as io_tools
 
@@ -17,6 +18,8 @@ if 'b1_clicked' not in st.session_state:
     st.session_state.b1_clicked = False
 if 'b2_clicked' not in st.session_state:
     st.session_state.b2_clicked = False
+if 'b3_clicked' not in st.session_state:
+    st.session_state.b3_clicked = False
 
 
 def call_back_b1():
@@ -27,6 +30,10 @@ def call_back_b2():
     st.session_state.b2_clicked = True
 
 
+def call_back_b3():
+    st.session_state.b3_clicked = True
+
+
 def form1():
     FOLDER_PTH = None
     with st.form(key="existing_form"):
@@ -53,6 +60,31 @@ def form2():
     return FOLDER_PTH
 
 
+def form3():
+    FOLDER_PTHS = []
+    with st.form(key="merge_form"):
+        # Option 3. merge several existing feeds into one regional network
+        file_options = st.multiselect(
+            "Option 3: Select several existed files to merge (regional network)",
+            options=AGENCIES
+        )
+        b3_submit_button = st.form_submit_button('Merge & Start Analysis!', on_click=call_back_b3)
+        if b3_submit_button or st.session_state.b3_clicked:
+            FOLDER_PTHS = [f"GTFS_inputs/{file_option}" for file_option in file_options]
+    return FOLDER_PTHS
+
+
+def upload_merged_data(FOLDER_PTHS: list[str]):
+    if len(FOLDER_PTHS) < 2:
+        st.error('select at least two feeds to merge')
+        return
+    with st.spinner('Loading GTFS documents in parallel...'):
+        controllers, load_times = feed_merge.load_feeds(FOLDER_PTHS)
+        st.session_state["GTFS_OBJ"] = feed_merge.merge_feeds(controllers)
+    st.success('GTFS successfully loaded and merged!')
+    st.write("loading time (seconds) per feed:", load_times)
+
+
 def upload_data(FOLDER_PTH: str):
     confirm_message = st.empty()
     print("FOLDER_PTH", FOLDER_PTH)
@@ -74,12 +106,19 @@ def upload_data(FOLDER_PTH: str):
 # step (2). load data
 # @st.cache_data
 def load_gtfs(pth_unzipeed_folder):
-    gtfs_obj = GTFSController(root_dir=pth_unzipeed_folder)
+    gtfs_obj = GTFSController(
+        root_dir=pth_unzipeed_folder,
+        stream_stop_times=st.session_state.get("stream_stop_times", False),
+    )
     st.session_state["GTFS_OBJ"] = gtfs_obj
 
 
 def page_1():
     FOLDER_PTH1, FOLDER_PTH2 = None, None
+    st.checkbox(
+        "Stream 'stop_times.txt' when building networks (for feeds larger than memory)",
+        key="stream_stop_times",
+    )
     col1, col2 = st.columns(2)
     with col1:
         FOLDER_PTH1 = form1()
@@ -93,6 +132,11 @@ def page_1():
     if st.session_state.b2_clicked:
         print("upload form clicked (right)")
         upload_data(FOLDER_PTH2)
+
+    FOLDER_PTHS3 = form3()
+    if st.session_state.b3_clicked:
+        print("merge form clicked (bottom)")
+        upload_merged_data(FOLDER_PTHS3)
     print("FOLDER_PTH1", FOLDER_PTH1)
     print("FOLDER_PTH2", FOLDER_PTH2)
 
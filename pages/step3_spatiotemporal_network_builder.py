@@ -6,11 +6,8 @@ import streamlit as st
 
 import script.graph_pipeline as graph_pipeline
 from script.GTFSGraph import GTFSGraph
-from script.gtfs_controller import (
-    build_network,
-    filter_service_id_by_date,
-    filter_service_id_by_date_v2,
-)
+from script.gtfs_controller import build_network
+from script.feed_merge import build_merged_network
 
 from script.util.table_viewer import show_static_table, show_static_table_simple
 import rustworkx as rx
@@ -63,10 +60,52 @@ def page_3():
                 1, 3, 2, 1
             )
 
+            # (4) spatial index used for walking neighbors and coordinate snapping
+            spatial_index = st.selectbox(
+                "Select spatial index of stops",
+                options=["balltree", "grid"],
+            )
+
+            # (5) landmarks for goal-directed OD queries (0: skip the preprocessing)
+            num_landmarks = st.number_input(
+                "Number of landmarks for OD queries (0 for none)",
+                min_value=0, max_value=64, value=0, step=4,
+            )
+
+            # (6) walking transfers: to every time of the neighbors, or only to their next departure
+            transfer_mode = st.selectbox(
+                "Select walking transfers between stops",
+                options=["all", "next_departure"],
+                help="'next_departure' builds a smaller network with the same OD travel times "
+                     "and applies the rules of 'transfers.txt' if the feed has one",
+            )
+
+            # (7) remove the time nodes only passed through by waiting (faster searches)
+            contract_waits = st.checkbox("Contract waiting chains at stops", value=False)
+
+            # (8) time resolution of the nodes (coarser: smaller networks, less precise times)
+            time_resolution = st.selectbox(
+                "Select time resolution (minutes)",
+                options=[1, 2, 5, 10, 15],
+                help="travel times are off by less than one step (plus up to one step per walk)",
+            )
+
+            # (9) renumber the nodes by (stop, time) and make the network read-only
+            freeze = st.checkbox(
+                "Freeze the network after the build", value=False,
+                help="faster searches, but no nodes or edges can be added afterwards",
+            )
+
             # update configuration information:
             network_config_info["date"] = the_date
             network_config_info["bw_mile"] = bw_mile
             network_config_info["walk_speed"] = walk_speed
+            network_config_info["spatial_index"] = spatial_index
+            network_config_info["num_landmarks"] = num_landmarks
+            network_config_info["transfer_mode"] = transfer_mode
+            network_config_info["contract_waits"] = contract_waits
+            network_config_info["time_resolution"] = time_resolution
+            network_config_info["freeze"] = freeze
         with col2:  # show service id table to select
             st.write("'Calendar.txt' for reference")
             with st.spinner('Loading table calendar.txt...'):
@@ -88,30 +127,11 @@ def page_3_execute(submit_button):
         if the_date is None:
             st.error("should fill a date for analysis...")
 
-        # filter the data set...
-        sel_sids = set()
-        try:
-            services = GTFS_OBJ.dfs["calendar.txt"].copy()
-            services = filter_service_id_by_date(
-                services=services,
-                the_date=the_date
-            )
-            # selected service ids
-            sel_sids.update(services["service_id"].tolist())
-        except:
-            print("calendar.txt not found to extract service ids!")
-        
-        try:
-            services = GTFS_OBJ.dfs["calendar_dates.txt"].copy()
-            sids_included, sids_excluded = filter_service_id_by_date_v2(
-                services=services,
-                the_date=the_date
-            )
-            sel_sids.update(sids_included)
-            sel_sids.difference_update(set(sids_excluded))
-        except:
-            print("calendar_dates.txt not found to extract service ids!")
-        
+        # filter the data set (look up the precompiled service calendar)...
+        sel_sids = set(GTFS_OBJ.get_service_ids_by_date(the_date))
+        if len(sel_sids) == 0:
+            st.error("no feasible services for that date found.")
+
         print(f"selected service ids {sel_sids}")
         network_config_info["service_id"] = sel_sids
         st.session_state["b3_1_clicked"] = True
@@ -119,7 +139,13 @@ def page_3_execute(submit_button):
 
         with st.spinner(f'Building transit network for the date {the_date}, {the_date.weekday()}...'):
             GRAPH_OBJ = st.session_state["GRAPH_OBJ"]
-            GRAPH_OBJ, stops = build_network(network_config_info, GTFS_OBJ, GRAPH_OBJ)
+            if len(GTFS_OBJ.feed_names) > 0:  # several feeds merged, time each feed
+                GRAPH_OBJ, stops, build_times = build_merged_network(
+                    network_config_info, GTFS_OBJ, GRAPH_OBJ
+                )
+                st.write("building time (seconds) per feed:", build_times)
+            else:
+                GRAPH_OBJ, stops = build_network(network_config_info, GTFS_OBJ, GRAPH_OBJ)
             st.session_state["GRAPH_OBJ"] = GRAPH_OBJ
             st.download_button(
                 "Download network in JSON format!",
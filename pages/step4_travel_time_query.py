@@ -11,6 +11,7 @@ from streamlit_folium import folium_static
 import script.util.map_viewer as map_ut
 import script.util.df_utils as df_ut
 import script.visualization.folium_plots as folium_plots
+import script.util.result_cache as result_cache
 
 import script.graph_pipeline as graph_pipeline
 from script.GTFSGraph import GTFSGraph
@@ -38,7 +39,7 @@ def page4_init():
         st.session_state["stops"] = None
 
 
-def page_4() -> tuple[gpd.GeoDataFrame, str, float, int]:
+def page_4() -> tuple[gpd.GeoDataFrame, str, float, int, str]:
     stops = st.session_state["stops"]
     print("step 4 stops length:", len(stops))
     # stops need to be filtered for the schedule...
@@ -47,15 +48,38 @@ def page_4() -> tuple[gpd.GeoDataFrame, str, float, int]:
     col1, col2 = st.columns([1, 3])
     with col1:
         with st.form(key='stop_id_analysis'):
-            stop_id = st.text_input("choose stop id (hover/click on the map to get stop id)")
+            stop_id = st.text_input(
+                "choose stop id (hover/click on the map to get stop id), "
+                "or origin coordinates as 'lat, lon'"
+            )
+            query_type = st.radio(
+                "Query type",
+                options=["depart at", "arrive by"],
+                horizontal=True,
+                help="arrive by: where one can leave from to arrive at the place by the time",
+            )
             depart_hr = st.slider(
-                "Departure time (hour of a day)",
+                "Departure (or arrival) time (hour of a day)",
                 0, 23, 8, 1
             )
             max_tt = st.slider(
                 "Select maximum travel time (cutoff of the Dijkstra's algorithm)",
                 0, 180, 120, 15
             )
+            walk_speed = st.slider(
+                "Walking speed (mph)",
+                1.0, 3.0, 1.5, 0.5
+            )
+            bw_mile = st.slider(
+                "Maximum walking distance to access stops from coordinates (mile)",
+                0.1, 1.0, 0.5, 0.1
+            )
+            isochrone_backend = st.radio(
+                "Isochrone rendering",
+                options=["polygon", "raster"],
+                horizontal=True,
+                help="raster: one travel-time surface for all bands (faster for large areas)",
+            )
             submit_button = st.form_submit_button("Start analysis & plot results!")
             st.session_state["b4_1_clicked"] = submit_button
     with col2:
@@ -63,14 +87,28 @@ def page_4() -> tuple[gpd.GeoDataFrame, str, float, int]:
         st.write("map reference of stops")
         with st.spinner('Loading map...'):
             m = map_ut.show_stops_map(GTFS_OBJ, w=800, h=300)
-    return stops, stop_id, depart_hr, max_tt
+    walk_info = {"walk_speed": walk_speed, "bw_mile": bw_mile, "arrive_by": query_type == "arrive by"}
+    return stops, stop_id, depart_hr, max_tt, isochrone_backend, walk_info
+
+
+def parse_coords(text: str) -> tuple[float, float] | None:
+    # "lat, lon" to a tuple, None if the text is not a coordinate pair
+    parts = text.replace("(", "").replace(")", "").split(",")
+    if len(parts) != 2:
+        return None
+    try:
+        return float(parts[0]), float(parts[1])
+    except ValueError:
+        return None
 
 
 def page_4_execute(
         stops: gpd.GeoDataFrame,
         stop_id: str,
         depart_hr: float,
-        max_tt: int
+        max_tt: int,
+        isochrone_backend: str = "polygon",
+        walk_info: dict | None = None,
 ) -> folium.Map:
     m = None
 
@@ -79,10 +117,14 @@ def page_4_execute(
     # if stop_id != "", no inputs, just enter the page
     if (st.session_state.b4_1_clicked and stop_id != ""):
         st.session_state["stop_id"] = stop_id
-        for key in GRAPH_OBJ.nodes_time_map:
-            if not isinstance(key, str):
-                stop_id = int(stop_id)
-            break
+        walk_info = {"walk_speed": 1.5, "bw_mile": 0.5} if walk_info is None else walk_info
+        walk_speed = walk_info["walk_speed"]
+        arrive_by = walk_info.get("arrive_by", False)
+        coords = parse_coords(stop_id)
+        # stop ids are always handled as strings (integer ids are used internally)
+        if coords is None and not GRAPH_OBJ.has_stop_nodes(stop_id):
+            st.error(f"stop id {stop_id} is not served on the selected date...")
+            return m
 
         my_bar = st.progress(
             0,
@@ -90,27 +132,72 @@ def page_4_execute(
         )
 
         print(f"stop id: {stop_id}, type: {type(stop_id)}")
-        # find the shortest paths from stop_id
-        one_source_paths, one_source_dists = GRAPH_OBJ.query_origin_stop_time(
-            stops_df=stops,
-            stop_id=stop_id,
-            depart_min=60 * depart_hr,
-            cutoff=max_tt,
-            walk_speed=1.5  # TODO: add parameter to control walking speed?
-        )
+        # find the shortest paths from stop_id (or from all stops near the coordinates)
+        # results are shared (LRU cache) across reruns and sessions
+        if arrive_by:
+            # one backward search: time needed to arrive by the time from each stop
+            one_source_paths, one_source_dists = result_cache.query_dest_time_cached(
+                GRAPH_OBJ,
+                dest=coords if coords is not None else stop_id,
+                arrive_min=60 * depart_hr,
+                cutoff=max_tt,
+                bw_mile=walk_info["bw_mile"],
+                walk_speed=walk_speed,
+            )
+            origin = result_cache.get_coords_origin(*coords) if coords is not None else stop_id
+        elif coords is not None:
+            one_source_paths, one_source_dists = result_cache.query_origin_coords_time_cached(
+                GRAPH_OBJ,
+                lat=coords[0],
+                lon=coords[1],
+                depart_min=60 * depart_hr,
+                cutoff=max_tt,
+                bw_mile=walk_info["bw_mile"],
+                walk_speed=walk_speed,
+            )
+            origin = result_cache.get_coords_origin(*coords)
+        else:
+            one_source_paths, one_source_dists = result_cache.query_origin_stop_time_cached(
+                GRAPH_OBJ,
+                stops_df=stops,
+                stop_id=stop_id,
+                depart_min=60 * depart_hr,
+                cutoff=max_tt,
+                walk_speed=walk_speed,
+            )
+            origin = stop_id
         print("one_source_paths len:", len(one_source_paths))
         print("one_source_dists len:", len(one_source_dists))
         my_bar.progress(70)
 
-        stops["node_id"] = stops["stop_id"].apply(
-            lambda x: GRAPH_OBJ.nodes_name_map[f"{x}_D"])
-        stops_gdf = df_ut.display_stops_one_source(stops, one_source_dists)
+        # earliest arrival (or time needed to arrive by) at each stop,
+        # the access stops of a forward search are reached by walking
+        if arrive_by:
+            stop_costs, __ = GRAPH_OBJ.reduce_costs_by_stop(one_source_dists, walk_arrivals=False)
+        else:
+            access = GRAPH_OBJ.get_origin_access(
+                stop_id=None if coords is not None else stop_id, coords=coords,
+                bw_mile=walk_info["bw_mile"], walk_speed=walk_speed, stops_df=stops,
+            )
+            stop_costs, __ = GRAPH_OBJ.reduce_costs_by_stop(one_source_dists, access=access)
+        stop_idxs = GRAPH_OBJ.encode_stops(stops["stop_id"])
+        acc_times = np.where(stop_idxs >= 0, stop_costs[stop_idxs], np.inf)
+        stops_gdf = df_ut.display_stops_acc_times(stops, acc_times)
         stops_gdf = stops_gdf.to_crs(epsg=3857)
         print("stops_gdf shape:", stops_gdf.shape)
 
         # acc_times = [(i+1)*20 for i in range(6)]
         acc_times = np.arange(10, max_tt, 10).tolist()
-        m = folium_plots.plot_isochrone_combined_plot(acc_times, stops_gdf)
+        if isochrone_backend == "raster":
+            m = folium_plots.plot_isochrone_raster_plot(acc_times, stops_gdf)
+        else:
+            key = result_cache.get_isochrone_key(GRAPH_OBJ, origin, 60 * depart_hr, max_tt, walk_speed)
+            if coords is not None:
+                key += (walk_info["bw_mile"],)
+            if arrive_by:
+                key += ("arrive_by",)
+            buffers = result_cache.get_buffers_cached(key, stops_gdf.to_crs("epsg:4326"), acc_times)
+            m = folium_plots.plot_isochrone_combined_plot(acc_times, stops_gdf, buffers=buffers)
 
         my_bar.progress(100)
     return m
@@ -118,7 +205,7 @@ def page_4_execute(
 page4_init()
 
 if GTFS_OBJ is not None and GRAPH_OBJ is not None:
-    stops, stop_id, depart_hr, max_tt = page_4()
-    m = page_4_execute(stops, stop_id, depart_hr, max_tt)
+    stops, stop_id, depart_hr, max_tt, isochrone_backend, walk_info = page_4()
+    m = page_4_execute(stops, stop_id, depart_hr, max_tt, isochrone_backend, walk_info)
     if m is not None:
         folium_static(m, width=700, height=500)
@@ -12,7 +12,7 @@ import script.util.map_viewer as map_ut
 import script.util.df_utils as df_ut
 import script.visualization.folium_plots as folium_plots
 import script.visualization.mpl_plots as mpl_plots
-import script.analysis.geo_analysis as geo_analysis
+from script.analysis.spatial_index import build_stop_index
 
 
 st.set_page_config(layout="wide", page_title="GTFS2STN", page_icon="🚌")
@@ -143,20 +143,13 @@ def page_5_find_stops_given_coords():
     print("stop_orig_coords:", stop_orig_coords)
     print("stop_dest_coords:", stop_dest_coords)
 
-    # find all available stops within 0.25 mile buffer
-    stop_orig_ids, __ = geo_analysis.find_nei_stops_given_coords(
-        stops,
-        stop_orig_coords,
-        bw_mile=walk_dist,
-        return_all_neighbors=True
-    )
-
-    stop_dest_ids, __ = geo_analysis.find_nei_stops_given_coords(
-        stops,
-        stop_dest_coords,
-        bw_mile=walk_dist,
-        return_all_neighbors=True
-    )
+    # find all available stops within the walking buffer (one query for both ends)
+    if GRAPH_OBJ.stop_index is None:
+        GRAPH_OBJ.stop_index = build_stop_index(stops)
+    lats, lons = zip(*(stop_orig_coords + stop_dest_coords))
+    matches = GRAPH_OBJ.stop_index.query_radius(lats, lons, bw_mile=walk_dist)
+    stop_orig_ids = matches.get(0)[0].tolist()
+    stop_dest_ids = matches.get(1)[0].tolist()
     return stop_orig_ids, stop_dest_ids
 
 
@@ -177,6 +170,9 @@ def page_5_od_reliability():
         st.text_input("closest transit station near the destination coordinates:", stop_dest_ids)
 
         transit_ts_min, wait_ts_min, walk_ts_min, total_ts_min = [], [], [], []
+        nodes_settled = 0
+        # landmark bounds are precomputed if set in step 3 (same travel times)
+        method = "alt" if GRAPH_OBJ.get_landmarks() is not None else "astar"
         hour_start, hour_end = depart_time_range
         min_start, min_end = hour_start * 60, hour_end * 60 + 1
         for depart_min in np.arange(min_start, min_end, step=10):  # step is every 10 minutes
@@ -185,8 +181,10 @@ def page_5_od_reliability():
                 stop_dest_ids=stop_dest_ids,
                 depart_min=depart_min,
                 cutoff=1000,
+                method=method,  # same travel times, fewer nodes searched
             )
-            
+            nodes_settled += GRAPH_OBJ.last_search_stats["nodes_settled"]
+
             # decompose path time by transit, wait, walk, etc.
             print("pth", pth)
             transit_t, wait_t, walk_t = GRAPH_OBJ.get_travel_time_info_from_pth(
@@ -204,6 +202,7 @@ def page_5_od_reliability():
             total_ts_min.append(total_ts)
 
         print("total_ts_min", total_ts_min)
+        st.caption(f"nodes settled by the searches (A*): {nodes_settled}")
         wait_ts_min = np.array(wait_ts_min)
         walk_ts_min = np.array(walk_ts_min)
         transit_ts_min = np.array(transit_ts_min)
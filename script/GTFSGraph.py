@@ -1,17 +1,32 @@
 """
 A rustworkx version of GTFS graph (better efficiency compared with networkx...)
 """
+import bisect
 import copy
+import heapq
+import math
+import os
+import uuid
 from enum import Enum
 from dataclasses import dataclass
 
 import numpy as np
 import pandas as pd
 import rustworkx as rx
+import scipy.sparse as sp
+from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
 from rustworkx import dijkstra_search
 from rustworkx.visit import DijkstraVisitor, StopSearch
 from sortedcontainers import SortedSet
 
+from script.compiled_feed import encode_ids
+from script.analysis.landmarks import Landmarks, compute_landmarks, get_landmarks_path
+from script.util.parallel import parallel_map, get_worker_state
+
+# costs of the stop graph are rounded down to this step (in minutes): all sums of them
+# are exact, so the A* reduced costs are never negative by floating-point error
+STOP_GRAPH_TIME_STEP = 1 / 1024
+
 
 @dataclass
 class GTFSNode:
@@ -63,6 +78,123 @@ class GTFSEdge:
         return f"<{self.start_node}-{self.end_node}, ({self.trip_t},{self.wait_t},{self.walk_t}), {self.mode}>"
 
 
+@dataclass
+class StopNeighbors:
+    """
+        Walkable neighbors of all stops in CSR layout: the neighbors of stop_ids[i]
+        are stop_ids[indices[indptr[i]:indptr[i + 1]]], dists (in miles) alike
+    """
+    stop_ids: np.ndarray
+    indptr: np.ndarray
+    indices: np.ndarray
+    dists: np.ndarray
+
+    def __post_init__(self):
+        self.stop_pos_map: dict = {sid: i for i, sid in enumerate(self.stop_ids.tolist())}
+
+    @classmethod
+    def from_frame(cls, stops: pd.DataFrame) -> "StopNeighbors":
+        # from the (legacy) "neighbors"/"dists" columns of a stops dataframe
+        counts = stops["neighbors"].apply(len).to_numpy()
+        return cls(
+            stop_ids=stops["stop_id"].to_numpy(),
+            indptr=np.concatenate([[0], np.cumsum(counts)]).astype("int64"),
+            indices=np.concatenate(stops["neighbors"].to_list()).astype("int64"),
+            dists=np.concatenate(stops["dists"].to_list()).astype("float64"),
+        )
+
+    def get_neighbors(self, stop_id: str) -> tuple[np.ndarray, np.ndarray]:
+        # neighbor stop ids and distances (in miles) of one stop
+        i = self.stop_pos_map[stop_id]
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        return self.stop_ids[self.indices[lo:hi]], self.dists[lo:hi]
+
+    def apply_transfers(self, transfers: pd.DataFrame, walk_speed: float) -> "StopNeighbors":
+        """
+            Neighbors with the stop-to-stop rules of "transfers.txt": a min. transfer time
+            (type 2) replaces the walking time of the pair (as the distance walked in that
+            time) or adds the pair, and transfers not possible (type 3) drop the pair.
+            Same-stop, route- and trip-specific rules do not fit the stop graph and are skipped.
+        """
+        rules = transfers[transfers["from_stop_id"] != transfers["to_stop_id"]]
+        for col in ["from_route_id", "to_route_id", "from_trip_id", "to_trip_id"]:
+            if col in rules.columns:
+                rules = rules[rules[col].isna()]
+        rules = rules[
+            rules["from_stop_id"].isin(self.stop_pos_map.keys()) & rules["to_stop_id"].isin(self.stop_pos_map.keys())
+        ]
+        types = rules["transfer_type"].fillna(0).astype(int).to_numpy()
+        min_ts = rules["min_transfer_time"].to_numpy(dtype="float64") if "min_transfer_time" in rules.columns \
+            else np.full(len(rules), np.nan)
+        pairs = {}  # (from, to) position -> distance, None to drop
+        for a, b, tp, t in zip(rules["from_stop_id"], rules["to_stop_id"], types, min_ts):
+            key = (self.stop_pos_map[a], self.stop_pos_map[b])
+            if tp == 3:
+                pairs[key] = None
+            elif tp == 2 and np.isfinite(t):
+                pairs[key] = t / 3600 * walk_speed  # seconds -> miles at the walking speed
+        if len(pairs) == 0:
+            return self
+
+        rows = np.repeat(np.arange(len(self.stop_ids)), np.diff(self.indptr))
+        neighbors = {(a, b): d for a, b, d in zip(rows.tolist(), self.indices.tolist(), self.dists.tolist())}
+        neighbors.update(pairs)
+        neighbors = sorted((a, b, d) for (a, b), d in neighbors.items() if d is not None)
+        a, b, d = (np.asarray(x) for x in zip(*neighbors))
+        return StopNeighbors(
+            stop_ids=self.stop_ids,
+            indptr=np.searchsorted(a, np.arange(len(self.stop_ids) + 1)).astype("int64"),
+            indices=b.astype("int64"),
+            dists=d.astype("float64"),
+        )
+
+
+class SearchWorkspace:
+    """
+        Search state reused by the queries of one worker (instead of new dicts in
+        every visitor): costs, predecessors (-1 for none) and (transit, wait, walk)
+        times of the nodes in arrays sized to the graph, grown if needed. Entries are
+        only valid for the nodes reached by the current search (stamped with its epoch,
+        and listed in visited[:num_visited]), so a new search increments the epoch
+        instead of clearing. Queries which would add nodes to the graph need it frozen.
+    """
+    def __init__(self, num_nodes: int = 0):
+        self.costs = np.zeros(0)
+        self.predecessors = np.zeros(0, dtype="int64")
+        self.mode_costs = np.zeros((0, 3))
+        self.stamps = np.zeros(0, dtype="int64")
+        self.epoch: int = 0
+        # nodes reached by the current search, in the order they were reached
+        self.visited = np.zeros(0, dtype="int64")
+        self.num_visited: int = 0
+        self.ensure_size(num_nodes)
+
+    def ensure_size(self, num_nodes: int) -> None:
+        num_new = num_nodes - len(self.stamps)
+        if num_new > 0:
+            self.costs = np.concatenate([self.costs, np.zeros(num_new)])
+            self.predecessors = np.concatenate([self.predecessors, np.full(num_new, -1, dtype="int64")])
+            self.mode_costs = np.concatenate([self.mode_costs, np.zeros((num_new, 3))])
+            self.stamps = np.concatenate([self.stamps, np.zeros(num_new, dtype="int64")])
+            self.visited = np.zeros(num_nodes, dtype="int64")
+
+    def start(self, source_vs: list[int], num_nodes: int) -> None:
+        # a new search from the sources over node ids below num_nodes
+        self.ensure_size(max(num_nodes, max(source_vs, default=-1) + 1))
+        self.epoch += 1
+        self.num_visited = 0
+        for v in source_vs:
+            self.costs[v], self.predecessors[v], self.mode_costs[v] = 0, -1, 0
+            self.visit(v)
+
+    def visit(self, v: int) -> None:
+        # stamp a node reached by the current search
+        if self.stamps[v] != self.epoch:
+            self.stamps[v] = self.epoch
+            self.visited[self.num_visited] = v
+            self.num_visited += 1
+
+
 class DijkstraCustomVisitor(DijkstraVisitor):
     # this is to stop the dijkstra search based on the total travel time
     # no need to search if time exceeds the cutoff...
@@ -73,33 +205,154 @@ class DijkstraCustomVisitor(DijkstraVisitor):
             source_vs: list[int],  # must provide sources
             target_vs: list[int] | None = None,
             cutoff: float = float('inf'),
+            all_target_vs: list[int] | None = None,  # stop once all of them are settled
+            track_modes: bool = False,  # also sum up (transit, wait, walk) times
+            reduced: bool = False,  # A*: scores are reduced costs, final_cost is the real one
+            # targets as integer stop ids (any time node of the stops), with the stop of each node
+            target_stops: set[int] | None = None,
+            all_target_stops: set[int] | None = None,
+            node_stops: list[int] | None = None,
+            # walks arriving at a stop before their end node (see GTFSGraph.walk_arrival_edges),
+            # used for the arrivals at the target stops, or at all stops if track_walk_arrivals
+            walk_arrival_edges: dict[tuple[int, int], float] | None = None,
+            track_walk_arrivals: bool = False,
+            # reuse the lists of a workspace (already started from source_vs) for the search state
+            workspace: SearchWorkspace | None = None,
     ):
         self.cutoff = cutoff
+        self.all_target_vs: set | None = set(all_target_vs) if all_target_vs is not None else None
+        self.target_stops = target_stops
+        self.all_target_stops: set | None = set(all_target_stops) if all_target_stops is not None else None
+        self.node_stops = node_stops
+        # arrival at each stop of all_target_stops: (cost, node, None) for the first node settled,
+        # or (cost, node before, node after) for a walk arriving before its end node
+        self.stop_arrivals: dict[int, tuple[float, int, int | None]] = {}
+        self.final_node: int | None = None
+        # (cost, node before, node after) of the earliest walk to a target stop that also waits there
+        self.walk_arrival: tuple[float, int, int] | None = None
+        self.walk_arrival_edges = walk_arrival_edges
+        self.track_walk_arrivals = track_walk_arrivals
+        # earliest walk arrival at each stop (of all_target_stops, or all stops if tracked),
+        # and a heap of (cost, stop) to settle them in order
+        self.walk_arrivals: dict[int, tuple[float, int, int]] = {}
+        self.pending_arrivals: list[tuple[float, int]] = []
+        self.track_modes = track_modes
         self.source_vs: list[int] | None = source_vs
         self.target_vs: list[int] | None = target_vs
         if target_vs is None:
             self.target_vs = {}
-        self.predecessors = {}
-        self.all_costs = {vs: 0 for vs in self.source_vs}
+        self.workspace = workspace
+        if workspace is None:
+            self.mode_costs = {vs: (0, 0, 0) for vs in source_vs}
+            self.predecessors = {vs: None for vs in source_vs}
+            self.all_costs = {vs: 0 for vs in self.source_vs}
+        else:
+            # same indexing as the dicts, entries of nodes not reached are stale
+            # (a predecessor of -1 is none, see get_predecessor)
+            self.mode_costs = workspace.mode_costs
+            self.predecessors = workspace.predecessors
+            self.all_costs = workspace.costs
         self.final_cost = None
+        self.num_settled = 0
+        self.reduced = reduced
     
     def set_source_vs(self, source_vs: list[int]):
         self.source_vs = source_vs
 
+    def get_node_stop(self, v: int) -> int:
+        # -1 for nodes of no stop (e.g., temporary nodes)
+        return self.node_stops[v] if v < len(self.node_stops) else -1
+
     def discover_vertex(self, v: int, score: float):
+        self.num_settled += 1
+        if self.settle_walk_arrival(score):
+            raise StopSearch
         if score > self.cutoff:
             self.final_cost = score
             raise StopSearch
-        if v in self.target_vs:
-            self.final_cost = score
+        if v in self.target_vs or (self.target_stops is not None and self.get_node_stop(v) in self.target_stops):
+            self.final_cost = self.all_costs[v] if self.reduced else score
+            self.final_node = v
             raise StopSearch
-        if v not in self.predecessors:
-            self.predecessors[v] = None
+        if self.all_target_vs is not None:
+            self.all_target_vs.discard(v)
+            if len(self.all_target_vs) == 0:
+                raise StopSearch
+        if self.all_target_stops is not None:
+            stop = self.get_node_stop(v)
+            if stop in self.all_target_stops:
+                self.all_target_stops.discard(stop)
+                self.stop_arrivals[stop] = (self.all_costs[v], v, None)
+                if len(self.all_target_stops) == 0:
+                    raise StopSearch
     
+    def examine_edge(self, edge):
+        # walks to the next departure arrive at the stop before the wait for their end node
+        if not self.walk_arrival_edges:
+            return
+        u, v, w = edge
+        if w.mode != EdgeMode.WALK or (u, v) not in self.walk_arrival_edges:
+            return
+        stop = self.get_node_stop(v)
+        cost = self.all_costs[u] + self.walk_arrival_edges[(u, v)]
+        if self.target_stops is not None and stop in self.target_stops:
+            if self.walk_arrival is None or cost < self.walk_arrival[0]:
+                self.walk_arrival = (cost, u, v)
+        elif self.track_walk_arrivals or (self.all_target_stops is not None and stop in self.all_target_stops):
+            if stop not in self.walk_arrivals or cost < self.walk_arrivals[stop][0]:
+                self.walk_arrivals[stop] = (cost, u, v)
+                if self.all_target_stops is not None:
+                    heapq.heappush(self.pending_arrivals, (cost, stop))
+
+    def settle_walk_arrival(self, score: float = float('inf')) -> bool:
+        # walk arrivals are final once no node left is cheaper (score: the next one, or inf at the end),
+        # returns True if the search is done
+        while len(self.pending_arrivals) > 0 and self.pending_arrivals[0][0] <= score:
+            cost, stop = heapq.heappop(self.pending_arrivals)
+            if stop in self.all_target_stops and self.walk_arrivals[stop][0] == cost:
+                self.all_target_stops.discard(stop)
+                self.stop_arrivals[stop] = self.walk_arrivals[stop]
+                if len(self.all_target_stops) == 0:
+                    return True
+        if self.walk_arrival is None or score < self.walk_arrival[0] or self.final_node is not None:
+            return False
+        self.final_cost, u, self.final_node = self.walk_arrival
+        self.predecessors[self.final_node] = u
+        return True
+
     def edge_relaxed(self, edge: float):
         u, v, w = edge
         self.predecessors[v] = u
         self.all_costs[v] = self.all_costs[u] + w.total_t
+        if self.track_modes:
+            trip_t, wait_t, walk_t = self.mode_costs[u]
+            self.mode_costs[v] = (trip_t + w.trip_t, wait_t + w.wait_t, walk_t + w.walk_t)
+        if self.workspace is not None:
+            self.workspace.visit(v)
+
+    def get_predecessor(self, v: int) -> int | None:
+        u = self.predecessors[v]
+        return None if u is None or u < 0 else int(u)
+
+    def get_reached_nodes(self) -> list[int]:
+        # sources and nodes relaxed by the search (settled or not)
+        if self.workspace is None:
+            return list(self.predecessors.keys())
+        return self.workspace.visited[:self.workspace.num_visited].tolist()
+
+    def get_reached_costs(self) -> dict[int, float]:
+        if self.workspace is None:
+            return self.all_costs
+        node_ids, costs = self.get_reached_arrays()
+        return dict(zip(node_ids.tolist(), costs.tolist()))
+
+    def get_reached_arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        # (node ids, costs) of the reached nodes, node ids are a view of the workspace if used
+        if self.workspace is None:
+            node_ids = np.fromiter(self.all_costs.keys(), dtype="int64", count=len(self.all_costs))
+            return node_ids, np.fromiter(self.all_costs.values(), dtype="float64", count=len(self.all_costs))
+        node_ids = self.workspace.visited[:self.workspace.num_visited]
+        return node_ids, self.all_costs[node_ids]
 
     def get_one_final_path_to_targets(self):
         if self.final_cost is None:
@@ -112,20 +365,15 @@ class DijkstraCustomVisitor(DijkstraVisitor):
             return []
         
         path = []
-        # find one target node to start backtracking...
-        visited_node_ids = self.predecessors.keys()
-        current_v = None
-        for target_v in self.target_vs:
-            if target_v in visited_node_ids:
-                current_v = target_v
-                break
+        # start backtracking from the target node settled
+        current_v = self.final_node
         if current_v is None:
             print("warning: no target node found to start backtracking...")
             return []
 
         while current_v is not None:
             path.append(current_v)
-            current_v = self.predecessors[current_v]
+            current_v = self.get_predecessor(current_v)
         
         path.reverse()
         return path
@@ -134,13 +382,13 @@ class DijkstraCustomVisitor(DijkstraVisitor):
         # for all searched nodes, return their paths from sources...
         # this is less efficient but guarantees correctness...
         all_paths = {}
-        all_costs = self.all_costs
-        for target_v in self.predecessors.keys():
+        all_costs = self.get_reached_costs()
+        for target_v in self.get_reached_nodes():
             path = []
             current_v = target_v
             while current_v is not None:
                 path.append(current_v)
-                current_v = self.predecessors[current_v]
+                current_v = self.get_predecessor(current_v)
             path.reverse()
             all_paths[target_v] = path
         print("num of all_paths:", len(all_paths))
@@ -148,17 +396,343 @@ class DijkstraCustomVisitor(DijkstraVisitor):
         return all_paths, all_costs
 
 
+@dataclass
+class ODMatrix:
+    """
+        Travel times (in minutes) of shape (num. of origins, num. of destinations),
+        total = transit + wait + walk, NaN if not reached within the cutoff
+    """
+    total: np.ndarray
+    transit: np.ndarray
+    wait: np.ndarray
+    walk: np.ndarray
+
+
+def _od_matrix_task(access: tuple[list[str], np.ndarray]) -> np.ndarray:
+    # runs in a worker: one origin to all destinations
+    state = get_worker_state()
+    # one search workspace per worker, reused by all its origins
+    workspace = state.setdefault("workspace", SearchWorkspace())
+    return state["graph"].query_one_to_many(
+        access[0], access[1], state["dests"], state["depart_min"], state["cutoff"], workspace=workspace
+    )
+
+
 class GTFSGraph:
     def __init__(self):
         self.G: rx.PyDiGraph = rx.PyDiGraph()  # spatiotemporal graph
+        # identifies the network in shared caches (set from the build configuration)
+        self.network_id: str = uuid.uuid4().hex
+        # time resolution of the nodes in minutes (set before adding nodes, see bucket_tod)
+        self.time_resolution: int = 1
         # mapping from node string name to its index...
-        self.nodes_name_map: dict = {}
+        self.nodes_name_map: dict | None = {}
+        # walkable neighbors of stops (set when walking edges are added)
+        self.stop_neighbors: StopNeighbors | None = None
+        # spatial index of stops to snap coordinates (see analysis.spatial_index)
+        self.stop_index = None
         # augmented data structure to gather all nodes for each stop_id
         # e.g., {"S1": [10, 20, 30]} means the "S1" stop has three time nodes...
-        self.nodes_time_map: dict = {}
+        self.nodes_time_map: dict | None = {}
+        # read-only graph with nodes numbered by (stop, time), see freeze: the nodes of the
+        # stop i are the ids _stop_node_offsets[i] to _stop_node_offsets[i + 1] - 1,
+        # at the times _stop_node_tods[offsets[i]:offsets[i + 1]] (replacing the two maps above)
+        self.frozen: bool = False
+        self._stop_node_offsets: np.ndarray | None = None
+        self._stop_node_tods: np.ndarray | None = None
+        # temporary origin nodes of the current OD query on a frozen graph
+        self._temp_nodes: list[int] = []
+        # times of the nodes removed by contract_wait_chains at each stop, and for the edges
+        # replacing them, the first time waited through (e.g., {(3, 7): 16}: edge 3 -> 7 waits
+        # through the removed nodes of the stop of node 7 from 16 on)
+        self.contracted_tods: dict[str, SortedSet] = {}
+        self.contracted_edges: dict[tuple[int, int], int] = {}
+        # walking edges which also wait at the stop they end at (see _add_edges_next_departures and
+        # contract_wait_chains), the walk arrives at the stop before the end node: e.g., {(3, 7): 6}:
+        # edge 3 -> 7 arrives at the stop of node 7 after a 6-minute walk, then waits for node 7
+        self.walk_arrival_edges: dict[tuple[int, int], float] = {}
+        self._walk_arrival_arrays: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None
+        # dense integer ids of stops (shared with the compiled feed if provided)
+        self.stop_ids: list[str] = []
+        self.stop_idx_map: dict = {}
+        # for each node id: integer stop id and time of the day (-1 for destination nodes)
+        self.node_stop_idx: list[int] = []
+        self.node_tod: list[int] = []
+        # numpy copies of node_stop_idx and node_tod (see get_node_arrays)
+        self._node_arrays: tuple[np.ndarray, np.ndarray] | None = None
+        # time-independent stop graph of min. travel times (see get_stop_graph)
+        self._stop_graph: sp.csr_matrix | None = None
+        self._stop_graph_id: str | None = None
+        # optional ALT preprocessing of the stop graph (see compute_landmarks)
+        self.landmarks: Landmarks | None = None
+        # e.g., {"method": "astar", "nodes_settled": 1234} of the last OD query
+        self.last_search_stats: dict = {}
+        # transposed copy of G for arrive-by searches (built lazily, see get_reversed_graph)
+        self._reversed_G: rx.PyDiGraph | None = None
+        self._reversed_size: tuple[int, int] = (-1, -1)
+
+    def set_stop_ids(self, stop_ids: list[str]) -> None:
+        # use the integer stop ids of a compiled feed (call before adding nodes)
+        self.stop_ids = list(stop_ids)
+        self.stop_idx_map = {sid: i for i, sid in enumerate(self.stop_ids)}
+
+    def get_stop_idx(self, stop_id: str) -> int:
+        if stop_id not in self.stop_idx_map:
+            self.stop_idx_map[stop_id] = len(self.stop_ids)
+            self.stop_ids.append(stop_id)
+        return self.stop_idx_map[stop_id]
+
+    def encode_stops(self, stop_ids) -> np.ndarray:
+        # integer stop ids (-1 for stops not in the graph)
+        return encode_ids(np.asarray(stop_ids).astype(str), self.stop_idx_map).astype("int64")
+
+    def get_node_arrays(self) -> tuple[np.ndarray, np.ndarray]:
+        # node id -> integer stop id and time of the day (-1 for nodes not registered),
+        # extended with the nodes registered since the last call (see _register_node)
+        num_cached = 0 if self._node_arrays is None else len(self._node_arrays[0])
+        if self._node_arrays is None or num_cached < len(self.node_stop_idx):
+            new_arrays = (
+                np.asarray(self.node_stop_idx[num_cached:], dtype="int64"),
+                np.asarray(self.node_tod[num_cached:], dtype="int64"),
+            )
+            if self._node_arrays is None:
+                self._node_arrays = new_arrays
+            else:
+                self._node_arrays = tuple(
+                    np.concatenate([old, new]) for old, new in zip(self._node_arrays, new_arrays)
+                )
+        return self._node_arrays
+
+    def get_walk_arrival_arrays(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # walk_arrival_edges as arrays: start nodes, end nodes and walking times
+        if self._walk_arrival_arrays is None:
+            keys = list(self.walk_arrival_edges.keys())
+            self._walk_arrival_arrays = (
+                np.asarray([u for u, __ in keys], dtype="int64"),
+                np.asarray([v for __, v in keys], dtype="int64"),
+                np.asarray(list(self.walk_arrival_edges.values()), dtype="float64"),
+            )
+        return self._walk_arrival_arrays
+
+    def reduce_costs_by_stop(
+            self,
+            res_costs: dict,
+            walk_arrivals: bool = True,
+            access: tuple[list[str], np.ndarray] | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+            Min. cost over the time nodes of each stop (i.e., the earliest arrival of a
+            one-to-all search, or the time needed of an arrive-by search), as dense arrays
+            indexed by integer stop id: costs (inf if not reached) and the node with
+            the min. cost (-1 if not reached). Destination and temporary nodes are skipped.
+            For the results of forward searches (walk_arrivals), walks arrive at a stop
+            before their end node (see walk_arrival_edges, the end node is given), and
+            the access stops of the search (see get_origin_access) at their walking time
+            (no node is given), instead of the next node of the stops.
+        """
+        node_ids = np.fromiter(res_costs.keys(), dtype="int64", count=len(res_costs))
+        costs = np.fromiter(res_costs.values(), dtype="float64", count=len(res_costs))
+        return self.reduce_node_costs_by_stop(node_ids, costs, walk_arrivals, access)
+
+    def reduce_node_costs_by_stop(
+            self,
+            node_ids: np.ndarray,
+            costs: np.ndarray,
+            walk_arrivals: bool = True,
+            access: tuple[list[str], np.ndarray] | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        # reduce_costs_by_stop of the results as arrays (e.g., SearchWorkspace.get_reached_arrays)
+        node_stop_idx, node_tod = self.get_node_arrays()
+        keep = node_ids < len(node_stop_idx)
+        node_ids, costs = node_ids[keep], costs[keep]
+        keep = (node_stop_idx[node_ids] >= 0) & (node_tod[node_ids] >= 0)
+        node_ids, costs = node_ids[keep], costs[keep]
+        if walk_arrivals and len(self.walk_arrival_edges) > 0:
+            walk_from, walk_to, walk_ts = self.get_walk_arrival_arrays()
+            node_costs = np.full(len(node_stop_idx), np.inf)
+            node_costs[node_ids] = costs
+            arrive_costs = node_costs[walk_from] + walk_ts
+            reached = np.isfinite(arrive_costs)
+            node_ids = np.concatenate([node_ids, walk_to[reached]])
+            costs = np.concatenate([costs, arrive_costs[reached]])
+        stop_idxs = node_stop_idx[node_ids]
+
+        stop_costs = np.full(len(self.stop_ids), np.inf)
+        np.minimum.at(stop_costs, stop_idxs, costs)
+        stop_nodes = np.full(len(self.stop_ids), -1, dtype="int64")
+        is_min = costs == stop_costs[stop_idxs]
+        stop_nodes[stop_idxs[is_min]] = node_ids[is_min]
+        if walk_arrivals and access is not None:
+            access_idxs, access_walk_ts = self.encode_stops(access[0]), np.asarray(access[1], dtype="float64")
+            is_min = (access_idxs >= 0) & (access_walk_ts < stop_costs[access_idxs])
+            stop_costs[access_idxs[is_min]] = access_walk_ts[is_min]
+            stop_nodes[access_idxs[is_min]] = -1
+        return stop_costs, stop_nodes
+
+    def _register_node(self, node_id: int, stop_id: str, tod: int) -> None:
+        if node_id >= len(self.node_stop_idx):
+            num_new = node_id + 1 - len(self.node_stop_idx)
+            self.node_stop_idx += [-1] * num_new
+            self.node_tod += [-1] * num_new
+        self.node_stop_idx[node_id] = self.get_stop_idx(stop_id)
+        self.node_tod[node_id] = tod
+        # keep the cached arrays in sync for node ids which are reused
+        if self._node_arrays is not None and node_id < len(self._node_arrays[0]):
+            self._node_arrays[0][node_id] = self.node_stop_idx[node_id]
+            self._node_arrays[1][node_id] = tod
+
+    def bucket_tod(self, tod: float, round_up: bool = False) -> int:
+        """
+            Time node of an event (truncated to whole minutes by default): with a coarser resolution r,
+            departures are rounded down to the start of their time bucket and arrivals up
+            to its end (round_up), so a ride never costs less than its real time. Trips
+            start from their first stop rounded down and continue from each arrival
+            (see graph_pipeline), walking times are rounded up to multiples of r
+            (see round_up_times) and costs are the differences of the time nodes.
+            Error bound: the arrival of a path is never earlier than the real arrival of
+            its rides and walks, and less than r later, plus up to r for each walk, as long
+            as its connections hold. Connections within one time bucket are assumed to hold
+            (a transfer may be up to r minutes too tight), and a departure rounded down may
+            be missed by a path arriving in the same bucket (the next one is taken).
+        """
+        if round_up:
+            return math.ceil(tod / self.time_resolution) * self.time_resolution
+        return int(tod) // self.time_resolution * self.time_resolution
+
+    def round_up_times(self, ts: np.ndarray) -> np.ndarray:
+        # durations (e.g., walking times) rounded up to the time resolution (kept at 1 minute)
+        if self.time_resolution == 1:
+            return ts
+        return np.ceil(np.asarray(ts) / self.time_resolution) * self.time_resolution
+
+    def _check_not_frozen(self, action: str) -> None:
+        if self.frozen:
+            raise ValueError(f"the graph is frozen (read-only), cannot {action}...")
+
+    def has_stop_nodes(self, stop_id: str) -> bool:
+        if self.frozen:
+            stop_idx = self.stop_idx_map.get(stop_id, -1)
+            return 0 <= stop_idx < len(self._stop_node_offsets) - 1 and \
+                self._stop_node_offsets[stop_idx + 1] > self._stop_node_offsets[stop_idx]
+        return stop_id in self.nodes_time_map
+
+    def get_served_stop_ids(self) -> list[str]:
+        # stops with at least one time node
+        if self.frozen:
+            counts = np.diff(self._stop_node_offsets)
+            return [self.stop_ids[i] for i in np.flatnonzero(counts > 0)]
+        return list(self.nodes_time_map.keys())
+
+    def get_stop_tods(self, stop_id: str) -> SortedSet | np.ndarray:
+        # sorted times of the nodes of a stop (empty if none)
+        if not self.frozen:
+            return self.nodes_time_map.get(stop_id, SortedSet())
+        if not self.has_stop_nodes(stop_id):
+            return self._stop_node_tods[:0]
+        stop_idx = self.stop_idx_map[stop_id]
+        return self._stop_node_tods[self._stop_node_offsets[stop_idx]:self._stop_node_offsets[stop_idx + 1]]
+
+    def get_stop_nodes(
+            self, stop_id: str, min_tod: float = float('-inf'), max_tod: float = float('inf')
+    ) -> tuple[list[int], list[int]]:
+        # (times, node ids) of the nodes of a stop with min_tod <= time <= max_tod, in time order
+        ts = self.get_stop_tods(stop_id)
+        lo, hi = bisect.bisect_left(ts, min_tod), bisect.bisect_right(ts, max_tod)
+        tods = [int(tod) for tod in ts[lo:hi]]
+        if self.frozen:
+            offset = int(self._stop_node_offsets[self.stop_idx_map[stop_id]])
+            return tods, list(range(offset + lo, offset + hi))
+        return tods, [self.nodes_name_map[f"{stop_id}_{tod:.0f}"] for tod in tods]
+
+    def get_node_id(self, stop_id: str, tod: float) -> int | None:
+        # id of the node of the stop at exactly tod (None if there is no such node)
+        if not self.frozen:
+            return self.nodes_name_map.get(f"{stop_id}_{tod:.0f}")
+        __, node_ids = self.get_stop_nodes(stop_id, tod, tod)
+        return node_ids[0] if len(node_ids) > 0 else None
+
+    def find_next_node(self, stop_id: str, time_min: float) -> tuple[int, int] | None:
+        # (time, node id) of the first node of the stop at or after time_min
+        ts = self.get_stop_tods(stop_id)
+        idx = bisect.bisect_left(ts, time_min)
+        if idx == len(ts):
+            return None
+        return int(ts[idx]), self.get_node_id(stop_id, ts[idx])
+
+    def find_prev_node(self, stop_id: str, time_min: float) -> tuple[int, int] | None:
+        # (time, node id) of the last node of the stop at or before time_min
+        ts = self.get_stop_tods(stop_id)
+        idx = bisect.bisect_right(ts, time_min)
+        if idx == 0:
+            return None
+        return int(ts[idx - 1]), self.get_node_id(stop_id, ts[idx - 1])
+
+    def freeze(self) -> None:
+        """
+            Renumber the nodes by (stop, time) and make the graph read-only: the nodes
+            of a stop get consecutive ids in time order, so a search scanning the waits
+            of a stop reads neighbouring memory, and the per-stop offset and time arrays
+            (searched with bisect) replace nodes_time_map and nodes_name_map.
+            Nodes of no stop (e.g., "_D" destination nodes) are numbered last.
+            Queries add and remove temporary nodes only, any other change raises.
+        """
+        if self.frozen:
+            return
+        old_ids = np.asarray(self.G.node_indices(), dtype="int64")
+        num_ids = int(old_ids.max()) + 1 if len(old_ids) > 0 else 0
+        # stop and time of all node ids (-1 for nodes never registered)
+        stops, tods = np.full(num_ids, -1, dtype="int64"), np.full(num_ids, -1, dtype="int64")
+        node_stop_idx, node_tod = self.get_node_arrays()
+        num_known = min(num_ids, len(node_stop_idx))
+        stops[:num_known], tods[:num_known] = node_stop_idx[:num_known], node_tod[:num_known]
+        stops, tods = stops[old_ids], tods[old_ids]
+        no_stop = (stops < 0) | (tods < 0)
+        order = np.lexsort((tods, np.where(no_stop, len(self.stop_ids), stops)))
+        old_ids, stops, tods, no_stop = old_ids[order], stops[order], tods[order], no_stop[order]
+        new_ids = np.full(num_ids, -1, dtype="int64")
+        new_ids[old_ids] = np.arange(len(old_ids))
+
+        G = rx.PyDiGraph()
+        G.add_nodes_from([self.G[v] for v in old_ids.tolist()])
+        edges = sorted(
+            ((int(new_ids[a]), int(new_ids[b]), e) for a, b, e in self.G.weighted_edge_list()),
+            key=lambda x: x[0],
+        )
+        # new payloads with the new ids (the old ones may still be referenced, e.g., by edge lists)
+        edges = [(a, b, self._renumber_edge(e, a, b)) for a, b, e in edges]
+        G.add_edges_from(edges)
+        self.G = G
+
+        num_stop_nodes = len(old_ids) - int(no_stop.sum())
+        self._stop_node_offsets = np.searchsorted(stops[:num_stop_nodes], np.arange(len(self.stop_ids) + 1))
+        self._stop_node_tods = tods[:num_stop_nodes].copy()
+        self.node_stop_idx, self.node_tod = stops.tolist(), tods.tolist()
+        self.contracted_edges = {
+            (int(new_ids[u]), int(new_ids[w])): tod for (u, w), tod in self.contracted_edges.items()
+        }
+        self.walk_arrival_edges = {
+            (int(new_ids[u]), int(new_ids[w])): walk_t for (u, w), walk_t in self.walk_arrival_edges.items()
+        }
+        self._walk_arrival_arrays = None
+        self.nodes_name_map, self.nodes_time_map = None, None
+        self._node_arrays, self._reversed_G = None, None
+        self.frozen = True
+
+    @staticmethod
+    def _renumber_edge(e: GTFSEdge, start_node: int, end_node: int) -> GTFSEdge:
+        if not isinstance(e, GTFSEdge):
+            return e
+        e = copy.copy(e)
+        e.start_node, e.end_node = start_node, end_node
+        return e
 
     def query_node_or_create(self, stop_id: str, tod: float) -> int:
-        tod = int(tod)
+        tod = self.bucket_tod(tod)
+        if self.frozen:
+            node_id = self.get_node_id(stop_id, tod)
+            if node_id is None:
+                self._check_not_frozen(f"create the node {stop_id}_{tod:.0f}")
+            return node_id
         node_name = f"{stop_id}_{tod:.0f}"
         # if a node is in the network, just return the node id...
         if node_name in self.nodes_name_map:
@@ -167,6 +741,7 @@ class GTFSGraph:
         # otherwise, create the new node...
         node_id = self.G.add_node(GTFSNode(stop_id, tod))
         self.nodes_name_map[node_name] = node_id
+        self._register_node(node_id, stop_id, tod)
 
         if stop_id in self.nodes_time_map:
             self.nodes_time_map[stop_id].add(tod)
@@ -179,7 +754,14 @@ class GTFSGraph:
             stop_dict: dict,  # dictionary of one stop id
             times_info: list[int],  # a list of time integers (minute of the day...)
     ) -> None:
+        self._check_not_frozen("add nodes")
         stop_id = stop_dict["stop_id"]
+        times_info = sorted(set(self.bucket_tod(tod) for tod in times_info))
+        # the stop already has nodes (e.g., trips added first), merge times into it
+        if stop_id in self.nodes_time_map:
+            for tod in times_info:
+                self.query_node_or_create(stop_id=stop_id, tod=tod)
+            return
         nodes = [
             GTFSNode(stop_id, tod)
             for i, tod in enumerate(times_info)
@@ -188,6 +770,7 @@ class GTFSGraph:
 
         for n, nid in zip(nodes, node_ids):
             self.nodes_name_map[n.name] = nid
+            self._register_node(nid, stop_id, n.tod)
         # record information for the stop id...
         self.nodes_time_map[stop_id] = SortedSet(times_info)
 
@@ -202,11 +785,49 @@ class GTFSGraph:
         """
         # don't care anything about creating/maintaining nodes here...
         # assume both end nodes are created before...
+        self._check_not_frozen("add edges")
         if properties is None:
             properties = {}
         self.G.add_edge(node_a, node_b, properties)
+        self._check_stop_graph_edge(node_a, node_b, properties)
+
+    def add_edges(self, edges: list[GTFSEdge]) -> None:
+        # batch version of add_edge, between the start_node and end_node of each edge
+        self._check_not_frozen("add edges")
+        self.G.add_edges_from([(e.start_node, e.end_node, e) for e in edges])
+        if self._stop_graph is not None:
+            for e in edges:
+                self._check_stop_graph_edge(e.start_node, e.end_node, e)
+
+    def _check_stop_graph_edge(self, node_a: int, node_b: int, properties: dict | GTFSEdge) -> None:
+        # a new trip or walk between two stops may be faster than the stop graph
+        if self._stop_graph is not None and getattr(properties, "mode", None) in (EdgeMode.TRIP, EdgeMode.WALK):
+            if self._is_stop_node(node_a) and self._is_stop_node(node_b):
+                self._update_stop_graph(
+                    self.node_stop_idx[node_a], self.node_stop_idx[node_b], properties.trip_t + properties.walk_t
+                )
+
+    def _is_stop_node(self, node_id: int) -> bool:
+        return node_id < len(self.node_stop_idx) and self.node_stop_idx[node_id] >= 0
+
+    def _update_stop_graph(self, stop_a: int, stop_b: int, cost: float) -> None:
+        # drop the stop graph (and the landmarks computed on it) if the edge is faster
+        if stop_a == stop_b:
+            return
+        if max(stop_a, stop_b) >= self._stop_graph.shape[0]:  # a stop added after the stop graph
+            self._stop_graph, self.landmarks = None, None
+            return
+        row = slice(self._stop_graph.indptr[stop_a], self._stop_graph.indptr[stop_a + 1])
+        costs = self._stop_graph.data[row][self._stop_graph.indices[row] == stop_b]
+        if len(costs) > 0 and costs[0] <= cost:
+            return
+        self._stop_graph = None
+        if self.landmarks is not None:
+            print("warning: a faster edge between stops is added, landmarks are dropped...")
+            self.landmarks = None
 
     def add_edges_within_same_stops(self):
+        self._check_not_frozen("add edges")
         for stop_id in self.nodes_time_map:
             ts = self.nodes_time_map[stop_id]
             for i in range(len(ts) - 1):
@@ -226,10 +847,82 @@ class GTFSGraph:
                     )
                 )
 
+    def contract_wait_chains(self) -> tuple[int, int]:
+        """
+            Contract the time nodes only passed through by waiting: a node whose only
+            outgoing edge is a wait and that no trip arrives at (e.g., a walking arrival
+            or a skeleton time) is removed, and each incoming edge u -> v is replaced by
+            u -> w (the next node kept at the stop) with the waits from v to w added.
+            Path costs are unchanged (see expand_path for the nodes waited through), and
+            the walks replaced still arrive at the stop before w (see walk_arrival_edges).
+            Returns the number of nodes and edges removed.
+        """
+        self._check_not_frozen("contract nodes")
+        num_nodes, num_edges = self.G.num_nodes(), self.G.num_edges()
+        for stop_id in list(self.nodes_time_map.keys()):
+            tods = list(self.nodes_time_map[stop_id])
+            nodes = [self.nodes_name_map[f"{stop_id}_{tod:.0f}"] for tod in tods]
+            out_edges = [self.G.out_edges(v) for v in nodes]
+            in_edges = [self.G.in_edges(v) for v in nodes]
+            contracted = [
+                i < len(nodes) - 1
+                and len(out_edges[i]) == 1 and out_edges[i][0][2].mode == EdgeMode.WAIT
+                and all(e.mode in (EdgeMode.WAIT, EdgeMode.WALK) for __, __, e in in_edges[i])
+                for i in range(len(nodes))
+            ]
+            if not any(contracted):
+                continue
+            # backwards in time: waits from each contracted node to the next node kept (w)
+            w, wait_t = None, 0
+            for i in reversed(range(len(nodes))):
+                if not contracted[i]:
+                    w, wait_t = nodes[i], 0
+                    continue
+                wait_t += out_edges[i][0][2].wait_t
+                for u, __, e in in_edges[i]:
+                    if i > 0 and u == nodes[i - 1] and contracted[i - 1]:
+                        continue  # the previous node is contracted too (its in-edges go to w)
+                    self.add_edge(
+                        node_a=u, node_b=w,
+                        properties=GTFSEdge(
+                            start_node=u, end_node=w,
+                            trip_t=e.trip_t, wait_t=e.wait_t + wait_t, walk_t=e.walk_t,
+                            mode=e.mode
+                        )
+                    )
+                    self.contracted_edges[(u, w)] = self.contracted_edges.pop((u, nodes[i]), tods[i])
+                    if e.mode == EdgeMode.WALK:  # the walk now waits at the stop (see walk_arrival_edges)
+                        self.walk_arrival_edges[(u, w)] = self.walk_arrival_edges.pop((u, nodes[i]), e.walk_t)
+            for i in np.flatnonzero(contracted).tolist():
+                self.G.remove_node(nodes[i])
+                del self.nodes_name_map[f"{stop_id}_{tods[i]:.0f}"]
+                self.nodes_time_map[stop_id].discard(tods[i])
+                self.contracted_tods.setdefault(stop_id, SortedSet()).add(tods[i])
+                self.node_stop_idx[nodes[i]], self.node_tod[nodes[i]] = -1, -1
+        # node ids were freed: rebuild the cached copies
+        self._node_arrays, self._reversed_G, self._walk_arrival_arrays = None, None, None
+        num_removed = (num_nodes - self.G.num_nodes(), num_edges - self.G.num_edges())
+        print("wait chains contracted, nodes/edges removed:", num_removed)
+        return num_removed
+
+    def expand_path(self, path_nodes: list[int]) -> list[str]:
+        # node names of a path, with the nodes removed by contract_wait_chains
+        names = [self.G[path_nodes[0]].name] if len(path_nodes) > 0 else []
+        for u, w in zip(path_nodes[:-1], path_nodes[1:]):
+            node_w = self.G[w]
+            if (u, w) in self.contracted_edges:
+                tods = self.contracted_tods[node_w.stop_id].irange(self.contracted_edges[(u, w)], node_w.tod - 1)
+                names += [f"{node_w.stop_id}_{tod:.0f}" for tod in tods]
+            names.append(node_w.name)
+        return names
+
     def add_hyper_nodes(self):
         """
-            Add source node and destination node
+            Add a destination node per stop ("{stop_id}_D"), reached from all time nodes
+            of the stop. Not needed by the searches, which stop at the stops themselves
+            (see DijkstraCustomVisitor.target_stops), so networks are built without them.
         """
+        self._check_not_frozen("add nodes")
         stops = self.nodes_time_map.keys()
         # for each stop, add destination hyper nodes
         dest_nodes = [
@@ -240,6 +933,7 @@ class GTFSGraph:
         dest_node_ids = self.G.add_nodes_from(dest_nodes)
         for n, nid in zip(dest_nodes, dest_node_ids):
             self.nodes_name_map[n.name] = nid
+            self._register_node(nid, n.stop_id, -1)
 
         # connect all stops nodes over the day to the destination node of the stop...
         for dest_node_id, stop_id in zip(dest_node_ids, stops):
@@ -261,38 +955,57 @@ class GTFSGraph:
             self,
             orig_node_ids: list[int],
             dest_node_ids: list[int] | None,
-            cutoff: float
+            cutoff: float,
+            graph: rx.PyDiGraph | None = None,  # e.g., the reversed graph (default: G)
+            workspace: SearchWorkspace | None = None,  # reused search state (see SearchWorkspace)
+            **visitor_kwargs,
     ):
+        if workspace is not None:
+            # node ids beyond the registered nodes are temporary sources
+            workspace.start(orig_node_ids, len(self.node_stop_idx))
         visitor = DijkstraCustomVisitor(
             source_vs=orig_node_ids,
             target_vs=dest_node_ids,
             cutoff=cutoff,
+            node_stops=self.node_stop_idx,
+            walk_arrival_edges=self.walk_arrival_edges,
+            workspace=workspace,
+            **visitor_kwargs,
         )
         rx.digraph_dijkstra_search(
-            self.G,
+            self.G if graph is None else graph,
             orig_node_ids,  # source is a list of nodes
             weight_fn=lambda x: x.total_t,
             visitor=visitor
         )
+        visitor.settle_walk_arrival()
         return visitor
 
     def add_edges_walkable_stops(
             self,
-            stops_b: pd.DataFrame,  # index of neighbors?
-            walk_speed: float = 1  # unit is mph
+            stops_b: pd.DataFrame | StopNeighbors,  # neighbors of stops (CSR arrays)
+            walk_speed: float = 1,  # unit is mph
+            transfer_mode: str = "all",  # or "next_departure" (see _add_edges_next_departures)
     ) -> None:
+        self._check_not_frozen("add edges")
+        if isinstance(stops_b, pd.DataFrame):
+            stops_b = StopNeighbors.from_frame(stops_b)
+        self.stop_neighbors = stops_b
+        if transfer_mode == "next_departure":
+            self._add_edges_next_departures(stops_b, walk_speed)
+            return
         # connect between neighboring end nodes (only at skeleton times)
         stop_ids = copy.deepcopy(list(self.nodes_time_map.keys()))
         stop_ids_ts = copy.deepcopy([self.nodes_time_map[stop_id] for stop_id in stop_ids])
 
         for stop_id, ts in zip(stop_ids, stop_ids_ts):
-            # check neighbors in stops_b
-            nei_ids = stops_b.loc[stops_b["stop_id"] == stop_id, 'neighbors'].iloc[0]
-            nei_IDs = stops_b.iloc[nei_ids]["stop_id"]
-            # retrieve distance (in miles)
-            dists = stops_b.loc[stops_b["stop_id"] == stop_id]['dists'].iloc[0]
+            if stop_id not in stops_b.stop_pos_map:
+                continue
+            # check neighbors (stop ids and distances in miles)
+            nei_IDs, dists = stops_b.get_neighbors(stop_id)
+            nei_IDs = nei_IDs.tolist()
             # compute walking time (in minutes) (for each distance)
-            walk_ts = (dists / walk_speed) * 60
+            walk_ts = self.round_up_times((dists / walk_speed) * 60)
 
             # IDEA: a fan of edges to the neighboring stops at transit's drop-off locations
             for i in range(len(ts)):
@@ -314,108 +1027,451 @@ class GTFSGraph:
                             )
                         )
 
+    def _add_edges_next_departures(self, stops_b: StopNeighbors, walk_speed: float) -> None:
+        """
+            Walking edges only to the next departure at each neighboring stop: from each
+            time node, one edge to the first time node of the neighbor after the walk
+            (walk, then wait there). Walks to later departures are dominated by waiting
+            at the neighbor, so (but after the last time node) no node is created for the end of a walk.
+            Same costs as the fan of edges (ending at whole minutes); the edges which wait
+            are kept in walk_arrival_edges, for the arrival at the neighbor before the wait.
+        """
+        stop_ts = {
+            stop_id: np.asarray(list(ts), dtype="int64") for stop_id, ts in self.nodes_time_map.items()
+        }
+        for stop_id, ts in stop_ts.items():
+            if stop_id not in stops_b.stop_pos_map:
+                continue
+            nei_IDs, dists = stops_b.get_neighbors(stop_id)
+            walk_ts = self.round_up_times((dists / walk_speed) * 60)
+            for nei_id, walk_t in zip(nei_IDs.tolist(), walk_ts.tolist()):
+                if nei_id == stop_id or nei_id not in stop_ts:
+                    continue
+                nei_ts = stop_ts[nei_id]
+                walk_min = int(walk_t)  # the walk ends at the time node t + walk_min
+                # the next time node (a new one after the last, e.g., past midnight, like the fan)
+                t_ends = ts + walk_min
+                nxt = np.searchsorted(nei_ts, t_ends, side="left")
+                has_next = nxt < len(nei_ts)
+                t_ends[has_next] = nei_ts[nxt[has_next]]
+                for t0, t1 in zip(ts.tolist(), t_ends.tolist()):
+                    origin_node_index = self.query_node_or_create(stop_id=stop_id, tod=t0)
+                    dest_node_index = self.query_node_or_create(stop_id=nei_id, tod=t1)
+                    self.add_edge(
+                        node_a=origin_node_index, node_b=dest_node_index,
+                        properties=GTFSEdge(
+                            start_node=origin_node_index, end_node=dest_node_index,
+                            trip_t=0, wait_t=t1 - t0 - walk_min, walk_t=max(0.1, walk_t),
+                            mode=EdgeMode.WALK
+                        )
+                    )
+                    if t1 - t0 > walk_min:
+                        self.walk_arrival_edges[(origin_node_index, dest_node_index)] = max(0.1, walk_t)
+        self._walk_arrival_arrays = None
+
     # query the shortest path given origin stop_id and departure time (in minutes)
     # strategy: create a new source node pointing at nearest point
     def query_origin_stop_time(
             self,
-            stops_df: pd.DataFrame,
+            stops_df: pd.DataFrame | None,
             stop_id: str,
             depart_min: float,
             cutoff: float,
             walk_speed: float = 1
     ) -> tuple[dict, dict]:
-        # fetch neighbor information
-        stops_df["stop_id"] = stops_df["stop_id"].astype('string')
-        one_stop_df = stops_df.loc[stops_df["stop_id"] == stop_id, :].iloc[0]
-        nei_idxs = one_stop_df["neighbors"]  # all neighbors index
-        nei_dists = one_stop_df["dists"]  # distance in miles
-        nei_stop_ids = stops_df["stop_id"].iloc[nei_idxs].to_list()
-        nei_wts = np.array(nei_dists) / walk_speed * 60  # walking time (in minutes)
-        depart_mins = depart_min + nei_wts
-
-        # from stop to next arrived vehicle
-        next_mins = np.array([
-            self.find_closest_next_time(nei_stop_id, int(depart_mins[i]))
-            for i, nei_stop_id in enumerate(nei_stop_ids)
-        ])
-
-        # nodes connected to the "major" skeleton network (node c is in the network)
-        nodes_b_ids = [
-            self.query_node_or_create(stop_id=nei_stop_id, tod=int(next_mins[i]))
-            for i, nei_stop_id in enumerate(nei_stop_ids)
+        # one search from a temporary origin node (nothing is added to the graph),
+        # linked to the next node of the stop itself and of its walkable neighbors
+        nei_stop_ids, nei_wts = self.get_origin_access(stop_id=stop_id, walk_speed=walk_speed, stops_df=stops_df)
+        return self.query_origin_access_stops(nei_stop_ids, nei_wts, depart_min, cutoff)
+
+    # query the shortest paths from any coordinates (e.g., a click on the map):
+    # all stops within bw_mile are access stops of one search
+    def query_origin_coords_time(
+            self,
+            lat: float,
+            lon: float,
+            depart_min: float,
+            cutoff: float,
+            bw_mile: float = 0.5,
+            walk_speed: float = 1,  # mph
+    ) -> tuple[dict, dict]:
+        access_stop_ids, access_walk_ts = self.get_origin_access(
+            coords=(lat, lon), bw_mile=bw_mile, walk_speed=walk_speed
+        )
+        return self.query_origin_access_stops(access_stop_ids, access_walk_ts, depart_min, cutoff)
+
+    def get_origin_access(
+            self,
+            stop_id: str | None = None,
+            coords: tuple[float, float] | None = None,
+            bw_mile: float = 0.5,
+            walk_speed: float = 1,  # mph
+            stops_df: pd.DataFrame | None = None,
+    ) -> tuple[list[str], np.ndarray]:
+        # access stops and walking times (in minutes) of a one-to-all search:
+        # the walking neighbors of a stop (from the legacy columns of stops_df if given),
+        # or all stops within bw_mile of the coordinates
+        if coords is not None:
+            return self.get_access_stops(coords=[coords], bw_mile=bw_mile, walk_speed=walk_speed)[0]
+        if stops_df is not None and "neighbors" in stops_df.columns:
+            stop_neighbors = StopNeighbors.from_frame(stops_df)
+        else:
+            stop_neighbors = self.stop_neighbors
+        nei_stop_ids, nei_dists = stop_neighbors.get_neighbors(stop_id)  # distance in miles
+        return nei_stop_ids.tolist(), np.array(nei_dists) / walk_speed * 60
+
+    def query_origin_access_stops(
+            self,
+            access_stop_ids: list[str],
+            access_walk_ts: np.ndarray,  # walking time (in minutes) to each access stop
+            depart_min: float,
+            cutoff: float,
+            return_paths: bool = True,  # False: only costs (paths are left empty)
+            workspace: SearchWorkspace | None = None,  # e.g., one per worker of a batch job
+    ) -> tuple[dict, dict]:
+        """
+            One search seeded at every access stop with its own initial cost
+            (walk + wait for the next node), through a temporary origin node
+            which is removed after the search. The origin node is not in the results.
+        """
+        visitor, origin_nid = self._search_from_access_stops(
+            access_stop_ids, access_walk_ts, depart_min, cutoff, workspace=workspace
+        )
+        if not return_paths:
+            res_costs = {v: c for v, c in visitor.get_reached_costs().items() if v != origin_nid}
+            return {}, res_costs
+        res_paths, res_costs = visitor.get_all_final_paths_from_sources()
+        res_paths = {v: pth[1:] for v, pth in res_paths.items() if v != origin_nid}
+        res_costs = {v: c for v, c in res_costs.items() if v != origin_nid}
+        return res_paths, res_costs
+
+    def query_origin_stop_costs(
+            self,
+            access_stop_ids: list[str],
+            access_walk_ts: np.ndarray,
+            depart_min: float,
+            cutoff: float,
+            workspace: SearchWorkspace | None = None,
+    ) -> np.ndarray:
+        """
+            Earliest arrival (minutes after depart_min) at each stop by integer stop id,
+            inf if not reached within the cutoff: the search of query_origin_access_stops,
+            read from its arrays (no dict of the reached nodes is built with a workspace)
+        """
+        visitor, __ = self._search_from_access_stops(
+            access_stop_ids, access_walk_ts, depart_min, cutoff, workspace=workspace
+        )
+        node_ids, costs = visitor.get_reached_arrays()
+        stop_costs, __ = self.reduce_node_costs_by_stop(
+            node_ids, costs, access=(access_stop_ids, access_walk_ts)
+        )
+        stop_costs[stop_costs > cutoff] = np.inf
+        return stop_costs
+
+    def get_access_stops(
+            self,
+            stop_ids: list[str] | None = None,
+            coords: list[tuple[float, float]] | None = None,
+            bw_mile: float = 0.5,
+            walk_speed: float = 1,  # mph
+    ) -> list[tuple[list[str], np.ndarray]]:
+        # (stop ids, walking times) for each place: a stop is its own access stop,
+        # coordinates are walkable to all stops within bw_mile
+        if coords is None:
+            return [([sid], np.zeros(1)) for sid in stop_ids]
+        if self.stop_index is None:
+            raise ValueError("no spatial index of stops, build the network first...")
+        lats, lons = zip(*coords)
+        matches = self.stop_index.query_radius(lats, lons, bw_mile=bw_mile, walk_speed=walk_speed)
+        return [
+            (matches.get(i)[0].tolist(), matches.get(i)[1])
+            for i in range(len(coords))
         ]
 
-        # process source info (add source node if it doesn't exist...)
-        the_origin_nid = self.query_node_or_create(stop_id=stop_id, tod=int(depart_min))
+    def query_od_matrix(
+            self,
+            depart_min: float,
+            cutoff: float,
+            orig_stop_ids: list[str] | None = None,
+            dest_stop_ids: list[str] | None = None,
+            orig_coords: list[tuple[float, float]] | None = None,
+            dest_coords: list[tuple[float, float]] | None = None,
+            bw_mile: float = 0.5,  # access/egress radius for coordinates
+            walk_speed: float = 1,  # mph
+            max_workers: int | None = None,
+    ) -> ODMatrix:
+        """
+            One bounded one-to-many search per origin (in a process pool),
+            each stopping once every destination is settled or at the cutoff
+        """
+        origins = self.get_access_stops(orig_stop_ids, orig_coords, bw_mile, walk_speed)
+        dests = self.get_access_stops(dest_stop_ids, dest_coords, bw_mile, walk_speed)
+        state = {"graph": self, "dests": dests, "depart_min": depart_min, "cutoff": cutoff}
+        rows = parallel_map(_od_matrix_task, origins, state=state, max_workers=max_workers)
+        mat = np.stack(rows, axis=1) if len(rows) > 0 else np.zeros((4, 0, len(dests)))
+        return ODMatrix(total=mat[0], transit=mat[1], wait=mat[2], walk=mat[3])
 
-        # add all edges to neighboring nodes...
-        # print("the stop id:", stop_id, the_origin_nid)
-        journey_mins = next_mins - depart_mins
-        for i, node_b_id in enumerate(nodes_b_ids):
-            sid = nei_stop_ids[i]
+    def query_one_to_many(
+            self,
+            access_stop_ids: list[str],
+            access_walk_ts: np.ndarray,
+            dests: list[tuple[list[str], np.ndarray]],  # egress stops and walking times
+            depart_min: float,
+            cutoff: float,
+            workspace: SearchWorkspace | None = None,
+    ) -> np.ndarray:
+        # (total, transit, wait, walk) x destinations, NaN if not reached
+        dest_stops = {
+            sid: self.stop_idx_map[sid]
+            for egress_stop_ids, __ in dests for sid in egress_stop_ids
+            if self.has_stop_nodes(sid)
+        }
+        visitor, __ = self._search_from_access_stops(
+            access_stop_ids, access_walk_ts, depart_min, cutoff,
+            all_target_stops=set(dest_stops.values()), track_modes=True, workspace=workspace,
+        )
+        # the access stops are reached by walking (not at their next node)
+        access_ts = {sid: float(walk_t) for sid, walk_t in zip(access_stop_ids, access_walk_ts)}
+        res = np.full((4, len(dests)), np.nan)
+        for j, (egress_stop_ids, egress_walk_ts) in enumerate(dests):
+            for sid, egress_t in zip(egress_stop_ids, egress_walk_ts):
+                if sid in access_ts:
+                    total = access_ts[sid] + egress_t
+                    if total <= cutoff and total < np.nan_to_num(res[0, j], nan=np.inf):
+                        res[:, j] = (total, 0, 0, total)
+                # arrival at the stop: the first time node settled, or a walk before it
+                arrival = visitor.stop_arrivals.get(dest_stops.get(sid))
+                if arrival is None:
+                    continue
+                cost, node, walk_to = arrival
+                total = cost + egress_t
+                if total > cutoff or total >= np.nan_to_num(res[0, j], nan=np.inf):
+                    continue
+                trip_t, wait_t, walk_t = visitor.mode_costs[node]
+                if walk_to is not None:  # the walk from the node
+                    walk_t += cost - visitor.all_costs[node]
+                res[:, j] = (total, trip_t, wait_t, walk_t + egress_t)
+        return res
 
-            journey_t = max(0.1, round(journey_mins[i]))
-            if stop_id != sid:
-                self.add_edge(
-                    node_a=the_origin_nid, node_b=node_b_id,
-                    properties=GTFSEdge(
-                        start_node=the_origin_nid, end_node=node_b_id,
-                        trip_t=0, wait_t=0, walk_t=journey_t,
+    def _search_from_access_stops(
+            self,
+            access_stop_ids: list[str],
+            access_walk_ts: np.ndarray,
+            depart_min: float,
+            cutoff: float,
+            **visitor_kwargs,
+    ) -> tuple[DijkstraCustomVisitor, int]:
+        # returns the finished visitor and the (already removed) temporary origin node id
+        access_links = self._get_access_links(access_stop_ids, access_walk_ts, depart_min)
+        origin_nid = self.G.add_node(GTFSNode("__origin__", depart_min))
+        try:
+            for sid, next_min, walk_t, wait_t in access_links:
+                node_b_id = self.get_node_id(sid, next_min)
+                # temporary edge: added to G directly (also when the graph is frozen)
+                self.G.add_edge(
+                    origin_nid, node_b_id,
+                    GTFSEdge(
+                        start_node=origin_nid, end_node=node_b_id,
+                        trip_t=0, wait_t=wait_t, walk_t=walk_t,
                         mode=EdgeMode.WALK
                     )
                 )
-            else:  # both edges belong to the same bus stop
-                self.add_edge(
-                    node_a=the_origin_nid, node_b=node_b_id,
-                    properties=GTFSEdge(
-                        start_node=the_origin_nid, end_node=node_b_id,
-                        trip_t=0, wait_t=journey_t, walk_t=0,
-                        mode=EdgeMode.WAIT
-                    )
-                )
+            visitor = self._dijkstra_search_worker(
+                orig_node_ids=[origin_nid],
+                dest_node_ids=None,
+                cutoff=cutoff,
+                **visitor_kwargs,
+            )
+        finally:
+            self.G.remove_node(origin_nid)
+        return visitor, origin_nid
+
+    def _get_access_links(
+            self,
+            access_stop_ids: list[str],
+            access_walk_ts: np.ndarray,
+            depart_min: float,
+    ) -> list[tuple[str, int, float, float]]:
+        # (stop id, time of the next node, walking time, waiting time) for each access stop,
+        # stops without any node after the arrival are skipped
+        access_links = []
+        for sid, walk_t in zip(access_stop_ids, access_walk_ts):
+            arrive_min = depart_min + walk_t
+            next_node = self.find_next_node(sid, arrive_min)
+            if next_node is None:
+                continue
+            access_links.append((sid, next_node[0], float(walk_t), float(next_node[0] - arrive_min)))
+        return access_links
+
+    def get_reversed_graph(self) -> rx.PyDiGraph:
+        # G with all edges reversed (same node ids and edge data),
+        # rebuilt whenever nodes or edges were added to G since the last copy
+        size = (self.G.num_nodes(), self.G.num_edges())
+        if self._reversed_G is None or self._reversed_size != size:
+            self._reversed_G = self.G.copy()
+            self._reversed_G.reverse()
+            self._reversed_size = size
+        return self._reversed_G
+
+    # arrive-by queries: where can one come from to arrive at the stop by arrive_min
+    def query_dest_stop_time(
+            self,
+            stop_id: str,
+            arrive_min: float,
+            cutoff: float,
+            return_paths: bool = True,
+    ) -> tuple[dict, dict]:
+        return self.query_dest_egress_stops([stop_id], np.zeros(1), arrive_min, cutoff, return_paths)
+
+    def query_dest_coords_time(
+            self,
+            lat: float,
+            lon: float,
+            arrive_min: float,
+            cutoff: float,
+            bw_mile: float = 0.5,
+            walk_speed: float = 1,  # mph
+            return_paths: bool = True,
+    ) -> tuple[dict, dict]:
+        if self.stop_index is None:
+            raise ValueError("no spatial index of stops, build the network first...")
+        matches = self.stop_index.query_radius([lat], [lon], bw_mile=bw_mile, walk_speed=walk_speed)
+        egress_stop_ids, egress_walk_ts = matches.get(0)
+        return self.query_dest_egress_stops(
+            egress_stop_ids.tolist(), egress_walk_ts, arrive_min, cutoff, return_paths
+        )
 
-        visitor = self._dijkstra_search_worker(
-            orig_node_ids=[the_origin_nid],
-            dest_node_ids=None,
-            cutoff=cutoff
+    def query_dest_egress_stops(
+            self,
+            egress_stop_ids: list[str],
+            egress_walk_ts: np.ndarray,  # walking time (in minutes) from each egress stop
+            arrive_min: float,
+            cutoff: float,
+            return_paths: bool = True,  # False: only costs (paths are left empty)
+            workspace: SearchWorkspace | None = None,
+    ) -> tuple[dict, dict]:
+        """
+            One backward search on the reversed graph, seeded at the latest node of
+            every egress stop which still arrives at the destination by arrive_min.
+            The cost of a node is the time from it to the arrival (so the latest
+            departure from the node is arrive_min - cost). Paths are listed in travel
+            order and the temporary destination node is not in the results.
+        """
+        visitor, dest_nid = self._search_from_egress_stops(
+            egress_stop_ids, egress_walk_ts, arrive_min, cutoff, workspace=workspace
         )
-        # this function should return all paths for all visited nodes...
+        if not return_paths:
+            res_costs = {v: c for v, c in visitor.get_reached_costs().items() if v != dest_nid}
+            return {}, res_costs
         res_paths, res_costs = visitor.get_all_final_paths_from_sources()
+        res_paths = {v: pth[:0:-1] for v, pth in res_paths.items() if v != dest_nid}
+        res_costs = {v: c for v, c in res_costs.items() if v != dest_nid}
         return res_paths, res_costs
 
+    def get_latest_departures(self, res_costs: dict, arrive_min: float) -> dict[str, float]:
+        # latest departure (minute of the day) from each stop reached by an arrive-by search
+        # (a walk waits at its end, before the arrival of the backward search)
+        stop_costs, __ = self.reduce_costs_by_stop(res_costs, walk_arrivals=False)
+        reached = np.flatnonzero(np.isfinite(stop_costs))
+        return {self.stop_ids[i]: arrive_min - stop_costs[i] for i in reached}
+
+    def _search_from_egress_stops(
+            self,
+            egress_stop_ids: list[str],
+            egress_walk_ts: np.ndarray,
+            arrive_min: float,
+            cutoff: float,
+            **visitor_kwargs,
+    ) -> tuple[DijkstraCustomVisitor, int]:
+        # mirror of _search_from_access_stops on the reversed graph
+        G_rev = self.get_reversed_graph()
+        egress_links = self._get_egress_links(egress_stop_ids, egress_walk_ts, arrive_min)
+        dest_nid = G_rev.add_node(GTFSNode("__destination__", arrive_min))
+        try:
+            for sid, prev_min, walk_t, wait_t in egress_links:
+                node_a_id = self.get_node_id(sid, prev_min)
+                # forward direction: from the stop node to the destination
+                G_rev.add_edge(
+                    dest_nid, node_a_id,
+                    GTFSEdge(
+                        start_node=node_a_id, end_node=dest_nid,
+                        trip_t=0, wait_t=wait_t, walk_t=walk_t,
+                        mode=EdgeMode.WALK
+                    )
+                )
+            visitor = self._dijkstra_search_worker(
+                orig_node_ids=[dest_nid],
+                dest_node_ids=None,
+                cutoff=cutoff,
+                graph=G_rev,
+                **visitor_kwargs,
+            )
+        finally:
+            G_rev.remove_node(dest_nid)
+        return visitor, dest_nid
+
+    def _get_egress_links(
+            self,
+            egress_stop_ids: list[str],
+            egress_walk_ts: np.ndarray,
+            arrive_min: float,
+    ) -> list[tuple[str, int, float, float]]:
+        # (stop id, time of the latest node, walking time, waiting time) for each egress stop:
+        # the latest node from which one can still walk to the destination by arrive_min
+        egress_links = []
+        for sid, walk_t in zip(egress_stop_ids, egress_walk_ts):
+            leave_min = arrive_min - walk_t
+            prev_node = self.find_prev_node(sid, leave_min)
+            if prev_node is None:
+                continue
+            egress_links.append((sid, prev_node[0], float(walk_t), float(leave_min - prev_node[0])))
+        return egress_links
+
     def find_closest_next_time(self, stop_id: str, time_min: float) -> float:
-        idx = self.nodes_time_map[stop_id].bisect_left(time_min)
-        return self.nodes_time_map[stop_id][idx]  # return the next time
+        ts = self.get_stop_tods(stop_id)
+        idx = bisect.bisect_left(ts, time_min)
+        return ts[idx]  # return the next time
 
     def find_closest_prev_time(self, stop_id: str, time_min: float) -> float:
-        idx = self.nodes_time_map[stop_id].bisect_left(time_min)
-        return self.nodes_time_map[stop_id][idx - 1]  # return the next time
+        ts = self.get_stop_tods(stop_id)
+        idx = bisect.bisect_left(ts, time_min)
+        return ts[idx - 1]  # return the previous time
 
     def _create_linkage_to_graph(
             self,
             stop_orig_id: str,
             stop_dest_id: str,
             depart_min: int,
-    ):
+    ) -> tuple[int, int]:
+        # origin node at the departure time (linked to the next node of the stop),
+        # and the integer stop id of the destination
+        if self.time_resolution > 1:
+            depart_min = self.bucket_tod(depart_min)
         next_min = self.find_closest_next_time(stop_orig_id, depart_min)
-        orig_node_id = self.query_node_or_create(stop_id=stop_orig_id, tod=int(depart_min))
-        next_node_id = self.query_node_or_create(stop_id=stop_orig_id, tod=int(next_min))
+        if self.frozen:
+            # a temporary origin node unless a node is at the departure (see _remove_temp_nodes)
+            next_node_id = self.get_node_id(stop_orig_id, next_min)
+            if next_min == int(depart_min):
+                return next_node_id, self.stop_idx_map[stop_dest_id]
+            orig_node_id = self.G.add_node(GTFSNode(stop_orig_id, int(depart_min)))
+            self._temp_nodes.append(orig_node_id)
+        else:
+            orig_node_id = self.query_node_or_create(stop_id=stop_orig_id, tod=int(depart_min))
+            next_node_id = self.query_node_or_create(stop_id=stop_orig_id, tod=int(next_min))
         
         if orig_node_id != next_node_id:
             journey_t = max(0.1, next_min - depart_min)
 
-            self.add_edge(
-                node_a=orig_node_id, node_b=next_node_id,
-                properties=GTFSEdge(
+            self.G.add_edge(
+                orig_node_id, next_node_id,
+                GTFSEdge(
                     start_node=orig_node_id, end_node=next_node_id,
                     trip_t=0, wait_t=journey_t, walk_t=0,
                     mode=EdgeMode.WAIT
                 )
             )
 
-        # create destination link
-        node_id_dest = self.nodes_name_map[f"{stop_dest_id}_D"]
-        return orig_node_id, node_id_dest
+        return orig_node_id, self.stop_idx_map[stop_dest_id]
 
     def query_od_stops_time(
             self,
@@ -423,31 +1479,196 @@ class GTFSGraph:
             stop_dest_ids: list[str],
             depart_min: int,
             cutoff: float,  # e.g., 180 for 3 hours
-            return_costs: bool = False
+            return_costs: bool = False,
+            method: str = "dijkstra",  # "astar" or "alt" (goal-directed, see query_od_astar)
+            workspace: SearchWorkspace | None = None,  # e.g., reused over the queries of a batch
     ) -> dict:
-        # add final origin & destination links
+        if workspace is not None and not self.frozen:
+            raise ValueError("a search workspace needs a frozen graph (see freeze), the query would add nodes")
+        # add final origin links, the search stops at any time node of the destination stops
         orig_node_ids = []
-        node_id_dests = []
-        for orig_id in stop_orig_ids:
-            for dest_id in stop_dest_ids:
-                orig_node_id, node_id_dest = self._create_linkage_to_graph(
-                    stop_orig_id=orig_id,
-                    stop_dest_id=dest_id,
-                    depart_min=depart_min
-                )
-                orig_node_ids.append(orig_node_id)
-                node_id_dests.append(node_id_dest)
+        dest_stop_idxs = []
+        try:
+            for orig_id in stop_orig_ids:
+                for dest_id in stop_dest_ids:
+                    orig_node_id, dest_stop_idx = self._create_linkage_to_graph(
+                        stop_orig_id=orig_id,
+                        stop_dest_id=dest_id,
+                        depart_min=depart_min
+                    )
+                    orig_node_ids.append(orig_node_id)
+                    dest_stop_idxs.append(dest_stop_idx)
 
-        visitor = self._dijkstra_search_worker(
-            orig_node_ids=orig_node_ids,
-            dest_node_ids=node_id_dests,
-            cutoff=cutoff
-        )
-        res_path = visitor.get_one_final_path_to_targets()
+            if method in ("astar", "alt"):
+                bound = "landmarks" if method == "alt" else "stop_graph"
+                res_path, final_cost = self.query_od_astar(
+                    orig_node_ids, dest_stop_idxs, cutoff, bound=bound, workspace=workspace
+                )
+            else:
+                visitor = self._dijkstra_search_worker(
+                    orig_node_ids=orig_node_ids,
+                    dest_node_ids=None,
+                    cutoff=cutoff,
+                    target_stops=set(dest_stop_idxs),
+                    workspace=workspace,
+                )
+                self.last_search_stats = {"method": "dijkstra", "nodes_settled": visitor.num_settled}
+                res_path, final_cost = visitor.get_one_final_path_to_targets(), visitor.final_cost
+        finally:
+            temp_nodes = self._remove_temp_nodes()
+        # paths start at the first node of the graph (the temporary origin is not in it)
+        res_path = [v for v in res_path if v not in temp_nodes]
         if return_costs:
-            return res_path, visitor.final_cost
+            return res_path, final_cost
         return res_path
 
+    def _remove_temp_nodes(self) -> set[int]:
+        temp_nodes = set(self._temp_nodes)
+        for nid in temp_nodes:
+            self.G.remove_node(nid)
+        self._temp_nodes = []
+        return temp_nodes
+
+    def query_od_astar(
+            self,
+            orig_node_ids: list[int],
+            dest_stop_idxs: list[int],  # integer stop ids
+            cutoff: float = float('inf'),
+            bound: str = "stop_graph",  # or "landmarks" (precomputed, see compute_landmarks)
+            workspace: SearchWorkspace | None = None,
+    ) -> tuple[list[int], float | None]:
+        """
+            A* from the origin nodes to the first node of the destination stops: Dijkstra on reduced
+            costs w(u, v) - h(u) + h(v), where h is the min. travel time from the stop of
+            a node to the destination stops on the time-independent stop graph
+            (or its landmark lower bound, cheaper to get but weaker).
+            h is consistent (every edge costs at least the stop graph edge), so the
+            first destination settled has the same cost as with plain Dijkstra.
+        """
+        dest_stop_idxs = np.unique(dest_stop_idxs)
+        if bound == "landmarks" and self.get_landmarks() is not None:
+            stop_bounds = self.landmarks.lower_bounds(dest_stop_idxs)
+        else:
+            stop_bounds = self.get_stop_lower_bounds(dest_stop_idxs)
+        # nodes which cannot reach any destination get a bound beyond any cutoff
+        stop_bounds = np.minimum(stop_bounds, 1e9)
+
+        # all origins start at cost 0 from a temporary source (h = 0)
+        source_nid = self.G.add_node(GTFSNode("__origin__", -1))
+        try:
+            for nid in dict.fromkeys(orig_node_ids):
+                self.G.add_edge(
+                    source_nid, nid,
+                    GTFSEdge(
+                        start_node=source_nid, end_node=nid,
+                        trip_t=0, wait_t=0, walk_t=0,
+                        mode=EdgeMode.WAIT
+                    )
+                )
+            # potential (h) of a node is the bound of its stop, 0 for nodes of no stop (-1)
+            if source_nid >= len(self.node_stop_idx):
+                num_new = source_nid + 1 - len(self.node_stop_idx)
+                self.node_stop_idx += [-1] * num_new
+                self.node_tod += [-1] * num_new
+            node_stops = self.node_stop_idx
+            bounds = stop_bounds.tolist() + [0.0]
+
+            if workspace is not None:
+                workspace.start([source_nid], len(node_stops))
+            visitor = DijkstraCustomVisitor(
+                source_vs=[source_nid],
+                cutoff=cutoff,
+                reduced=True,
+                target_stops=set(dest_stop_idxs.tolist()),
+                node_stops=node_stops,
+                walk_arrival_edges=self.walk_arrival_edges,
+                workspace=workspace,
+            )
+            # (bounds are exact multiples of STOP_GRAPH_TIME_STEP: their difference has no
+            # rounding error, and is at most the edge cost)
+            rx.digraph_dijkstra_search(
+                self.G,
+                [source_nid],
+                weight_fn=lambda e: e.total_t - (bounds[node_stops[e.start_node]] - bounds[node_stops[e.end_node]]),
+                visitor=visitor
+            )
+        finally:
+            self.G.remove_node(source_nid)
+        visitor.settle_walk_arrival()
+        self.last_search_stats = {"method": "astar", "nodes_settled": visitor.num_settled}
+        res_path = visitor.get_one_final_path_to_targets()[1:]
+        return res_path, visitor.final_cost
+
+    def get_stop_graph(self) -> sp.csr_matrix:
+        """
+            Time-independent graph of stops: the min. cost of the trip and walking
+            edges between each pair of stops, built once per network (network_id)
+        """
+        # (reset by add_edge if a trip or walking edge between stops is added)
+        if self._stop_graph is not None and self._stop_graph_id == self.network_id:
+            return self._stop_graph
+        node_stop_idx, __ = self.get_node_arrays()
+        # (without the wait of walks to the next departure, see _add_edges_next_departures)
+        edges = [
+            (e.start_node, e.end_node, e.trip_t + e.walk_t)
+            for e in self.G.edges()
+            if e.mode in (EdgeMode.TRIP, EdgeMode.WALK)
+        ]
+        a, b, t = (np.asarray(x) for x in zip(*edges)) if len(edges) > 0 else ([], [], [])
+        a = node_stop_idx[np.asarray(a, dtype="int64")]
+        b = node_stop_idx[np.asarray(b, dtype="int64")]
+        t = np.floor(np.asarray(t, dtype="float64") / STOP_GRAPH_TIME_STEP) * STOP_GRAPH_TIME_STEP
+        keep = (a >= 0) & (b >= 0) & (a != b)
+        a, b, t = a[keep], b[keep], t[keep]
+        # keep the min. cost of parallel edges (zero costs are kept as explicit entries)
+        order = np.lexsort((t, b, a))
+        a, b, t = a[order], b[order], t[order]
+        first = np.ones(len(a), dtype=bool)
+        first[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+        num_stops = len(self.stop_ids)
+        self._stop_graph = sp.csr_matrix((t[first], (a[first], b[first])), shape=(num_stops, num_stops))
+        self._stop_graph_id = self.network_id
+        return self._stop_graph
+
+    def compute_landmarks(self, num_landmarks: int = 16) -> Landmarks:
+        # ALT preprocessing: travel times from/to a few landmark stops on the stop graph
+        self.landmarks = compute_landmarks(self.get_stop_graph(), self.network_id, num_landmarks)
+        return self.landmarks
+
+    def get_landmarks(self) -> Landmarks | None:
+        # landmarks of this network (None if not computed or computed on another network)
+        if self.landmarks is None or self.landmarks.network_id != self.network_id:
+            return None
+        if self.landmarks.dist_from.shape[1] != len(self.stop_ids):
+            return None
+        return self.landmarks
+
+    def save_landmarks(self, folder: str) -> str:
+        # one file per network id next to the other preprocessed data
+        os.makedirs(folder, exist_ok=True)
+        pth = get_landmarks_path(folder, self.network_id)
+        self.landmarks.save(pth)
+        return pth
+
+    def load_landmarks(self, folder: str) -> bool:
+        # True if landmarks of this network are found in the folder
+        pth = get_landmarks_path(folder, self.network_id)
+        if not os.path.exists(pth):
+            return False
+        landmarks = Landmarks.load(pth)
+        if landmarks.dist_from.shape[1] != len(self.stop_ids):
+            return False
+        self.landmarks = landmarks
+        return True
+
+    def get_stop_lower_bounds(self, dest_stop_idxs: np.ndarray) -> np.ndarray:
+        # min. travel time (minutes) from each stop to the closest destination stop, ignoring waits
+        if len(dest_stop_idxs) == 0:
+            return np.full(len(self.stop_ids), np.inf)
+        stop_graph = self.get_stop_graph()
+        # search backwards from the destinations on the transposed graph
+        return csgraph_dijkstra(stop_graph.T.tocsr(), indices=dest_stop_idxs, min_only=True)
+
     # get travel time/waiting time given path (a list of nodes)
     def get_travel_time_info_from_pth(
             self,
@@ -463,8 +1684,11 @@ class GTFSGraph:
         for i, n1 in enumerate(path_nodes):
             if i == 0:
                 continue
-            index_map = G.edge_indices_from_endpoints(n0, n1)[0]
-            dat = G.get_edge_data_by_index(index_map)
+            # parallel edges may exist: the search used the cheapest one
+            dat = min(
+                (G.get_edge_data_by_index(e) for e in G.edge_indices_from_endpoints(n0, n1)),
+                key=lambda x: x.total_t,
+            )
 
             the_mode = dat.mode
             if the_mode == EdgeMode.TRIP:
@@ -473,6 +1697,7 @@ class GTFSGraph:
                 wait_time += dat.wait_t
             if the_mode == EdgeMode.WALK:
                 walk_time += dat.walk_t
+                wait_time += dat.wait_t  # access edges also wait for the next node
             n0 = n1
 
         transit_time = round(transit_time, 2)
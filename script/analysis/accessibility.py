@@ -0,0 +1,193 @@
+"""
+Cumulative-opportunity accessibility of all stops:
+for each origin stop, threshold and departure time, the total weight of the
+opportunities (jobs, POIs, ...) reachable within the threshold (transit + walk).
+Opportunities are snapped to their nearest stop once; per-stop arrival times of
+one-to-all searches are aggregated with sparse products over egress-time buckets.
+The stop x threshold x departure array is saved per network (see get_accessibility_path).
+"""
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from script.GTFSGraph import GTFSGraph, SearchWorkspace
+from script.util.parallel import parallel_map, get_worker_state
+
+
+@dataclass
+class AccessibilityResult:
+    stop_ids: np.ndarray
+    thresholds: np.ndarray  # in minutes
+    depart_mins: np.ndarray
+    values: np.ndarray  # (num. of stops, num. of thresholds, num. of departures)
+    num_snapped: int = 0  # opportunities within reach of a stop (see snap_opportunities)
+
+    def save(self, pth: str) -> None:
+        np.savez(
+            pth,
+            stop_ids=self.stop_ids.astype(str),
+            thresholds=self.thresholds,
+            depart_mins=self.depart_mins,
+            values=self.values,
+            num_snapped=self.num_snapped,
+        )
+
+    @classmethod
+    def load(cls, pth: str) -> "AccessibilityResult":
+        data = np.load(pth)
+        return cls(
+            stop_ids=data["stop_ids"],
+            thresholds=data["thresholds"],
+            depart_mins=data["depart_mins"],
+            values=data["values"],
+            num_snapped=int(data["num_snapped"]),
+        )
+
+    def to_frame(self, depart_min: float) -> pd.DataFrame:
+        # one departure time as a (stop x threshold) table
+        j = int(np.flatnonzero(self.depart_mins == depart_min)[0])
+        return pd.DataFrame(
+            self.values[:, :, j],
+            index=pd.Index(self.stop_ids, name="stop_id"),
+            columns=[f"within_{t:g}_min" for t in self.thresholds],
+        )
+
+
+def get_accessibility_path(folder: str, network_id: str) -> str:
+    return os.path.join(folder, f"accessibility_{network_id}.npz")
+
+
+def load_opportunities(
+        pth: str,
+        lat_col: str = "lat",
+        lon_col: str = "lon",
+        weight_col: str | None = "weight",  # None: every point counts as 1
+) -> pd.DataFrame:
+    df = pd.read_csv(pth)
+    weights = df[weight_col] if weight_col is not None else 1.0
+    opps = pd.DataFrame({"lat": df[lat_col], "lon": df[lon_col], "weight": weights})
+    return opps.dropna().reset_index(drop=True)
+
+
+def snap_opportunities(
+        GRAPH_OBJ: GTFSGraph,
+        opportunities: pd.DataFrame,
+        bw_mile: float = 0.25,
+        walk_speed: float = 1,  # mph
+        egress_step: float = 1,  # minutes
+) -> tuple[sp.csc_matrix, np.ndarray, np.ndarray]:
+    """
+        Egress matrix of shape (num. of stops, num. of egress buckets): entry (s, b)
+        is the weight of the opportunities whose nearest stop is s, with a walk of
+        at most b x egress_step minutes (rounded up). Opportunities farther than
+        bw_mile from any stop are dropped. Returns the matrix, the bucket times and
+        the mask of the snapped opportunities.
+    """
+    stop_index = GRAPH_OBJ.stop_index
+    matches = stop_index.query_knn(
+        opportunities["lat"].to_numpy(), opportunities["lon"].to_numpy(), k=1, walk_speed=walk_speed
+    )
+    snapped = matches.dists <= bw_mile
+    buckets = np.ceil(matches.walk_times[snapped] / egress_step).astype("int64")
+    num_buckets = int(buckets.max()) + 1 if len(buckets) > 0 else 1
+    egress = sp.csc_matrix(
+        (opportunities["weight"].to_numpy()[snapped], (matches.stop_idxs[snapped], buckets)),
+        shape=(len(stop_index), num_buckets),
+    )  # duplicated entries are summed
+    return egress, np.arange(num_buckets) * egress_step, snapped
+
+
+def aggregate_opportunities(
+        arrival: np.ndarray,  # (num. of origins, num. of stops), inf if not reached
+        egress: sp.csc_matrix,
+        egress_times: np.ndarray,
+        thresholds: np.ndarray,
+) -> np.ndarray:
+    # (num. of origins, num. of thresholds): sum over stops s and buckets b of
+    # egress[s, b] if arrival[o, s] + egress_times[b] <= threshold
+    res = np.zeros((arrival.shape[0], len(thresholds)))
+    # sparse matrix of the arrivals at the reached stops (within the largest threshold),
+    # built once: each (threshold, bucket) only tests its data
+    rows, cols = np.nonzero(arrival <= thresholds.max())
+    reach = sp.csr_matrix((arrival[rows, cols], (rows, cols)), shape=arrival.shape)
+    reached = reach.copy()
+    for b in np.flatnonzero(egress.getnnz(axis=0)):
+        weights = egress[:, [b]]  # (num. of stops, 1)
+        for k, t in enumerate(thresholds):
+            reached.data = (reach.data <= t - egress_times[b]).astype("float64")
+            res[:, k] += (reached @ weights).toarray().ravel()
+    return res
+
+
+def _accessibility_task(task: tuple[list[str], float]) -> np.ndarray:
+    # runs in a worker: one batch of origins at one departure time
+    origin_stop_ids, depart_min = task
+    state = get_worker_state()
+    GRAPH_OBJ: GTFSGraph = state["graph"]
+    dest_stop_idxs = state["dest_stop_idxs"]
+    thresholds = state["thresholds"]
+    # one search workspace per worker, reused by all its origins
+    workspace = state.setdefault("workspace", SearchWorkspace())
+
+    arrival = np.full((len(origin_stop_ids), len(dest_stop_idxs)), np.inf)
+    is_served = dest_stop_idxs >= 0
+    for i, stop_id in enumerate(origin_stop_ids):
+        # access from the origin stop: itself and its walkable neighbors
+        access = GRAPH_OBJ.get_origin_access(stop_id=stop_id, walk_speed=state["walk_speed"])
+        # earliest arrival at each stop (integer stop ids of the graph)
+        stop_costs = GRAPH_OBJ.query_origin_stop_costs(
+            *access, depart_min, cutoff=thresholds.max(), workspace=workspace
+        )
+        arrival[i, is_served] = stop_costs[dest_stop_idxs[is_served]]
+    return aggregate_opportunities(arrival, state["egress"], state["egress_times"], thresholds)
+
+
+def compute_accessibility(
+        GRAPH_OBJ: GTFSGraph,
+        opportunities: pd.DataFrame,
+        folder: str,  # where the result is saved (see get_accessibility_path)
+        thresholds: list[float] = (15, 30, 45, 60),
+        depart_mins: list[float] = (480,),
+        bw_mile: float = 0.25,  # max. walk between opportunities and stops
+        walk_speed: float = 1,  # mph
+        egress_step: float = 1,
+        batch_size: int = 64,
+        max_workers: int | None = None,
+) -> AccessibilityResult:
+    thresholds = np.sort(np.asarray(thresholds, dtype="float64"))
+    depart_mins = np.asarray(depart_mins, dtype="float64")
+    egress, egress_times, snapped = snap_opportunities(GRAPH_OBJ, opportunities, bw_mile, walk_speed, egress_step)
+
+    # origins and destinations are the stops of the spatial index
+    stop_ids = GRAPH_OBJ.stop_index.stop_ids
+    dest_stop_idxs = GRAPH_OBJ.encode_stops(stop_ids)
+    served = np.array([GRAPH_OBJ.has_stop_nodes(sid) for sid in stop_ids])
+    origin_rows = np.flatnonzero(served)
+    batches = [origin_rows[i:i + batch_size] for i in range(0, len(origin_rows), batch_size)]
+    task_rows = [(rows, j) for j in range(len(depart_mins)) for rows in batches]
+    tasks = [(stop_ids[rows].tolist(), depart_mins[j]) for rows, j in task_rows]
+
+    state = {
+        "graph": GRAPH_OBJ,
+        "dest_stop_idxs": dest_stop_idxs,
+        "thresholds": thresholds,
+        "egress": egress,
+        "egress_times": egress_times,
+        "walk_speed": walk_speed,
+    }
+    results = parallel_map(_accessibility_task, tasks, state=state, max_workers=max_workers)
+
+    values = np.zeros((len(stop_ids), len(thresholds), len(depart_mins)))
+    for (rows, j), res in zip(task_rows, results):
+        values[rows, :, j] = res
+    acc = AccessibilityResult(
+        stop_ids=stop_ids, thresholds=thresholds, depart_mins=depart_mins, values=values,
+        num_snapped=int(snapped.sum()),
+    )
+    # saved to get_accessibility_path(folder, GRAPH_OBJ.network_id)
+    os.makedirs(folder, exist_ok=True)
+    acc.save(get_accessibility_path(folder, GRAPH_OBJ.network_id))
+    return acc
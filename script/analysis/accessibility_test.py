@@ -0,0 +1,92 @@
+"""
+Test to safeguard the accessibility engine...
+"""
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from script.analysis.accessibility import (
+    AccessibilityResult, aggregate_opportunities, compute_accessibility, get_accessibility_path, load_opportunities
+)
+from script.analysis.spatial_index import StopSpatialIndex
+from script.GTFSGraph import GTFSGraph, StopNeighbors
+from script.graph_test import get_ab_neighbors, get_next_departure_graph
+
+
+def test_aggregate_opportunities():
+    arrival = np.array([
+        [0, 10, np.inf],
+        [5, np.inf, 20],
+    ])
+    # stop 0: weight 1 at 0 min walk; stop 1: weight 2 at 3 min; stop 2: weight 4 at 0 min
+    egress = sp.csc_matrix(np.array([[1, 0, 0, 0], [0, 0, 0, 2], [4, 0, 0, 0]]))
+    res = aggregate_opportunities(arrival, egress, np.arange(4), np.array([5, 15, 30]))
+    assert res.tolist() == [[1, 3, 3], [1, 1, 5]]
+
+
+def test_compute_accessibility(tmp_path):
+    # A and B are 0.1 mile apart, served at minutes 10 and 20
+    g = GTFSGraph()
+    g.add_skeleton_nodes(stop_dict={"stop_id": "A"}, times_info=[10, 20])
+    g.add_skeleton_nodes(stop_dict={"stop_id": "B"}, times_info=[10, 20])
+    g.add_edges_walkable_stops(
+        stops_b=get_ab_neighbors(),
+        walk_speed=1,
+    )
+    g.add_edges_within_same_stops()
+    g.stop_index = StopSpatialIndex(pd.DataFrame({
+        "stop_id": ["A", "B"],
+        "stop_lat": [36.0, 36.001447],
+        "stop_lon": [-84.0, -84.0],
+    }))
+    pd.DataFrame({
+        "lat": [36.0, 36.001447, 37.0],  # at A, at B, far away
+        "lon": [-84.0, -84.0, -84.0],
+        "jobs": [10, 100, 1000],
+    }).to_csv(tmp_path / "jobs.csv", index=False)
+    opps = load_opportunities(tmp_path / "jobs.csv", weight_col="jobs")
+
+    res = compute_accessibility(
+        g, opps, tmp_path, thresholds=[1, 10], depart_mins=[10, 15], bw_mile=0.25, walk_speed=1, max_workers=1
+    )
+    assert res.values.shape == (2, 2, 2)
+    # from A at 10: A at once, B after a 6 min walk (A_10 -> B_16)
+    assert res.values[0, :, 0].tolist() == [10, 110]
+    # from A at 15: B is reached on foot (6 min), not at its next node B_26 (11 min)
+    assert res.values[0, :, 1].tolist() == [10, 110]
+    assert res.num_snapped == 2  # (not the one far away)
+
+    # saved per network
+    loaded = AccessibilityResult.load(get_accessibility_path(tmp_path, g.network_id))
+    assert (loaded.values == res.values).all() and loaded.num_snapped == 2
+    assert loaded.to_frame(10).loc["B"].tolist() == res.values[1, :, 0].tolist()
+
+
+def test_compute_accessibility_graph_modes(tmp_path):
+    # same results with walks to the next departure, and with wait chains contracted
+    # (C is reached by the trip B_20 -> C_25 only)
+    opps = pd.DataFrame({"lat": [36.0, 36.001447, 37.0], "lon": [-84.0, -84.0, -84.0], "weight": [10, 100, 1000]})
+    values = []
+    for transfer_mode, contract in [("all", False), ("next_departure", False), ("all", True)]:
+        g = get_next_departure_graph(transfer_mode)
+        if contract:
+            g.contract_wait_chains()
+            g.freeze()
+        g.stop_neighbors = StopNeighbors(
+            stop_ids=np.array(["A", "B", "C"]),
+            indptr=np.array([0, 2, 4, 5]),
+            indices=np.array([0, 1, 0, 1, 2]),
+            dists=np.array([0, 0.1, 0.1, 0, 0]),
+        )
+        g.stop_index = StopSpatialIndex(pd.DataFrame({
+            "stop_id": ["A", "B", "C"],
+            "stop_lat": [36.0, 36.001447, 37.0],
+            "stop_lon": [-84.0, -84.0, -84.0],
+        }))
+        res = compute_accessibility(
+            g, opps, tmp_path, thresholds=[5, 15, 20], depart_mins=[9, 12, 21], walk_speed=1, max_workers=1
+        )
+        values.append(res.values)
+    # from A at 9: C at 25 (16 min), from B at 12: C at 25 (13 min)
+    assert values[0][0, :, 0].tolist() == [10, 110, 1110] and values[0][1, :, 1].tolist() == [100, 1110, 1110]
+    assert (values[1] == values[0]).all() and (values[2] == values[0]).all()
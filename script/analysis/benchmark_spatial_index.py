@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of the spatial index backends on the bundled GTFS stop sets.
+Run from the repository root:
+    python -m script.analysis.benchmark_spatial_index
+"""
+import glob
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from script.analysis.spatial_index import SPATIAL_INDEX_BACKENDS, build_stop_index
+
+
+def timeit(func, repeat: int = 3) -> float:
+    # best of several runs, in milliseconds
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def benchmark_one_feed(stops: pd.DataFrame, num_points: int = 10_000, seed: int = 0) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(stops["stop_lat"].min(), stops["stop_lat"].max(), num_points)
+    lons = rng.uniform(stops["stop_lon"].min(), stops["stop_lon"].max(), num_points)
+    stop_lats = stops["stop_lat"].to_numpy()
+    stop_lons = stops["stop_lon"].to_numpy()
+
+    records = []
+    for backend in SPATIAL_INDEX_BACKENDS:
+        record = {"backend": backend}
+        record["build (ms)"] = timeit(lambda: build_stop_index(stops, backend=backend))
+        stop_index = build_stop_index(stops, backend=backend)
+        record["stop neighbors 0.25 mi (ms)"] = timeit(
+            lambda: stop_index.query_radius(stop_lats, stop_lons, bw_mile=0.25)
+        )
+        record[f"{num_points} points 0.5 mi (ms)"] = timeit(
+            lambda: stop_index.query_radius(lats, lons, bw_mile=0.5)
+        )
+        record[f"{num_points} points knn k=1 (ms)"] = timeit(
+            lambda: stop_index.query_knn(lats, lons, k=1)
+        )
+        # single clicks: one query at a time, average over 100 points
+        record["one click 0.5 mi (us)"] = timeit(
+            lambda: [stop_index.query_radius(lats[i], lons[i], bw_mile=0.5) for i in range(100)], repeat=20
+        ) * 1000 / 100
+        record["num. of matches"] = len(stop_index.query_radius(lats, lons, bw_mile=0.5).stop_ids)
+        records.append(record)
+    return records
+
+
+def main(root_dir: str = "GTFS_inputs") -> pd.DataFrame:
+    records = []
+    for pth in sorted(glob.glob(os.path.join(root_dir, "*", "stops.txt"))):
+        stops = pd.read_csv(pth, usecols=["stop_id", "stop_lat", "stop_lon"])
+        stops = stops.dropna(subset=["stop_lat", "stop_lon"]).reset_index(drop=True)
+        feed_name = os.path.basename(os.path.dirname(pth))
+        for record in benchmark_one_feed(stops):
+            records.append({"feed": feed_name, "num. of stops": len(stops), **record})
+    df = pd.DataFrame(records).set_index(["feed", "num. of stops", "backend"])
+    return df
+
+
+if __name__ == "__main__":
+    pd.set_option("display.width", 200)
+    pd.set_option("display.max_columns", 20)
+    print(main().round(2))
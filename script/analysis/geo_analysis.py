@@ -6,7 +6,10 @@ from typing import Any
 import numpy as np
 import pandas as pd
 import geopandas as gpd
-from sklearn.neighbors import BallTree
+import shapely
+
+from script.GTFSGraph import StopNeighbors
+from script.analysis.spatial_index import StopIndex, build_stop_index
 
 
 # step 1. for each dot (stop_id), given remaining traveling time, computer a buffer zone
@@ -33,66 +36,88 @@ def get_buffer_geom(
         tot_time: float,
         walking_speed: float = 1,
 ) -> gpd.GeoSeries:
-    from shapely.ops import unary_union
-    import utm
-    import pyproj
+    return get_buffer_geoms(stops_gdf, [tot_time], walking_speed=walking_speed)
+
 
+def get_buffer_geoms(
+        stops_gdf: gpd.GeoDataFrame,
+        acc_times: list[float],
+        walking_speed: float = 1,  # mph
+) -> gpd.GeoSeries:
+    """
+        One isochrone polygon per time budget in acc_times: the union of the
+        walking disks (remaining time x walking speed) around the reached stops.
+        All buffering is done at once in one UTM projection, and nested bands are
+        built incrementally: band_k = band_(k-1).buffer(dt_k x speed) | disks of
+        stops reached during (t_(k-1), t_k], which equals the union of all disks.
+    """
     curr_proj = stops_gdf.crs
     stops_gdf = stops_gdf.to_crs("epsg:4326")  # to wgs84
-
-    lat0 = stops_gdf['stop_lat'].mean(skipna=True)
-    lon0 = stops_gdf['stop_lon'].mean(skipna=True)
-    print("lat0, lon0:", lat0, lon0)
-    __, __, zone, __ = utm.from_latlon(lat0, lon0)
-    proj = pyproj.Proj(proj="utm", zone=zone, ellps="WGS84", datum="WGS84")
-
-    buffs = []
-    for i, row in stops_gdf.iterrows():
-        _remain_time = tot_time - row["acc_time"]
-        # walking distance in miles
-        _remain_wd = (_remain_time / 60) * walking_speed
-
-        _geom = row["geometry"]
-        _geom_utm = to_from_utm(_geom, proj, "")
-        _geom_utm = _geom_utm.buffer(_remain_wd * 1609.34)  # mile to meter
-        _geom_buff = to_from_utm(_geom_utm, proj, inv=True)
-        buffs.append(_geom_buff)
-    # combine all buffs into one shape
-    boundary = gpd.GeoSeries(unary_union(buffs), crs="epsg:4326")
-    boundary = boundary.to_crs(curr_proj)
+    utm_crs = stops_gdf.estimate_utm_crs()
+    points = stops_gdf.geometry.to_crs(utm_crs).to_numpy()
+    stop_times = stops_gdf["acc_time"].to_numpy().astype("float64")
+    speed_m_per_min = walking_speed * 1609.34 / 60  # mile per hour to meter per minute
+
+    order = np.argsort(acc_times, kind="stable")
+    bands = [None] * len(acc_times)
+    band, prev_t = None, -np.inf
+    for k in order:
+        t = acc_times[k]
+        # stops reached since the last band (zero radius stops are dropped)
+        new = (stop_times >= prev_t) & (stop_times < t)
+        disks = shapely.buffer(points[new], (t - stop_times[new]) * speed_m_per_min, quad_segs=16)
+        if band is not None and not band.is_empty and t > prev_t:
+            disks = np.append(disks, shapely.buffer(band, (t - prev_t) * speed_m_per_min, quad_segs=16))
+        elif band is not None:
+            disks = np.append(disks, band)
+        band = shapely.union_all(disks)
+        bands[k] = band
+        prev_t = t
+    boundary = gpd.GeoSeries(bands, crs=utm_crs).to_crs(curr_proj)
     return boundary
 
 
+def get_stops_gdf(stops: pd.DataFrame) -> gpd.GeoDataFrame:
+    # stops as points in lon/lat (wgs84)
+    return gpd.GeoDataFrame(
+        stops,
+        geometry=gpd.points_from_xy(stops.stop_lon, stops.stop_lat),
+        crs="epsg:4326",
+    )
+
+
 # when building network, each stop needs to know its neighboring stops
-# within walking distance, compute nearest points for each stop
+# within walking distance, query all stops at once and return CSR arrays
+def find_stops_neighbors_csr(
+        stops: pd.DataFrame,
+        bw_mile: float = 0.25,
+        stop_index: StopIndex | None = None,  # reuse an index built on the same stops
+        backend: str = "balltree",  # spatial index backend if no index is given
+) -> StopNeighbors:
+    if stop_index is None:
+        stop_index = build_stop_index(stops, backend=backend)
+    # one batched query for all stops
+    matches = stop_index.query_radius(
+        stop_index.stop_lats, stop_index.stop_lons, bw_mile=bw_mile
+    )
+    return StopNeighbors(
+        stop_ids=stop_index.stop_ids,
+        indptr=matches.indptr,
+        indices=matches.stop_idxs,
+        dists=matches.dists,  # in miles
+    )
+
+
+# legacy interface: neighbors/dists stored as per-row arrays of the stops table
 def find_stops_neighbors_within_buffer(
         stops: pd.DataFrame,
         bw_mile: float = 0.25,
+        backend: str = "balltree",
 ) -> gpd.GeoDataFrame:
-    # convert to geopandas
-    stops = gpd.GeoDataFrame(
-        stops,
-        geometry=gpd.points_from_xy(stops.stop_lon, stops.stop_lat)
-    )
-    # add projection
-    stops = stops.set_crs('epsg:3857')
-    # set up indicies
-    bt = BallTree(
-        np.deg2rad(stops[['stop_lat', 'stop_lon']].values),
-        metric='haversine')
-    # for each row's (lat, lon), query neighbors
-    neighbors, dists = [], []
-    for i, row in stops.iterrows():
-        indicies, distances = bt.query_radius(
-            np.deg2rad(np.c_[row['stop_lat'], row['stop_lon']]),
-            r=bw_mile / 3959.8,  # mile
-            return_distance=True
-        )
-        neighbors.append(indicies[0])
-        # convert distance from rad to miles
-        dists.append(distances[0] * 3959.8)
-    stops['neighbors'] = neighbors
-    stops['dists'] = dists
+    stops = get_stops_gdf(stops)
+    nei = find_stops_neighbors_csr(stops, bw_mile=bw_mile, backend=backend)
+    stops['neighbors'] = np.split(nei.indices, nei.indptr[1:-1])
+    stops['dists'] = np.split(nei.dists, nei.indptr[1:-1])
     return stops
 
 
@@ -102,40 +127,20 @@ def find_nei_stops_given_coords(
         locs: list[tuple[float, float]],
         bw_mile: float = 0.5,
         return_all_neighbors: bool = True,
+        stop_index: StopIndex | None = None,  # reuse the index of the network
+        backend: str = "balltree",  # spatial index backend if no index is given
 ) -> tuple[Any, Any]:
-    # for each loc, get the nearest stops
-    # set up indices
-    bt = BallTree(
-        np.deg2rad(stops[['stop_lat', 'stop_lon']].values),
-        metric='haversine'
-    )
-    stops_idx = []
-    dists = []
-    acc_times = []
-    for loc in locs:
-        indices, distances = bt.query_radius(
-            np.deg2rad(np.c_[loc[0], loc[1]]),
-            r=bw_mile / 3959.8,  # mile
-            return_distance=True
-        )
-        index = indices[0]
-        distances = distances[0]
-
-        stops_idx += indices.flatten().tolist()
-        dists += (distances * 3959.8).flatten().tolist()
-        # walking speed is 2.5 mph
-        acc_times += (np.array(dists) / 2.5 * 60).flatten().tolist()
-    
+    if stop_index is None:
+        stop_index = build_stop_index(stops, backend=backend)
+    locs = np.asarray(locs, dtype="float64").reshape(-1, 2)
+    # walking speed is 2.5 mph
+    matches = stop_index.query_radius(locs[:, 0], locs[:, 1], bw_mile=bw_mile, walk_speed=2.5)
+
     # merge and only keep the nearest points
     if return_all_neighbors:
-        stops_ids = [stops.iloc[idx]["stop_id"] for idx in stops_idx]
+        stops_ids = matches.stop_ids.tolist()
+        acc_times = matches.walk_times.tolist()
     else:
-        stops_ids = [stops.iloc[stops_idx[0]]["stop_id"]]
-        acc_times = [acc_times[0]]
-
-    stops_ids = stops_ids[0].values.tolist()
-    # print("stops_ids:", stops_ids)
-    # print("acc_times:", acc_times)
+        stops_ids = matches.stop_ids[:1].tolist()
+        acc_times = matches.walk_times[:1].tolist()
     return stops_ids, acc_times
-
-
@@ -0,0 +1,27 @@
+"""
+Test to safeguard the isochrone polygons...
+"""
+import pandas as pd
+
+import script.analysis.geo_analysis as geo_analysis
+
+
+def test_get_buffer_geoms_nested():
+    stops = pd.DataFrame({
+        "stop_id": ["A", "B", "C"],
+        "stop_lat": [36.0, 36.01, 36.05],
+        "stop_lon": [-84.0, -84.0, -84.0],
+        "acc_time": [0.0, 10.0, 25.0],
+    })
+    stops_gdf = geo_analysis.get_stops_gdf(stops).to_crs("epsg:3857")
+    acc_times = [30, 10, 20]  # any order
+    bands = geo_analysis.get_buffer_geoms(stops_gdf, acc_times, walking_speed=3)
+    assert bands.crs == stops_gdf.crs
+    # stop B has no remaining time at 10 minutes
+    assert not bands[1].contains(stops_gdf.geometry[1].buffer(1))
+    assert bands[1].within(bands[2].buffer(1e-3))
+    assert bands[2].within(bands[0].buffer(1e-3))
+    # incremental bands match the direct union of disks
+    for i, t in enumerate(acc_times):
+        direct = geo_analysis.get_buffer_geom(stops_gdf, t, walking_speed=3)[0]
+        assert abs(direct.area - bands[i].area) / direct.area < 1e-3
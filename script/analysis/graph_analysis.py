@@ -7,47 +7,20 @@ import numpy as np
 import rustworkx as rx
 import geopandas as gpd
 import pandas as pd
-from sklearn.neighbors import BallTree
 
 import script.gtfs_controller as gtfs
+import script.analysis.geo_analysis as geo_analysis
 # from shapely.geometry import Point
 
 
 # when building network, each stop needs to know its neighboring stops
-# within walking distance, compute nearest points for each stop
+# within walking distance (kept for compatibility, see geo_analysis)
 def find_stops_neighbors_within_buffer(
         stops: pd.DataFrame,
         bw_mile: float = 0.5,
+        backend: str = "balltree",  # "balltree" or "grid"
 ):
-    # convert to GeoPandas
-    stops = gpd.GeoDataFrame(
-        stops,
-        geometry=gpd.points_from_xy(stops.stop_lon, stops.stop_lat)
-    )
-    # set projection (Mercator projection system for web service)
-    stops = stops.set_crs('epsg:4326')
-    stops = stops.to_crs('epsg:3857')
-
-    # set up indices
-    bt = BallTree(
-        np.deg2rad(stops[['stop_lat', 'stop_lon']].values),
-        metric='haversine'
-    )
-    # for each row's (lat, lon), query neighbors
-    neighbors, dists = [], []
-    for i, row in stops.iterrows():
-        indices, distances = bt.query_radius(
-            np.deg2rad(np.c_[row['stop_lat'], row['stop_lon']]),
-            r=bw_mile / 3959.8,  # mile
-            return_distance=True
-        )
-        neighbors.append(indices[0])
-        # convert distance from rad to miles
-        dists.append(distances[0] * 3959.8)
-
-    stops['neighbors'] = neighbors
-    stops['dists'] = dists
-    return stops
+    return geo_analysis.find_stops_neighbors_within_buffer(stops, bw_mile=bw_mile, backend=backend)
 
 
 def get_memory_usage(graph: rx.PyDiGraph):
@@ -72,7 +45,7 @@ def get_subgraph(
     stop_lats = stops["stop_lat"].to_numpy()
     nodes = []
     for stop_id in stop_ids:
-        ts = G_obj.nodes_time_map[stop_id]
+        ts = G_obj.get_stop_tods(stop_id)
         ts = np.array(list(ts))
         filt = (t_start <= ts) & (ts <= t_end)
         ts = ts[filt]
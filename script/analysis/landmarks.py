@@ -0,0 +1,101 @@
+"""
+Landmarks (ALT) on the time-independent stop graph of a network.
+With the min. travel times from and to a few landmark stops l, the triangle
+inequality bounds the travel time between any two stops u and t:
+d(u, t) >= d(u, l) - d(t, l) and d(u, t) >= d(l, t) - d(l, u).
+The bounds are consistent, so A* with them returns the same travel times as Dijkstra.
+"""
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+
+
+@dataclass
+class Landmarks:
+    network_id: str  # landmarks only apply to the network they were computed on
+    stop_idxs: np.ndarray  # integer stop ids of the landmarks
+    dist_from: np.ndarray  # (num. of landmarks, num. of stops) min. travel time from each landmark
+    dist_to: np.ndarray  # (num. of landmarks, num. of stops) min. travel time to each landmark
+
+    def __len__(self):
+        return len(self.stop_idxs)
+
+    def lower_bounds(self, dest_stop_idxs: np.ndarray) -> np.ndarray:
+        # lower bound of the travel time from each stop to the closest destination stop
+        # (inf if a stop cannot reach any of them)
+        bounds = np.full(self.dist_from.shape[1], np.inf)
+        with np.errstate(invalid="ignore"):
+            for t in np.asarray(dest_stop_idxs):
+                # inf - inf (nan) gives no information, fmax skips it
+                bound_t = np.fmax(
+                    self.dist_to - self.dist_to[:, [t]],
+                    self.dist_from[:, [t]] - self.dist_from,
+                )
+                bound_t = np.nan_to_num(np.fmax.reduce(bound_t, axis=0), nan=0.0, posinf=np.inf)
+                bounds = np.minimum(bounds, np.maximum(bound_t, 0))
+        return bounds
+
+    def save(self, pth: str) -> None:
+        np.savez(
+            pth,
+            network_id=np.array(self.network_id),
+            stop_idxs=self.stop_idxs,
+            dist_from=self.dist_from,
+            dist_to=self.dist_to,
+        )
+
+    @classmethod
+    def load(cls, pth: str) -> "Landmarks":
+        data = np.load(pth)
+        return cls(
+            network_id=str(data["network_id"]),
+            stop_idxs=data["stop_idxs"],
+            dist_from=data["dist_from"],
+            dist_to=data["dist_to"],
+        )
+
+
+def get_landmarks_path(folder: str, network_id: str) -> str:
+    return os.path.join(folder, f"landmarks_{network_id}.npz")
+
+
+def compute_landmarks(
+        stop_graph: sp.csr_matrix,
+        network_id: str,
+        num_landmarks: int = 16,
+) -> Landmarks:
+    """
+        Farthest-point selection: each new landmark is the stop farthest (round trip)
+        from the landmarks chosen so far, stops not connected to any of them first.
+    """
+    stop_graph_t = stop_graph.T.tocsr()
+    # candidates: stops with any trip or walk (others are never searched)
+    degrees = np.diff(stop_graph.indptr) + np.diff(stop_graph_t.indptr)
+    candidates = np.flatnonzero(degrees > 0)
+    num_landmarks = min(num_landmarks, len(candidates))
+
+    stop_idxs, dist_from, dist_to = [], [], []
+    # round trip distance to the closest landmark (inf: not connected yet)
+    min_dists = np.full(stop_graph.shape[0], np.inf)
+    # start from the stop farthest from an arbitrary stop
+    if num_landmarks > 0:
+        d0 = csgraph_dijkstra(stop_graph, indices=candidates[0]) + csgraph_dijkstra(stop_graph_t, indices=candidates[0])
+        d0 = np.where(np.isfinite(d0), d0, -1)
+        next_idx = candidates[np.argmax(d0[candidates])]
+    for __ in range(num_landmarks):
+        stop_idxs.append(next_idx)
+        dist_from.append(csgraph_dijkstra(stop_graph, indices=next_idx))
+        dist_to.append(csgraph_dijkstra(stop_graph_t, indices=next_idx))
+        min_dists = np.minimum(min_dists, dist_from[-1] + dist_to[-1])
+        next_idx = candidates[np.argmax(min_dists[candidates])]
+
+    num_stops = stop_graph.shape[0]
+    return Landmarks(
+        network_id=network_id,
+        stop_idxs=np.asarray(stop_idxs, dtype="int64"),
+        dist_from=np.asarray(dist_from, dtype="float64").reshape(-1, num_stops),
+        dist_to=np.asarray(dist_to, dtype="float64").reshape(-1, num_stops),
+    )
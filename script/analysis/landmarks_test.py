@@ -0,0 +1,76 @@
+"""
+Test to safeguard the landmark (ALT) bounds...
+"""
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import dijkstra as csgraph_dijkstra
+
+from script.analysis.landmarks import Landmarks, compute_landmarks, get_landmarks_path
+from script.GTFSGraph import GTFSGraph, GTFSEdge, EdgeMode
+from script.graph_test import get_ab_neighbors
+
+
+def test_lower_bounds():
+    # a directed ring 0 -> 1 -> 2 -> 3 -> 0 with a shortcut 0 -> 2, and an isolated stop 4
+    rows, cols, costs = [0, 1, 2, 3, 0], [1, 2, 3, 0, 2], [1, 2, 3, 4, 2.5]
+    stop_graph = sp.csr_matrix((costs, (rows, cols)), shape=(5, 5))
+    lm = compute_landmarks(stop_graph, "net", num_landmarks=2)
+    assert len(lm) == 2 and lm.dist_from.shape == (2, 5)
+    assert 4 not in lm.stop_idxs  # stops without trips or walks are never landmarks
+
+    exact = csgraph_dijkstra(stop_graph)
+    for t in range(4):
+        bounds = lm.lower_bounds(np.array([t]))
+        assert bounds[t] == 0
+        assert np.all(bounds[:4] <= exact[:4, t] + 1e-9)
+    # several destinations: the bound to the closest one
+    bounds = lm.lower_bounds(np.array([1, 3]))
+    assert np.all(bounds[:4] <= np.minimum(exact[:4, 1], exact[:4, 3]) + 1e-9)
+
+
+def test_save_load(tmp_path):
+    stop_graph = sp.csr_matrix(([1.0, 2.0], ([0, 1], [1, 2])), shape=(3, 3))
+    lm = compute_landmarks(stop_graph, "net", num_landmarks=2)
+    pth = get_landmarks_path(str(tmp_path), "net")
+    lm.save(pth)
+    lm2 = Landmarks.load(pth)
+    assert lm2.network_id == "net"
+    assert lm2.stop_idxs.tolist() == lm.stop_idxs.tolist()
+    assert np.array_equal(lm2.dist_from, lm.dist_from) and np.array_equal(lm2.dist_to, lm.dist_to)
+
+
+def test_query_od_alt(tmp_path):
+    # stops A and B 0.1 mile apart, and a trip from B at 20 to stop C at 25
+    g = GTFSGraph()
+    g.network_id = "net"
+    g.add_skeleton_nodes(stop_dict={"stop_id": "A"}, times_info=[10, 20])
+    g.add_skeleton_nodes(stop_dict={"stop_id": "B"}, times_info=[10, 20])
+    b20 = g.nodes_name_map["B_20"]
+    c25 = g.query_node_or_create(stop_id="C", tod=25)
+    g.add_edge(b20, c25, GTFSEdge(b20, c25, trip_t=5, wait_t=0, walk_t=0, mode=EdgeMode.TRIP))
+    nei = get_ab_neighbors()
+    g.add_edges_walkable_stops(stops_b=nei, walk_speed=1)
+    g.add_edges_within_same_stops()
+
+    g.compute_landmarks(num_landmarks=2)
+    assert g.get_landmarks() is not None
+    pth, cost = g.query_od_stops_time(["A"], ["C"], depart_min=9, cutoff=1000, return_costs=True)
+    pth_alt, cost_alt = g.query_od_stops_time(
+        ["A"], ["C"], depart_min=9, cutoff=1000, return_costs=True, method="alt"
+    )
+    assert abs(cost - cost_alt) < 1e-9 and pth_alt == pth
+
+    # saved next to the network and loaded by a network with the same id
+    g.save_landmarks(str(tmp_path))
+    g.landmarks = None
+    assert g.load_landmarks(str(tmp_path)) and len(g.landmarks) == 2
+    g.network_id = "other"
+    assert not g.load_landmarks(str(tmp_path)) and g.get_landmarks() is None
+
+    # a faster trip between stops invalidates the landmarks
+    g.network_id = "net"
+    g.get_stop_graph()
+    a20 = g.nodes_name_map["A_20"]
+    c21 = g.query_node_or_create(stop_id="C", tod=21)
+    g.add_edge(a20, c21, GTFSEdge(a20, c21, trip_t=1, wait_t=0, walk_t=0, mode=EdgeMode.TRIP))
+    assert g.landmarks is None
@@ -0,0 +1,305 @@
+"""
+Spatial indices of stops, built once per network to snap coordinates to stops.
+Two backends share the same interface:
+    - "balltree": haversine BallTree (sklearn)
+    - "grid": uniform grid hash (cell id buckets) with exact haversine refinement,
+      for radius queries only (k nearest stops are found by a BallTree)
+On the bundled feeds (see benchmark_spatial_index) the grid is faster to build,
+for batches of radius queries and for single clicks (row slices of a dense
+cell table, about 3-5x faster than the BallTree).
+"""
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import BallTree
+
+
+EARTH_RADIUS_MILE = 3959.8
+MILE_PER_DEG = EARTH_RADIUS_MILE * np.pi / 180  # along a meridian
+
+
+def haversine_mile(lat1, lon1, lat2, lon2) -> np.ndarray:
+    lat1, lon1, lat2, lon2 = map(np.deg2rad, (lat1, lon1, lat2, lon2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2 +
+        np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_MILE * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+@dataclass
+class StopMatches:
+    """
+        Stops matched to each queried coordinate in CSR layout: the stops of
+        coordinate i are stop_ids[indptr[i]:indptr[i + 1]] (sorted by distance)
+    """
+    indptr: np.ndarray
+    stop_idxs: np.ndarray  # positions in the indexed stops table
+    stop_ids: np.ndarray
+    dists: np.ndarray  # in miles
+    walk_times: np.ndarray  # in minutes
+
+    def get(self, i: int) -> tuple[np.ndarray, np.ndarray]:
+        lo, hi = self.indptr[i], self.indptr[i + 1]
+        return self.stop_ids[lo:hi], self.walk_times[lo:hi]
+
+
+class StopIndex(ABC):
+    """
+        Common part of the stop indices: stop arrays and the CSR result builder
+    """
+    def __init__(self, stops: pd.DataFrame):
+        self.stop_ids: np.ndarray = stops["stop_id"].to_numpy()
+        self.stop_lats: np.ndarray = stops["stop_lat"].to_numpy().astype("float64")
+        self.stop_lons: np.ndarray = stops["stop_lon"].to_numpy().astype("float64")
+
+    def __len__(self):
+        return len(self.stop_ids)
+
+    def _to_matches(self, query_idxs, stop_idxs, dists, num_queries, walk_speed) -> StopMatches:
+        # (query, stop, dist) triplets to CSR, each row sorted by distance
+        order = np.lexsort((dists, query_idxs))
+        stop_idxs = stop_idxs[order].astype("int64")
+        dists = dists[order]
+        counts = np.bincount(query_idxs, minlength=num_queries)
+        return StopMatches(
+            indptr=np.concatenate([[0], np.cumsum(counts)]).astype("int64"),
+            stop_idxs=stop_idxs,
+            stop_ids=self.stop_ids[stop_idxs],
+            dists=dists,
+            walk_times=dists / walk_speed * 60,
+        )
+
+    @abstractmethod
+    def query_radius(self, lats, lons, bw_mile: float = 0.5, walk_speed: float = 2.5) -> StopMatches:
+        ...
+
+    @abstractmethod
+    def query_knn(self, lats, lons, k: int = 1, walk_speed: float = 2.5) -> StopMatches:
+        ...
+
+
+class StopSpatialIndex(StopIndex):
+    def __init__(self, stops: pd.DataFrame):
+        super().__init__(stops)
+        self.tree = BallTree(
+            np.deg2rad(np.c_[self.stop_lats, self.stop_lons]),
+            metric='haversine'
+        )
+
+    def _ragged_to_matches(self, indices, distances, walk_speed) -> StopMatches:
+        counts = np.fromiter((len(idx) for idx in indices), dtype="int64", count=len(indices))
+        query_idxs = np.repeat(np.arange(len(indices)), counts)
+        stop_idxs = np.concatenate(indices) if len(indices) else np.zeros(0, "int64")
+        dists = np.concatenate(distances) * EARTH_RADIUS_MILE if len(indices) else np.zeros(0)
+        return self._to_matches(query_idxs, stop_idxs, dists, len(indices), walk_speed)
+
+    def query_radius(
+            self,
+            lats: np.ndarray,
+            lons: np.ndarray,
+            bw_mile: float = 0.5,
+            walk_speed: float = 2.5,  # mph
+    ) -> StopMatches:
+        # all stops within bw_mile of each coordinate, in one call
+        indices, distances = self.tree.query_radius(
+            np.deg2rad(np.c_[np.atleast_1d(lats), np.atleast_1d(lons)]),
+            r=bw_mile / EARTH_RADIUS_MILE,
+            return_distance=True,
+        )
+        return self._ragged_to_matches(indices, distances, walk_speed)
+
+    def query_knn(
+            self,
+            lats: np.ndarray,
+            lons: np.ndarray,
+            k: int = 1,
+            walk_speed: float = 2.5,  # mph
+    ) -> StopMatches:
+        # k nearest stops of each coordinate, in one call
+        k = min(k, len(self))
+        distances, indices = self.tree.query(
+            np.deg2rad(np.c_[np.atleast_1d(lats), np.atleast_1d(lons)]),
+            k=k,
+        )
+        return self._ragged_to_matches(list(indices), list(distances), walk_speed)
+
+
+class GridStopIndex(StopIndex):
+    """
+        Stops are bucketed by square cells (cell_mile wide) of a local
+        equirectangular projection; cells are sorted by their integer id so
+        each cell is a contiguous slice found by np.searchsorted.
+        Candidates from the cells around a query are refined by exact haversine distance.
+        Coarser levels (cells twice as wide each) keep the number of probed cells
+        small for large radii.
+        Single queries (e.g., a click on the map) use a dense cell table of each level
+        instead: stops sorted by (row, column) of their cell, with the start of every
+        cell, so the candidates of one row of cells are one contiguous slice.
+    """
+    # dense cell tables are only built for levels with fewer cells than this
+    MAX_DENSE_CELLS = 1 << 22
+
+    def __init__(self, stops: pd.DataFrame, cell_mile: float = 0.25):
+        super().__init__(stops)
+        self._knn_index: StopSpatialIndex | None = None
+        self.cell_mile = cell_mile
+        self.ref_lat = float(np.mean(self.stop_lats)) if len(self) > 0 else 0.0
+        self.cos_ref = np.cos(np.deg2rad(self.ref_lat))
+        # the narrowest longitude degree among stops (cells are widest in miles there)
+        max_abs_lat = float(np.max(np.abs(self.stop_lats))) if len(self) > 0 else 0.0
+        self.cos_min = max(np.cos(np.deg2rad(max_abs_lat)), 1e-6)
+
+        # levels of (cell size, stop order, sorted cell ids), until one level has a few cells
+        span = max(np.ptp(self.stop_lats), np.ptp(self.stop_lons) * self.cos_ref) * MILE_PER_DEG if len(self) > 0 else 0.0
+        self.levels: list[tuple[float, np.ndarray, np.ndarray]] = []
+        # per level: (first cell column, first cell row, num. of columns, num. of rows,
+        # stop order, cell starts) or None if the level has too many cells
+        self.dense_levels: list[tuple[int, int, int, int, np.ndarray, np.ndarray] | None] = []
+        level_cell_mile = cell_mile
+        while True:
+            cx, cy = self._to_cells(self.stop_lats, self.stop_lons, level_cell_mile)
+            cell_ids = self._cell_id(cx, cy)
+            order = np.argsort(cell_ids, kind="stable")
+            self.levels.append((level_cell_mile, order, cell_ids[order]))
+            self.dense_levels.append(self._dense_cells(cx, cy))
+            if level_cell_mile * 4 >= span:
+                break
+            level_cell_mile *= 2
+
+    def _dense_cells(self, cx: np.ndarray, cy: np.ndarray) -> tuple[int, int, int, int, np.ndarray, np.ndarray] | None:
+        if len(cx) == 0:
+            return None
+        x0, y0 = int(cx.min()), int(cy.min())
+        nx, ny = int(cx.max()) - x0 + 1, int(cy.max()) - y0 + 1
+        if nx * ny > self.MAX_DENSE_CELLS:
+            return None
+        dense_ids = (cy - y0) * nx + (cx - x0)
+        order = np.argsort(dense_ids, kind="stable")
+        cell_starts = np.concatenate([[0], np.cumsum(np.bincount(dense_ids, minlength=nx * ny))])
+        return x0, y0, nx, ny, order, cell_starts
+
+    def _to_cells(self, lats, lons, cell_mile: float) -> tuple[np.ndarray, np.ndarray]:
+        x = np.asarray(lons) * MILE_PER_DEG * self.cos_ref / cell_mile
+        y = np.asarray(lats) * MILE_PER_DEG / cell_mile
+        return np.floor(x).astype("int64"), np.floor(y).astype("int64")
+
+    @staticmethod
+    def _cell_id(cx, cy) -> np.ndarray:
+        # cell coordinates are far below 2**31 for any cell size above a few feet
+        return (cx << 32) + cy
+
+    def query_radius(
+            self,
+            lats: np.ndarray,
+            lons: np.ndarray,
+            bw_mile: float = 0.5,
+            walk_speed: float = 2.5,  # mph
+    ) -> StopMatches:
+        lats = np.atleast_1d(np.asarray(lats, dtype="float64"))
+        lons = np.atleast_1d(np.asarray(lons, dtype="float64"))
+        num_queries = len(lats)
+        # the finest level with at most ~2 rings of cells to cover the radius
+        level = min(int(np.ceil(np.log2(max(bw_mile / (2 * self.cell_mile), 1)))), len(self.levels) - 1)
+        cell_mile, order, sorted_cell_ids = self.levels[level]
+        ky = int(np.ceil(bw_mile / cell_mile))
+        kx = int(np.ceil(bw_mile * self.cos_ref / (cell_mile * self.cos_min)))
+        if num_queries == 1 and self.dense_levels[level] is not None:
+            return self._query_radius_one(lats[0], lons[0], bw_mile, walk_speed, level, kx, ky)
+        dx, dy = np.meshgrid(np.arange(-kx, kx + 1), np.arange(-ky, ky + 1))
+        dx, dy = dx.ravel(), dy.ravel()
+
+        # candidate cells of all queries: (num. of queries, num. of offsets)
+        qx, qy = self._to_cells(lats, lons, cell_mile)
+        cell_ids = self._cell_id(qx[:, None] + dx[None, :], qy[:, None] + dy[None, :])
+        lo = np.searchsorted(sorted_cell_ids, cell_ids, side="left").ravel()
+        hi = np.searchsorted(sorted_cell_ids, cell_ids, side="right").ravel()
+        counts = hi - lo
+
+        # expand the slices [lo, hi) into candidate (query, stop) pairs
+        total = int(counts.sum())
+        query_idxs = np.repeat(np.repeat(np.arange(num_queries), len(dx)), counts)
+        starts = np.repeat(lo - np.concatenate([[0], np.cumsum(counts)[:-1]]), counts)
+        stop_idxs = order[starts + np.arange(total)]
+
+        # exact refinement
+        dists = haversine_mile(lats[query_idxs], lons[query_idxs], self.stop_lats[stop_idxs], self.stop_lons[stop_idxs])
+        keep = dists <= bw_mile
+        return self._to_matches(query_idxs[keep], stop_idxs[keep], dists[keep], num_queries, walk_speed)
+
+    def _query_radius_one(self, lat, lon, bw_mile, walk_speed, level, kx, ky) -> StopMatches:
+        # one slice of the dense cell table per row of cells around the query
+        cell_mile = self.levels[level][0]
+        x0, y0, nx, ny, order, cell_starts = self.dense_levels[level]
+        qx = int(np.floor(lon * MILE_PER_DEG * self.cos_ref / cell_mile)) - x0
+        qy = int(np.floor(lat * MILE_PER_DEG / cell_mile)) - y0
+        x_lo, x_hi = max(qx - kx, 0), min(qx + kx, nx - 1)
+        rows = range(max(qy - ky, 0), min(qy + ky, ny - 1) + 1)
+        if x_lo > x_hi or len(rows) == 0:
+            stop_idxs = np.zeros(0, dtype="int64")
+        else:
+            stop_idxs = np.concatenate([
+                order[cell_starts[row * nx + x_lo]:cell_starts[row * nx + x_hi + 1]] for row in rows
+            ])
+
+        # exact refinement
+        dists = haversine_mile(lat, lon, self.stop_lats[stop_idxs], self.stop_lons[stop_idxs])
+        keep = np.flatnonzero(dists <= bw_mile)
+        keep = keep[np.argsort(dists[keep], kind="stable")]
+        stop_idxs, dists = stop_idxs[keep], dists[keep]
+        return StopMatches(
+            indptr=np.array([0, len(keep)], dtype="int64"),
+            stop_idxs=stop_idxs,
+            stop_ids=self.stop_ids[stop_idxs],
+            dists=dists,
+            walk_times=dists / walk_speed * 60,
+        )
+
+    def query_knn(
+            self,
+            lats: np.ndarray,
+            lons: np.ndarray,
+            k: int = 1,
+            walk_speed: float = 2.5,  # mph
+    ) -> StopMatches:
+        # growing radius queries are 2-8x slower than a BallTree for kNN: use one (built lazily)
+        if self._knn_index is None:
+            self._knn_index = StopSpatialIndex(pd.DataFrame({
+                "stop_id": self.stop_ids, "stop_lat": self.stop_lats, "stop_lon": self.stop_lons,
+            }))
+        return self._knn_index.query_knn(lats, lons, k=k, walk_speed=walk_speed)
+
+    def save(self, pth: str) -> None:
+        # only the stop arrays are needed, cells are rebuilt on load
+        # (stop ids as fixed-width strings: loaded without pickle)
+        np.savez(
+            pth,
+            stop_ids=self.stop_ids.astype(str),
+            stop_lats=self.stop_lats,
+            stop_lons=self.stop_lons,
+            cell_mile=self.cell_mile,
+        )
+
+    @classmethod
+    def load(cls, pth: str) -> "GridStopIndex":
+        data = np.load(pth)
+        stops = pd.DataFrame({
+            "stop_id": data["stop_ids"].astype(object),
+            "stop_lat": data["stop_lats"],
+            "stop_lon": data["stop_lons"],
+        })
+        return cls(stops, cell_mile=float(data["cell_mile"]))
+
+
+SPATIAL_INDEX_BACKENDS = {
+    "balltree": StopSpatialIndex,
+    "grid": GridStopIndex,
+}
+
+
+def build_stop_index(stops: pd.DataFrame, backend: str = "balltree", **kwargs) -> StopIndex:
+    if backend not in SPATIAL_INDEX_BACKENDS:
+        raise ValueError(f"unknown spatial index backend: {backend} (use one of {list(SPATIAL_INDEX_BACKENDS)})")
+    return SPATIAL_INDEX_BACKENDS[backend](stops, **kwargs)
@@ -0,0 +1,85 @@
+"""
+Test to safeguard the spatial index of stops...
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from script.analysis.spatial_index import StopIndex, StopSpatialIndex, GridStopIndex, build_stop_index
+
+
+def get_stops():
+    # stops along a meridian, 0.01 degree of latitude is ~0.69 mile
+    return pd.DataFrame({
+        "stop_id": ["A", "B", "C", "D"],
+        "stop_lat": [36.0, 36.01, 36.02, 36.10],
+        "stop_lon": [-84.0, -84.0, -84.0, -84.0],
+    })
+
+
+def test_query_radius():
+    stop_index = StopSpatialIndex(get_stops())
+    matches = stop_index.query_radius(
+        [36.0, 36.1, 37.0], [-84.0, -84.0, -84.0], bw_mile=1.0, walk_speed=3.0
+    )
+    assert matches.indptr.tolist() == [0, 2, 3, 3]
+    # sorted by distance
+    assert matches.get(0)[0].tolist() == ["A", "B"]
+    assert matches.get(1)[0].tolist() == ["D"]
+    assert len(matches.get(2)[0]) == 0
+    np.testing.assert_allclose(matches.walk_times, matches.dists / 3.0 * 60)
+    assert abs(matches.dists[1] - 0.691) < 0.01
+
+
+def test_query_knn():
+    stop_index = StopSpatialIndex(get_stops())
+    matches = stop_index.query_knn([36.021, 36.09], [-84.0, -84.0], k=2)
+    assert matches.get(0)[0].tolist() == ["C", "B"]
+    assert matches.get(1)[0].tolist() == ["D", "C"]
+
+
+def test_grid_index_same_as_balltree():
+    rng = np.random.default_rng(0)
+    stops = pd.DataFrame({
+        "stop_id": [f"S{i}" for i in range(500)],
+        "stop_lat": 36.0 + rng.uniform(-0.1, 0.1, 500),
+        "stop_lon": -84.0 + rng.uniform(-0.1, 0.1, 500),
+    })
+    lats = 36.0 + rng.uniform(-0.12, 0.12, 200)
+    lons = -84.0 + rng.uniform(-0.12, 0.12, 200)
+    bt_index = build_stop_index(stops, backend="balltree")
+    grid_index = build_stop_index(stops, backend="grid", cell_mile=0.2)
+    for bw_mile in [0.1, 0.5, 1.3]:
+        m1 = bt_index.query_radius(lats, lons, bw_mile=bw_mile)
+        m2 = grid_index.query_radius(lats, lons, bw_mile=bw_mile)
+        assert m1.indptr.tolist() == m2.indptr.tolist()
+        assert m1.stop_idxs.tolist() == m2.stop_idxs.tolist()
+        np.testing.assert_allclose(m1.dists, m2.dists, atol=1e-9)
+        # single queries (dense cell table), also around and outside the stops
+        for i in [0, 1, 2, 3]:
+            m1 = bt_index.query_radius(lats[i:i + 1], lons[i:i + 1], bw_mile=bw_mile)
+            m2 = grid_index.query_radius(lats[i], lons[i], bw_mile=bw_mile)
+            assert m1.stop_idxs.tolist() == m2.stop_idxs.tolist() and m2.indptr.tolist() == [0, len(m1.stop_idxs)]
+            np.testing.assert_allclose(m1.walk_times, m2.walk_times, atol=1e-9)
+        assert len(grid_index.query_radius(40.0, -80.0, bw_mile=bw_mile).stop_ids) == 0
+    m1 = bt_index.query_knn(lats, lons, k=3)
+    m2 = grid_index.query_knn(lats, lons, k=3)
+    assert m1.stop_idxs.tolist() == m2.stop_idxs.tolist()
+    # far away query
+    m2 = grid_index.query_knn([40.0], [-80.0], k=2)
+    assert m2.indptr.tolist() == [0, 2]
+
+
+def test_grid_index_save_and_load(tmp_path):
+    grid_index = GridStopIndex(get_stops(), cell_mile=0.3)
+    grid_index.save(tmp_path / "index.npz")
+    loaded = GridStopIndex.load(tmp_path / "index.npz")
+    assert loaded.cell_mile == 0.3
+    matches = loaded.query_radius([36.0], [-84.0], bw_mile=1.0)
+    assert matches.get(0)[0].tolist() == ["A", "B"]
+    assert loaded.stop_ids.dtype == object
+
+
+def test_stop_index_is_abstract():
+    with pytest.raises(TypeError):
+        StopIndex(get_stops())
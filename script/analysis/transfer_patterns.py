@@ -0,0 +1,358 @@
+"""
+Transfer patterns of a built network for OD lookups without searching the graph.
+For each origin stop, one-to-all searches from all of its departure nodes give the
+optimal paths to every stop; a path is cut into legs (a ride on consecutive trip
+edges, or a walk) and its pattern is the sequence of stops between legs.
+Patterns of one origin are stored as a prefix tree of stops, and the legs as
+direct connections between time nodes (the timetable of the patterns).
+A query only searches the patterns from the origin to the destination: waiting at
+the stops of the patterns and taking their connections gives the same travel times
+as a search of the whole network (within the cutoff and departure window).
+A walk to the next departure (see GTFSGraph.walk_arrival_edges) arrives at the
+destination before its wait, which is kept with the connection.
+"""
+import heapq
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import rustworkx as rx
+
+from script.GTFSGraph import GTFSGraph, DijkstraCustomVisitor, EdgeMode
+from script.util.parallel import parallel_map, get_worker_state
+
+
+@dataclass
+class TransferPatterns:
+    network_id: str
+    stop_ids: np.ndarray  # string stop ids by integer stop id
+    cutoff: float  # max. travel time (minutes) of the searches
+    depart_window: np.ndarray  # [first, last] departure time (minutes) of the queries
+    # prefix tree of the patterns of each origin: nodes of origin o are
+    # tp_offsets[o]:tp_offsets[o + 1], the first one is the origin (root, parent -1)
+    tp_offsets: np.ndarray
+    tp_stop: np.ndarray
+    tp_parent: np.ndarray  # index in the same origin
+    tp_end: np.ndarray  # True if a pattern ends at the node
+    # direct connections (legs) between time nodes, sorted by the node they leave
+    # (connections of node u are conn_offsets[u]:conn_offsets[u + 1])
+    conn_offsets: np.ndarray
+    conn_to_stop: np.ndarray
+    conn_to_node: np.ndarray
+    conn_cost: np.ndarray
+    conn_wait: np.ndarray  # waiting at the end of the connection (not needed to arrive at its stop)
+    # time nodes of each stop sorted by time (nodes of stop s are node_offsets[s]:node_offsets[s + 1])
+    node_offsets: np.ndarray
+    stop_nodes: np.ndarray
+    stop_node_tods: np.ndarray
+
+    def __post_init__(self):
+        self.stop_idx_map: dict = {sid: i for i, sid in enumerate(self.stop_ids.tolist())}
+        # position of each time node in stop_nodes (-1 for other nodes)
+        self.node_pos = np.full(len(self.conn_offsets) - 1, -1, dtype="int64")
+        self.node_pos[self.stop_nodes] = np.arange(len(self.stop_nodes))
+        self._lists = None
+
+    @property
+    def num_patterns(self) -> int:
+        return int(self.tp_end.sum())
+
+    @property
+    def num_connections(self) -> int:
+        return len(self.conn_to_node)
+
+    def save(self, pth: str) -> None:
+        np.savez_compressed(
+            pth,
+            network_id=np.array(self.network_id),
+            stop_ids=self.stop_ids.astype(str),
+            cutoff=np.array(self.cutoff),
+            **{name: getattr(self, name) for name in ARRAYS},
+        )
+
+    @classmethod
+    def load(cls, pth: str) -> "TransferPatterns":
+        data = np.load(pth)
+        return cls(
+            network_id=str(data["network_id"]),
+            stop_ids=data["stop_ids"],
+            cutoff=float(data["cutoff"]),
+            **{name: data[name] for name in ARRAYS},
+        )
+
+    def _get_lists(self) -> dict:
+        # python lists are much faster than numpy scalars in the query loop
+        if self._lists is None:
+            self._lists = {
+                name: getattr(self, name).tolist()
+                for name in ARRAYS + ["node_pos"] if name != "depart_window"
+            }
+        return self._lists
+
+    def earliest_arrival(self, stop_orig_id: str, stop_dest_id: str, depart_min: float) -> float:
+        """
+            Earliest arrival time (minutes of the day) at the destination stop, leaving the
+            origin stop at depart_min; inf if not reached within the cutoff
+        """
+        if stop_orig_id not in self.stop_idx_map or stop_dest_id not in self.stop_idx_map:
+            return float("inf")
+        if not self.depart_window[0] <= depart_min <= self.depart_window[1]:
+            raise ValueError(f"departure time {depart_min} is out of the window {self.depart_window}")
+        orig, dest = self.stop_idx_map[stop_orig_id], self.stop_idx_map[stop_dest_id]
+        if orig == dest:
+            return float(depart_min)
+        lst = self._get_lists()
+        tp_stop, tp_parent, tp_end = lst["tp_stop"], lst["tp_parent"], lst["tp_end"]
+        conn_offsets, conn_to_stop = lst["conn_offsets"], lst["conn_to_stop"]
+        conn_to_node, conn_cost, conn_wait = lst["conn_to_node"], lst["conn_cost"], lst["conn_wait"]
+        node_offsets, stop_nodes, tods = lst["node_offsets"], lst["stop_nodes"], lst["stop_node_tods"]
+        node_pos = lst["node_pos"]
+
+        # query graph: the patterns ending at the destination (children of each tree node)
+        lo, hi = self.tp_offsets[orig], self.tp_offsets[orig + 1]
+        ends = np.flatnonzero(self.tp_end[lo:hi] & (self.tp_stop[lo:hi] == dest)) + lo
+        children, linked = {}, set()
+        for k in ends.tolist():
+            while k != lo and k not in linked:
+                linked.add(k)
+                parent = tp_parent[k] + lo
+                children.setdefault(parent, []).append(k)
+                k = parent
+        if len(children) == 0:
+            return float("inf")
+
+        # start at the first time node of the origin from the departure time
+        pos = int(np.searchsorted(self.stop_node_tods[node_offsets[orig]:node_offsets[orig + 1]], depart_min))
+        pos += node_offsets[orig]
+        if pos >= node_offsets[orig + 1]:
+            return float("inf")
+
+        # Dijkstra over (tree node, time node): wait at the stop or take a connection
+        heap = [(tods[pos] - depart_min, lo, stop_nodes[pos])]
+        settled = set()
+        while heap:
+            cost, k, u = heapq.heappop(heap)
+            if cost > self.cutoff:
+                break
+            if (k, u) in settled:
+                continue
+            settled.add((k, u))
+            if tp_end[k] and tp_stop[k] == dest:
+                return depart_min + cost
+            # wait for the next time node of the stop
+            pos = node_pos[u]
+            if pos + 1 < node_offsets[tp_stop[k] + 1]:
+                heapq.heappush(heap, (cost + tods[pos + 1] - tods[pos], k, stop_nodes[pos + 1]))
+            # legs of the patterns (arriving at the destination before the wait of a walk)
+            for child in children.get(k, []):
+                to_stop = tp_stop[child]
+                arrives = tp_end[child] and to_stop == dest
+                for c in range(conn_offsets[u], conn_offsets[u + 1]):
+                    if conn_to_stop[c] == to_stop:
+                        leg_cost = conn_cost[c] - conn_wait[c] if arrives else conn_cost[c]
+                        heapq.heappush(heap, (cost + leg_cost, child, conn_to_node[c]))
+        return float("inf")
+
+
+# arrays saved in the npz file (besides network_id, stop_ids and cutoff)
+ARRAYS = [
+    "depart_window", "tp_offsets", "tp_stop", "tp_parent", "tp_end",
+    "conn_offsets", "conn_to_stop", "conn_to_node", "conn_cost", "conn_wait",
+    "node_offsets", "stop_nodes", "stop_node_tods",
+]
+
+
+def get_transfer_patterns_path(folder: str, network_id: str) -> str:
+    return os.path.join(folder, f"transfer_patterns_{network_id}.npz")
+
+
+class _PatternVisitor(DijkstraCustomVisitor):
+    # also keep the order nodes are settled in and the mode of the edge to each node
+    def __init__(self, source_vs: list[int], cutoff: float, GRAPH_OBJ: GTFSGraph):
+        super().__init__(
+            source_vs=source_vs, cutoff=cutoff, node_stops=GRAPH_OBJ.node_stop_idx,
+            walk_arrival_edges=GRAPH_OBJ.walk_arrival_edges, track_walk_arrivals=True,
+        )
+        self.settled = []
+        self.pred_modes = {}
+
+    def discover_vertex(self, v: int, score: float):
+        super().discover_vertex(v, score)
+        self.settled.append(v)
+
+    def edge_relaxed(self, edge):
+        super().edge_relaxed(edge)
+        self.pred_modes[edge[1]] = edge[2].mode
+
+
+def _get_departure_nodes(GRAPH_OBJ: GTFSGraph, stop_id: str, depart_window: tuple[float, float]) -> list[int]:
+    # time nodes of the stop with a trip or a walk leaving (other nodes can only wait)
+    node_ids = []
+    __, stop_node_ids = GRAPH_OBJ.get_stop_nodes(stop_id, depart_window[0], depart_window[1])
+    for nid in stop_node_ids:
+        modes = [getattr(e, "mode", None) for __, __, e in GRAPH_OBJ.G.out_edges(nid)]
+        if EdgeMode.TRIP in modes or EdgeMode.WALK in modes:
+            node_ids.append(nid)
+    return node_ids
+
+
+def _transfer_patterns_task(stop_id: str) -> tuple[np.ndarray, ...]:
+    # runs in a worker: patterns and legs of all optimal paths from one origin stop
+    state = get_worker_state()
+    GRAPH_OBJ: GTFSGraph = state["graph"]
+    node_stop_idx, node_tod = GRAPH_OBJ.get_node_arrays()
+    node_stop_idx, node_tod = node_stop_idx.tolist(), node_tod.tolist()
+    walk_arrival_edges = GRAPH_OBJ.walk_arrival_edges
+    orig = GRAPH_OBJ.stop_idx_map[stop_id]
+
+    # prefix tree of stops: (parent, stop) -> tree node
+    tree = {}
+    tp_stop, tp_parent, tp_end = [orig], [-1], [False]
+    legs = {}  # (from node, to node) -> (to stop, min. cost, wait at the end)
+
+    def child(k: int, stop: int) -> int:
+        if (k, stop) not in tree:
+            tree[(k, stop)] = len(tp_stop)
+            tp_stop.append(stop)
+            tp_parent.append(k)
+            tp_end.append(False)
+        return tree[(k, stop)]
+
+    def add_leg(u: int, v: int, cost: float) -> None:
+        if (u, v) not in legs or cost < legs[(u, v)][1]:
+            # a walk to the next departure waits at the end (see GTFSGraph.walk_arrival_edges)
+            wait_t = cost - walk_arrival_edges[(u, v)] if (u, v) in walk_arrival_edges else 0.0
+            legs[(u, v)] = (node_stop_idx[v], cost, wait_t)
+
+    for source in _get_departure_nodes(GRAPH_OBJ, stop_id, state["depart_window"]):
+        visitor = _PatternVisitor(source_vs=[source], cutoff=state["cutoff"], GRAPH_OBJ=GRAPH_OBJ)
+        rx.digraph_dijkstra_search(GRAPH_OBJ.G, [source], weight_fn=lambda x: x.total_t, visitor=visitor)
+        preds, modes, costs = visitor.predecessors, visitor.pred_modes, visitor.all_costs
+
+        # first time node settled at each stop, or a walk arriving at the stop before it,
+        # and the nodes on the paths to them
+        first = {}
+        for v in visitor.settled:
+            if v < len(node_tod) and node_tod[v] >= 0 and node_stop_idx[v] not in first:
+                first[node_stop_idx[v]] = v
+        first_walks = {
+            stop: (u, v) for stop, (cost, u, v) in visitor.walk_arrivals.items()
+            if cost <= state["cutoff"] and (stop not in first or cost < costs[first[stop]])
+        }
+        on_path = set()
+        for v in list(first.values()) + [u for u, __ in first_walks.values()]:
+            while v is not None and v not in on_path:
+                on_path.add(v)
+                v = preds[v]
+
+        # cut the paths into legs (in the order nodes are settled, parents first)
+        at_stop = {source: 0}  # node -> tree node, if the path is at the stop (not riding)
+        ride_start = {}  # node -> node the ride started at
+
+        def close(v: int) -> int:
+            # the tree node of a path ending at node v (a ride ends here)
+            if v not in at_stop:
+                u = ride_start[v]
+                at_stop[v] = child(at_stop[u], node_stop_idx[v])
+                add_leg(u, v, costs[v] - costs[u])
+            return at_stop[v]
+
+        for v in visitor.settled:
+            if v not in on_path or v == source:
+                continue
+            u, mode = preds[v], modes[v]
+            if mode == EdgeMode.TRIP:
+                ride_start[v] = ride_start.get(u, u)
+            elif mode == EdgeMode.WAIT:
+                at_stop[v] = close(u)
+            elif mode == EdgeMode.WALK:
+                at_stop[v] = child(close(u), node_stop_idx[v])
+                add_leg(u, v, costs[v] - costs[u])
+        for stop, v in first.items():
+            if stop != orig and stop not in first_walks:
+                tp_end[close(v)] = True
+        for stop, (u, v) in first_walks.items():
+            if stop != orig:
+                tp_end[child(close(u), stop)] = True
+                add_leg(u, v, GRAPH_OBJ.G.get_edge_data(u, v).total_t)
+
+    leg_keys = list(legs.keys())
+    return (
+        np.asarray(tp_stop, dtype="int32"),
+        np.asarray(tp_parent, dtype="int32"),
+        np.asarray(tp_end, dtype="bool"),
+        np.asarray([u for u, __ in leg_keys], dtype="int64").reshape(-1),
+        np.asarray([v for __, v in leg_keys], dtype="int32").reshape(-1),
+        np.asarray([legs[key][0] for key in leg_keys], dtype="int32").reshape(-1),
+        np.asarray([legs[key][1] for key in leg_keys], dtype="float64").reshape(-1),
+        np.asarray([legs[key][2] for key in leg_keys], dtype="float64").reshape(-1),
+    )
+
+
+def compute_transfer_patterns(
+        GRAPH_OBJ: GTFSGraph,
+        cutoff: float = 120,  # max. travel time (minutes)
+        depart_window: tuple[float, float] = (0, 1440),  # departure times of the queries
+        stop_ids: list[str] | None = None,  # origins (default: all stops with time nodes)
+        max_workers: int | None = None,
+) -> TransferPatterns:
+    """
+        Offline preprocessing, in parallel over the origin stops. Departure nodes up to
+        the cutoff after the window are searched, paths may wait beyond the window.
+    """
+    if stop_ids is None:
+        stop_ids = GRAPH_OBJ.get_served_stop_ids()
+    state = {
+        "graph": GRAPH_OBJ,
+        "cutoff": cutoff,
+        "depart_window": (depart_window[0], depart_window[1] + cutoff),
+    }
+    results = parallel_map(_transfer_patterns_task, stop_ids, state=state, max_workers=max_workers)
+
+    # prefix trees concatenated in the order of the integer stop ids
+    num_stops = len(GRAPH_OBJ.stop_ids)
+    trees = {GRAPH_OBJ.stop_idx_map[sid]: res[:3] for sid, res in zip(stop_ids, results)}
+    empty = (np.zeros(0, dtype="int32"), np.zeros(0, dtype="int32"), np.zeros(0, dtype="bool"))
+    trees = [trees.get(s, empty) for s in range(num_stops)]
+    tp_offsets = np.concatenate([[0], np.cumsum([len(tree[0]) for tree in trees])]).astype("int64")
+
+    # connections of all origins: the min. cost of each (from, to) node pair
+    node_stop_idx, node_tod = GRAPH_OBJ.get_node_arrays()
+    conn_from, conn_to_node, conn_to_stop, conn_cost, conn_wait = (
+        np.concatenate([res[k] for res in results] + [np.zeros(0, dtype=dtype)])
+        for k, dtype in zip(range(3, 8), ["int64", "int32", "int32", "float64", "float64"])
+    )
+    order = np.lexsort((conn_cost, conn_to_node, conn_to_stop, conn_from))
+    conn_from, conn_to_node, conn_to_stop, conn_cost, conn_wait = (
+        arr[order] for arr in (conn_from, conn_to_node, conn_to_stop, conn_cost, conn_wait)
+    )
+    keep = np.ones(len(order), dtype="bool")
+    keep[1:] = (conn_from[1:] != conn_from[:-1]) | (conn_to_node[1:] != conn_to_node[:-1])
+    conn_from, conn_to_node, conn_to_stop, conn_cost, conn_wait = (
+        arr[keep] for arr in (conn_from, conn_to_node, conn_to_stop, conn_cost, conn_wait)
+    )
+    num_nodes = len(node_stop_idx)
+
+    # time nodes of each stop, sorted by time
+    is_time_node = np.flatnonzero((node_stop_idx >= 0) & (node_tod >= 0))
+    order = np.lexsort((node_tod[is_time_node], node_stop_idx[is_time_node]))
+    stop_nodes = is_time_node[order]
+
+    return TransferPatterns(
+        network_id=GRAPH_OBJ.network_id,
+        stop_ids=np.asarray(GRAPH_OBJ.stop_ids).astype(str),
+        cutoff=float(cutoff),
+        depart_window=np.asarray(depart_window, dtype="float64"),
+        tp_offsets=tp_offsets,
+        tp_stop=np.concatenate([tree[0] for tree in trees]).astype("int32"),
+        tp_parent=np.concatenate([tree[1] for tree in trees]).astype("int32"),
+        tp_end=np.concatenate([tree[2] for tree in trees]).astype("bool"),
+        conn_offsets=np.searchsorted(conn_from, np.arange(num_nodes + 1)).astype("int64"),
+        conn_to_stop=conn_to_stop.astype("int32"),
+        conn_to_node=conn_to_node.astype("int32"),
+        conn_cost=conn_cost.astype("float64"),
+        conn_wait=conn_wait.astype("float64"),
+        node_offsets=np.searchsorted(node_stop_idx[stop_nodes], np.arange(num_stops + 1)).astype("int64"),
+        stop_nodes=stop_nodes.astype("int32"),
+        stop_node_tods=node_tod[stop_nodes].astype("float64"),
+    )
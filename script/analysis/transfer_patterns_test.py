@@ -0,0 +1,52 @@
+"""
+Test to safeguard the transfer patterns...
+"""
+import numpy as np
+
+from script.analysis.transfer_patterns import (
+    TransferPatterns, compute_transfer_patterns, get_transfer_patterns_path
+)
+from script.GTFSGraph import GTFSGraph, GTFSEdge, EdgeMode
+from script.graph_test import get_ab_neighbors
+
+
+def get_three_stops_graph() -> GTFSGraph:
+    # stops A and B 0.1 mile apart, trips A 10 -> C 30 and B 20 -> C 25
+    g = GTFSGraph()
+    g.add_skeleton_nodes(stop_dict={"stop_id": "A"}, times_info=[10, 20])
+    g.add_skeleton_nodes(stop_dict={"stop_id": "B"}, times_info=[10, 20])
+    for name_a, stop_b, tod_b in [("A_10", "C", 30), ("B_20", "C", 25)]:
+        node_a = g.nodes_name_map[name_a]
+        node_b = g.query_node_or_create(stop_id=stop_b, tod=tod_b)
+        trip_t = tod_b - g.node_tod[node_a]
+        g.add_edge(node_a, node_b, GTFSEdge(node_a, node_b, trip_t=trip_t, wait_t=0, walk_t=0, mode=EdgeMode.TRIP))
+    nei = get_ab_neighbors()
+    g.add_edges_walkable_stops(stops_b=nei, walk_speed=1)
+    g.add_edges_within_same_stops()
+    return g
+
+
+def test_earliest_arrival(tmp_path):
+    g = get_three_stops_graph()
+    tp = compute_transfer_patterns(g, cutoff=60, max_workers=1)
+    # A -> C: walk to B (6 min) and take the trip at 20 rather than the trip at 10
+    assert tp.num_patterns > 0
+    assert tp.earliest_arrival("A", "C", 5) == 25
+    assert tp.earliest_arrival("A", "C", 12) == np.inf
+    assert tp.earliest_arrival("B", "C", 12) == 25
+    assert tp.earliest_arrival("A", "B", 12) == 26  # walk from the node A_20
+    assert tp.earliest_arrival("C", "A", 12) == np.inf
+    assert tp.earliest_arrival("A", "A", 12) == 12
+
+    # same travel times as the search of the whole network
+    for orig, dest in [("A", "C"), ("B", "C"), ("A", "B"), ("B", "A")]:
+        for depart_min in [5, 10, 12, 20]:
+            __, cost = g.query_od_stops_time([orig], [dest], depart_min, cutoff=1000, return_costs=True)
+            expected = np.inf if cost is None else depart_min + cost
+            assert np.isclose(tp.earliest_arrival(orig, dest, depart_min), expected)
+
+    pth = get_transfer_patterns_path(str(tmp_path), g.network_id)
+    tp.save(pth)
+    tp2 = TransferPatterns.load(pth)
+    assert tp2.network_id == g.network_id and tp2.num_connections == tp.num_connections
+    assert tp2.earliest_arrival("A", "C", 5) == 25
@@ -0,0 +1,107 @@
+"""
+Raster travel-time surface: an alternative to the polygon isochrones.
+Reached stops are spread onto a metric grid (web mercator, EPSG:3857), where each
+cell holds min over stops of (arrival time + walking distance / walking speed).
+All isochrone bands come from the same surface by thresholding.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import geopandas as gpd
+
+
+METER_PER_MILE = 1609.34
+
+
+@dataclass
+class TravelTimeSurface:
+    times: np.ndarray  # (num. of rows, num. of cols) in minutes, inf if not reachable; row 0 is north
+    x0: float  # west edge (EPSG:3857)
+    y0: float  # north edge (EPSG:3857)
+    cell: float  # cell size in EPSG:3857 units
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.times.shape
+
+    def bounds_3857(self) -> tuple[float, float, float, float]:
+        ny, nx = self.shape
+        return self.x0, self.y0 - ny * self.cell, self.x0 + nx * self.cell, self.y0
+
+    def bounds_latlon(self) -> list[list[float]]:
+        # [[south, west], [north, east]] as used by folium
+        minx, miny, maxx, maxy = self.bounds_3857()
+        corners = gpd.GeoSeries(gpd.points_from_xy([minx, maxx], [miny, maxy]), crs="epsg:3857")
+        corners = corners.to_crs("epsg:4326")
+        return [[corners.y[0], corners.x[0]], [corners.y[1], corners.x[1]]]
+
+    def band_index(self, acc_times: list[float]) -> np.ndarray:
+        # index of the first band (time budget) covering each cell, -1 if none
+        acc_times = np.sort(np.asarray(acc_times, dtype="float64"))
+        idx = np.searchsorted(acc_times, self.times, side="left")
+        idx[idx >= len(acc_times)] = -1
+        return idx
+
+    def to_rgba(self, acc_times: list[float], colors: list[tuple]) -> np.ndarray:
+        # colors[k] is the (r, g, b, a) float tuple of the k-th smallest time budget
+        palette = np.vstack([np.asarray(colors, dtype="float64"), [0, 0, 0, 0]])
+        rgba = palette[self.band_index(acc_times)]  # -1 picks the transparent color
+        return (rgba * 255).round().astype("uint8")
+
+    def save(self, pth: str) -> None:
+        np.savez_compressed(pth, times=self.times.astype("float32"), origin=[self.x0, self.y0, self.cell])
+
+    @classmethod
+    def load(cls, pth: str) -> "TravelTimeSurface":
+        data = np.load(pth)
+        x0, y0, cell = data["origin"].tolist()
+        return cls(times=data["times"], x0=x0, y0=y0, cell=cell)
+
+
+def compute_travel_time_surface(
+        stops_gdf: gpd.GeoDataFrame,  # reached stops with the "acc_time" column
+        max_time: float,
+        walking_speed: float = 1,  # mph
+        cell_m: float = 100,  # cell size in meters (on the ground)
+        max_cells: int = 4_000_000,
+) -> TravelTimeSurface:
+    stops_gdf = stops_gdf.to_crs("epsg:3857")
+    acc = stops_gdf["acc_time"].to_numpy().astype("float64")
+    keep = acc < max_time
+    xs = stops_gdf.geometry.x.to_numpy()[keep]
+    ys = stops_gdf.geometry.y.to_numpy()[keep]
+    acc = acc[keep]
+
+    # web mercator stretches ground distances by 1 / cos(lat)
+    lat0 = np.deg2rad(stops_gdf.to_crs("epsg:4326").geometry.y.mean()) if len(stops_gdf) else 0.0
+    scale = 1 / np.cos(lat0)
+    speed = walking_speed * METER_PER_MILE / 60 * scale  # mercator units per minute
+    radii = (max_time - acc) * speed
+
+    if len(acc) == 0:
+        return TravelTimeSurface(times=np.full((1, 1), np.inf), x0=0.0, y0=0.0, cell=cell_m * scale)
+
+    # grid covering every walking disk, coarsened if too large
+    minx, maxx = (xs - radii).min(), (xs + radii).max()
+    miny, maxy = (ys - radii).min(), (ys + radii).max()
+    cell = cell_m * scale
+    cell = max(cell, np.sqrt((maxx - minx) * (maxy - miny) / max_cells))
+    nx = int(np.ceil((maxx - minx) / cell))
+    ny = int(np.ceil((maxy - miny) / cell))
+    cx = minx + (np.arange(nx) + 0.5) * cell
+    cy = maxy - (np.arange(ny) + 0.5) * cell  # north to south
+
+    # each stop only updates the window of cells around its walking disk,
+    # time = arrival + walk (outside the disk the time exceeds max_time)
+    times = np.full((ny, nx), np.inf)
+    col_lo = np.floor((xs - radii - minx) / cell).clip(0, nx).astype("int64")
+    col_hi = np.ceil((xs + radii - minx) / cell).clip(0, nx).astype("int64")
+    row_lo = np.floor((maxy - ys - radii) / cell).clip(0, ny).astype("int64")
+    row_hi = np.ceil((maxy - ys + radii) / cell).clip(0, ny).astype("int64")
+    for i in range(len(acc)):
+        dx = cx[col_lo[i]:col_hi[i]] - xs[i]
+        dy = cy[row_lo[i]:row_hi[i]] - ys[i]
+        window = times[row_lo[i]:row_hi[i], col_lo[i]:col_hi[i]]
+        np.minimum(window, acc[i] + np.hypot(dy[:, None], dx[None, :]) / speed, out=window)
+    times[times > max_time] = np.inf
+    return TravelTimeSurface(times=times, x0=minx, y0=maxy, cell=cell)
@@ -0,0 +1,46 @@
+"""
+Test to safeguard the raster travel-time surface...
+"""
+import numpy as np
+import pandas as pd
+
+import script.analysis.geo_analysis as geo_analysis
+from script.analysis.travel_time_surface import TravelTimeSurface, compute_travel_time_surface
+
+
+def get_stops_gdf():
+    stops = pd.DataFrame({
+        "stop_id": ["A", "B"],
+        "stop_lat": [36.0, 36.05],
+        "stop_lon": [-84.0, -84.0],
+        "acc_time": [0.0, 15.0],
+    })
+    return geo_analysis.get_stops_gdf(stops)
+
+
+def test_surface_matches_polygons():
+    stops_gdf = get_stops_gdf()
+    acc_times = [10, 20, 30]
+    surface = compute_travel_time_surface(stops_gdf, max_time=30, walking_speed=3, cell_m=20)
+    assert surface.times.min() >= 0
+    assert np.isinf(surface.times).any()
+    # band areas agree with the polygon isochrones (cells are 20 m on the ground)
+    bands = geo_analysis.get_buffer_geoms(stops_gdf, acc_times, walking_speed=3)
+    bands = bands.to_crs(bands.estimate_utm_crs())
+    cell_area = (surface.cell * np.cos(np.deg2rad(36.025))) ** 2
+    for i, t in enumerate(acc_times):
+        raster_area = (surface.times <= t).sum() * cell_area
+        assert abs(raster_area - bands[i].area) / bands[i].area < 0.02
+
+
+def test_band_index_and_save(tmp_path):
+    surface = compute_travel_time_surface(get_stops_gdf(), max_time=30, walking_speed=3, cell_m=50)
+    idx = surface.band_index([30, 10, 20])
+    assert set(np.unique(idx)) == {-1, 0, 1, 2}
+    rgba = surface.to_rgba([10, 20, 30], [(1, 0, 0, 1), (0, 1, 0, 1), (0, 0, 1, 1)])
+    assert rgba.shape == surface.shape + (4,)
+    assert (rgba[idx == -1] == 0).all()
+    surface.save(tmp_path / "surface.npz")
+    loaded = TravelTimeSurface.load(tmp_path / "surface.npz")
+    assert loaded.shape == surface.shape
+    assert loaded.bounds_latlon() == surface.bounds_latlon()
@@ -0,0 +1,156 @@
+"""
+A compiled (array-based) representation of one GTFS feed.
+Stops/trips/routes/services get dense int32 ids, stop_times become sorted arrays,
+and everything can be saved to (and memory-mapped from) a folder of .npy files.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# arrays saved as one .npy file each (ids are fixed-width unicode to be mmap-able)
+ID_ARRAYS = ["stop_ids", "trip_ids", "route_ids", "service_ids"]
+NUM_ARRAYS = [
+    "stop_lat", "stop_lon",  # per stop
+    "trip_route", "trip_service", "trip_offsets",  # per trip
+    "st_trip", "st_stop", "st_seq", "st_arr", "st_dep",  # per stop_times row
+]
+
+
+def parse_gtfs_minutes(times: pd.Series) -> np.ndarray:
+    # "HH:MM:SS" (hours can exceed 24) to float32 minutes of the day, NaN if missing
+    secs = pd.to_timedelta(times).dt.total_seconds().to_numpy()
+    return (secs / 60).astype("float32")
+
+
+def encode_ids(values, id_map: dict) -> np.ndarray:
+    # unknown ids are encoded as -1
+    return pd.Series(values).map(id_map).fillna(-1).to_numpy().astype("int32")
+
+
+class CompiledFeed:
+    def __init__(self, arrays: dict):
+        for name in ID_ARRAYS + NUM_ARRAYS:
+            setattr(self, name, arrays[name])
+        # id string -> dense integer id
+        self.stop_idx_map: dict = {sid: i for i, sid in enumerate(self.stop_ids.tolist())}
+        self.trip_idx_map: dict = {tid: i for i, tid in enumerate(self.trip_ids.tolist())}
+        self.route_idx_map: dict = {rid: i for i, rid in enumerate(self.route_ids.tolist())}
+        self.service_idx_map: dict = {sid: i for i, sid in enumerate(self.service_ids.tolist())}
+
+    @classmethod
+    def from_tables(
+            cls,
+            stops: pd.DataFrame,
+            trips: pd.DataFrame,
+            stop_times_chunks,  # a list/iterator of stop_times dataframes
+    ) -> "CompiledFeed":
+        # all ids are handled as strings
+        stop_ids = stops["stop_id"].astype(str).to_numpy()
+        trip_ids = trips["trip_id"].astype(str).to_numpy()
+        route_ids = pd.unique(trips["route_id"].astype(str).to_numpy())
+        service_ids = pd.unique(trips["service_id"].astype(str).to_numpy())
+
+        stop_idx_map = {sid: i for i, sid in enumerate(stop_ids)}
+        trip_idx_map = {tid: i for i, tid in enumerate(trip_ids)}
+        route_idx_map = {rid: i for i, rid in enumerate(route_ids)}
+        service_idx_map = {sid: i for i, sid in enumerate(service_ids)}
+
+        # encode stop_times chunk by chunk (works with streamed stop_times as well)
+        cols = {"st_trip": [], "st_stop": [], "st_seq": [], "st_arr": [], "st_dep": []}
+        for stop_times in stop_times_chunks:
+            cols["st_trip"].append(encode_ids(stop_times["trip_id"].astype(str), trip_idx_map))
+            cols["st_stop"].append(encode_ids(stop_times["stop_id"].astype(str), stop_idx_map))
+            cols["st_seq"].append(stop_times["stop_sequence"].to_numpy().astype("int32"))
+            cols["st_arr"].append(parse_gtfs_minutes(stop_times["arrival_time"]))
+            cols["st_dep"].append(parse_gtfs_minutes(stop_times["departure_time"]))
+        cols = {
+            k: np.concatenate(v) if len(v) > 0 else np.zeros(0, dtype="int32")
+            for k, v in cols.items()
+        }
+        # drop rows of unknown trips/stops, then sort by (trip, stop_sequence)
+        valid = (cols["st_trip"] >= 0) & (cols["st_stop"] >= 0)
+        order = np.lexsort((cols["st_seq"][valid], cols["st_trip"][valid]))
+        cols = {k: v[valid][order] for k, v in cols.items()}
+
+        arrays = {
+            "stop_ids": stop_ids.astype("U"),
+            "trip_ids": trip_ids.astype("U"),
+            "route_ids": route_ids.astype("U"),
+            "service_ids": service_ids.astype("U"),
+            "stop_lat": stops["stop_lat"].to_numpy().astype("float64"),
+            "stop_lon": stops["stop_lon"].to_numpy().astype("float64"),
+            "trip_route": encode_ids(trips["route_id"].astype(str), route_idx_map),
+            "trip_service": encode_ids(trips["service_id"].astype(str), service_idx_map),
+            # rows of trip i are st_*[trip_offsets[i]:trip_offsets[i + 1]]
+            "trip_offsets": np.searchsorted(cols["st_trip"], np.arange(len(trip_ids) + 1)).astype("int64"),
+            **cols,
+        }
+        return cls(arrays)
+
+    @classmethod
+    def from_controller(cls, GTFS_OBJ, trip_ids: list | None = None) -> "CompiledFeed":
+        # trip_ids: only read the stop times of these trips when streamed
+        # (peak memory then scales with the selected trips, not the whole file)
+        if "stop_times.txt" in GTFS_OBJ.dfs:
+            chunks = [GTFS_OBJ.dfs["stop_times.txt"]]
+        else:  # stop_times is streamed
+            chunks = GTFS_OBJ.iter_stop_times(trip_ids=trip_ids)
+        return cls.from_tables(GTFS_OBJ.dfs["stops.txt"], GTFS_OBJ.dfs["trips.txt"], chunks)
+
+    def save(self, folder: str) -> None:
+        os.makedirs(folder, exist_ok=True)
+        for name in ID_ARRAYS + NUM_ARRAYS:
+            np.save(os.path.join(folder, f"{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, folder: str, mmap_mode: str | None = "r") -> "CompiledFeed":
+        arrays = {
+            name: np.load(os.path.join(folder, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ID_ARRAYS + NUM_ARRAYS
+        }
+        return cls(arrays)
+
+    @property
+    def num_stops(self) -> int:
+        return len(self.stop_ids)
+
+    @property
+    def num_trips(self) -> int:
+        return len(self.trip_ids)
+
+    def encode_stops(self, stop_ids) -> np.ndarray:
+        return encode_ids(np.asarray(stop_ids).astype(str), self.stop_idx_map)
+
+    def decode_stops(self, stop_idxs) -> np.ndarray:
+        return self.stop_ids[np.asarray(stop_idxs)]
+
+    def encode_services(self, service_ids) -> np.ndarray:
+        return encode_ids(np.asarray(list(service_ids)).astype(str), self.service_idx_map)
+
+    def trip_mask_by_services(self, service_ids) -> np.ndarray:
+        # boolean mask over trips running any of the given services
+        return np.isin(self.trip_service, self.encode_services(service_ids))
+
+    def stop_times_mask_by_trips(self, trip_mask: np.ndarray) -> np.ndarray:
+        # boolean mask over the (sorted) stop_times rows of the selected trips
+        return trip_mask[self.st_trip]
+
+    def get_hops(self, trip_mask: np.ndarray | None = None, return_trips: bool = False) -> tuple[np.ndarray, ...]:
+        """
+            Consecutive stop pairs of the same trip, (stop_i, stop_j, t_i, t_j),
+            using arrival times; rows without times are skipped.
+            With return_trips, the integer trip id of each hop is appended
+        """
+        keep = ~np.isnan(self.st_arr) & ~np.isnan(self.st_dep)
+        if trip_mask is not None:
+            keep &= self.stop_times_mask_by_trips(trip_mask)
+        trips = self.st_trip[keep]
+        stops = self.st_stop[keep]
+        arr_ts = self.st_arr[keep].astype("float64")
+        same_trip = trips[:-1] == trips[1:]
+        hops = (stops[:-1][same_trip], stops[1:][same_trip], arr_ts[:-1][same_trip], arr_ts[1:][same_trip])
+        if return_trips:
+            return hops + (trips[:-1][same_trip],)
+        return hops
@@ -0,0 +1,57 @@
+"""
+Test to safeguard the compiled feed behaviors...
+"""
+import numpy as np
+import pandas as pd
+
+from script.compiled_feed import CompiledFeed
+
+
+def get_feed_tables():
+    stops = pd.DataFrame({
+        "stop_id": ["A", "B", "C"],
+        "stop_lat": [36.0, 36.01, 36.02],
+        "stop_lon": [-84.0, -84.0, -84.0],
+    })
+    trips = pd.DataFrame({
+        "trip_id": [101, 102],
+        "route_id": ["R1", "R1"],
+        "service_id": [0, 1],
+    })
+    stop_times = pd.DataFrame([
+        # trip_id, arrival_time, departure_time, stop_id, stop_sequence
+        [102, "08:10:00", "08:10:00", "A", 1],
+        [101, "08:05:00", "08:05:00", "B", 2],  # rows are not sorted in the file
+        [101, "08:00:00", "08:00:00", "A", 1],
+        [101, "25:10:30", "25:10:30", "C", 3],  # after midnight
+        [102, "08:20:00", "08:20:00", "C", 2],
+    ])
+    stop_times.columns = ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"]
+    return stops, trips, stop_times
+
+
+def test_from_tables():
+    feed = CompiledFeed.from_tables(*get_feed_tables()[:2], [get_feed_tables()[2]])
+    assert feed.stop_ids.tolist() == ["A", "B", "C"]
+    assert feed.trip_ids.tolist() == ["101", "102"]
+    assert feed.st_trip.tolist() == [0, 0, 0, 1, 1]
+    assert feed.st_stop.tolist() == [0, 1, 2, 0, 2]
+    assert feed.st_arr.tolist() == [480, 485, 1510.5, 490, 500]
+    assert feed.trip_offsets.tolist() == [0, 3, 5]
+    assert feed.encode_stops(["C", "X"]).tolist() == [2, -1]
+
+    # hops of the trips running service "1" only
+    trip_mask = feed.trip_mask_by_services([1])
+    stop_i, stop_j, t_i, t_j = feed.get_hops(trip_mask)
+    assert stop_i.tolist() == [0] and stop_j.tolist() == [2]
+    assert t_i.tolist() == [490] and t_j.tolist() == [500]
+
+
+def test_save_and_load(tmp_path):
+    feed = CompiledFeed.from_tables(*get_feed_tables()[:2], [get_feed_tables()[2]])
+    feed.save(str(tmp_path))
+    feed_mm = CompiledFeed.load(str(tmp_path))
+    assert isinstance(feed_mm.st_arr, np.memmap)
+    assert feed_mm.stop_idx_map == feed.stop_idx_map
+    assert np.array_equal(feed_mm.st_stop, feed.st_stop)
+    assert np.array_equal(feed_mm.trip_offsets, feed.trip_offsets)
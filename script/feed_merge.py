@@ -0,0 +1,151 @@
+"""
+Merge several GTFS feeds (agencies) into one regional network...
+"""
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import script.graph_pipeline as gtfs_pipeline
+from script.GTFSGraph import GTFSGraph
+from script.gtfs_controller import (
+    GTFSController, create_feed_view, configure_graph, add_network_stops, finish_network
+)
+
+
+# id columns of each table, prefixed by the feed name to avoid collisions between agencies
+ID_COLUMNS = {
+    "agency.txt": ["agency_id"],
+    "stops.txt": ["stop_id", "parent_station"],
+    "routes.txt": ["route_id", "agency_id"],
+    "trips.txt": ["trip_id", "route_id", "service_id", "block_id", "shape_id"],
+    "stop_times.txt": ["trip_id", "stop_id"],
+    "calendar.txt": ["service_id"],
+    "calendar_dates.txt": ["service_id"],
+    "shapes.txt": ["shape_id"],
+    "transfers.txt": ["from_stop_id", "to_stop_id", "from_route_id", "to_route_id",
+                      "from_trip_id", "to_trip_id"],
+    "frequencies.txt": ["trip_id"],
+    "fare_attributes.txt": ["fare_id", "agency_id"],
+    "fare_rules.txt": ["fare_id", "route_id"],
+}
+
+
+def namespace_ids(ids: pd.Series, feed_name: str) -> pd.Series:
+    # e.g., "7006709" -> "TN_Knoxville:7006709" (missing values are kept)
+    return (feed_name + ":" + ids.astype(str)).where(ids.notna())
+
+
+def namespace_feed(dfs: dict, feed_name: str) -> dict:
+    # a copy of the tables with all ids prefixed by the feed name
+    # (tables not in ID_COLUMNS, e.g. "feed_info.txt", are copied as they are)
+    ns_dfs = {}
+    for fn, df in dfs.items():
+        df = df.copy()
+        for col in ID_COLUMNS.get(fn, []):
+            if col in df.columns:
+                df[col] = namespace_ids(df[col], feed_name)
+        ns_dfs[fn] = df
+    return ns_dfs
+
+
+def load_feeds(
+        root_dirs: list[str],
+        max_workers: int | None = None,
+) -> tuple[dict[str, GTFSController], dict[str, float]]:
+    # load feed folders concurrently (csv parsing is mostly done outside the GIL)
+    def load_one(root_dir):
+        t0 = time.perf_counter()
+        obj = GTFSController(root_dir=root_dir)
+        return obj, time.perf_counter() - t0
+
+    names = [os.path.basename(os.path.normpath(d)) for d in root_dirs]
+    with ThreadPoolExecutor(max_workers=max_workers or len(root_dirs)) as pool:
+        results = list(pool.map(load_one, root_dirs))
+    controllers = {name: obj for name, (obj, __) in zip(names, results)}
+    load_times = {name: t for name, (__, t) in zip(names, results)}
+    return controllers, load_times
+
+
+def merge_feeds(controllers: dict[str, GTFSController]) -> GTFSController:
+    # concatenate namespaced tables of all feeds into one controller
+    # (a table found in some feeds only is the concatenation of those feeds)
+    tables = {}
+    for feed_name, obj in controllers.items():
+        for fn, df in namespace_feed(obj.dfs, feed_name).items():
+            tables.setdefault(fn, []).append(df)
+    dfs = {fn: pd.concat(lst, ignore_index=True) for fn, lst in tables.items()}
+    merged = GTFSController(
+        root_dir=",".join(obj.root_dir for obj in controllers.values()),
+        dfs=dfs,
+    )
+    merged.feed_names = list(controllers.keys())
+    return merged
+
+
+# like build_network, with trip edges added (and timed) feed by feed
+def build_merged_network(
+        network_config_info,
+        GTFS_OBJ: GTFSController,
+        GRAPH_OBJ: GTFSGraph,
+) -> tuple[GTFSGraph, pd.DataFrame, dict[str, float]]:
+    service_ids = network_config_info["service_id"]
+    build_times = {}
+    configure_graph(network_config_info, GTFS_OBJ, GRAPH_OBJ)
+
+    feed_view = create_feed_view(GTFS_OBJ, list(service_ids))
+    feed = GTFS_OBJ.get_compiled_feed(service_ids)
+    GRAPH_OBJ.set_stop_ids(feed.stop_ids.tolist())
+    trip_mask = feed.trip_mask_by_services(service_ids)
+
+    # cross-agency stops are connected by the walking-neighbor search over all stops
+    t0 = time.perf_counter()
+    stops, stop_neighbors = add_network_stops(network_config_info, GRAPH_OBJ, feed_view.stops)
+    build_times["stops"] = time.perf_counter() - t0
+
+    trip_feeds = pd.Series(feed.trip_ids).str.split(":", n=1).str[0].to_numpy()
+    for feed_name in GTFS_OBJ.feed_names:
+        t0 = time.perf_counter()
+        gtfs_pipeline.add_edges_compiled_stop_times(
+            feed, GRAPH_OBJ, trip_mask & (trip_feeds == feed_name)
+        )
+        build_times[feed_name] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    finish_network(network_config_info, GTFS_OBJ, GRAPH_OBJ, stop_neighbors)  # transfers and optional steps
+    build_times["transfers"] = time.perf_counter() - t0
+    return GRAPH_OBJ, stops, build_times
+
+
+def load_and_build_merged_network(
+        root_dirs: list[str],
+        the_date,
+        bw_mile: float = 0.25,
+        walk_speed: float = 2,
+        max_workers: int | None = None,
+) -> tuple[GTFSGraph, pd.DataFrame, pd.DataFrame]:
+    """
+        Load feeds in parallel, merge them and build one network for the date.
+        Returns the graph, the stops, and a table of timings (seconds) per feed
+    """
+    controllers, load_times = load_feeds(root_dirs, max_workers=max_workers)
+    t0 = time.perf_counter()
+    merged = merge_feeds(controllers)
+    merge_time = time.perf_counter() - t0
+
+    network_config_info = {
+        "date": the_date,
+        "bw_mile": bw_mile,
+        "walk_speed": walk_speed,
+        "service_id": merged.get_service_ids_by_date(the_date),
+    }
+    GRAPH_OBJ, stops, build_times = build_merged_network(network_config_info, merged, GTFSGraph())
+
+    timings = pd.DataFrame({
+        "load": pd.Series(load_times),
+        "build": pd.Series({name: build_times[name] for name in merged.feed_names}),
+    })
+    timings.loc["(merged)", "load"] = merge_time
+    timings.loc["(merged)", "build"] = build_times["stops"] + build_times["transfers"]
+    return GRAPH_OBJ, stops, timings
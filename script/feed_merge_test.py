@@ -0,0 +1,81 @@
+"""
+Test to safeguard the feed merging behaviors...
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from script.GTFSGraph import GTFSGraph
+from script.gtfs_controller import build_network
+from script.gtfs_controller_test import write_feed, get_streamed_feed_tables
+from script.feed_merge import load_feeds, merge_feeds, build_merged_network
+
+THE_DATE = datetime.date(2024, 3, 4)
+
+
+def write_two_feeds(tmp_path) -> list[str]:
+    # two feeds with the same stop, trip and service ids, far apart from each other
+    root_dirs = []
+    for feed_name, lat_shift in [("north", 1.0), ("south", 0.0)]:
+        stops, trips, stop_times = get_streamed_feed_tables()
+        stops["stop_lat"] += lat_shift
+        write_feed(tmp_path / feed_name, stops, trips, stop_times)
+        pd.DataFrame({"feed_publisher_name": [feed_name]}).to_csv(tmp_path / feed_name / "feed_info.txt", index=False)
+        root_dirs.append(str(tmp_path / feed_name))
+    return root_dirs
+
+
+def test_merge_feeds(tmp_path):
+    controllers, __ = load_feeds(write_two_feeds(tmp_path), max_workers=1)
+    merged = merge_feeds(controllers)
+    assert merged.feed_names == ["north", "south"]
+
+    # ids are prefixed by the feed name: no collisions
+    stops, trips = merged.dfs["stops.txt"], merged.dfs["trips.txt"]
+    assert stops["stop_id"].tolist() == ["north:A", "north:B", "north:C", "south:A", "south:B", "south:C"]
+    assert trips["trip_id"].is_unique and len(trips) == 8
+    assert sorted(merged.get_service_ids_by_date(THE_DATE)) == ["north:0", "north:1", "south:0", "south:1"]
+
+    # foreign keys are rewritten the same way as the keys they refer to
+    stop_times = merged.dfs["stop_times.txt"]
+    assert stop_times["trip_id"].isin(trips["trip_id"]).all()
+    assert stop_times["stop_id"].isin(stops["stop_id"]).all()
+    assert trips["service_id"].isin(merged.dfs["calendar.txt"]["service_id"]).all()
+    assert trips.loc[trips["trip_id"] == "south:102", "service_id"].item() == "south:1"
+    assert set(stop_times.loc[stop_times["trip_id"] == "south:102", "stop_id"]) == {"south:A", "south:C"}
+
+    # tables without ids are carried through
+    assert merged.dfs["feed_info.txt"]["feed_publisher_name"].tolist() == ["north", "south"]
+
+
+def test_build_merged_network(tmp_path):
+    # each feed in the merged network has the travel times of its own network
+    root_dirs = write_two_feeds(tmp_path)
+    controllers, __ = load_feeds(root_dirs, max_workers=1)
+    merged = merge_feeds(controllers)
+    config = {"bw_mile": 1, "walk_speed": 2}
+    g_merged, __, build_times = build_merged_network(
+        {**config, "service_id": merged.get_service_ids_by_date(THE_DATE)}, merged, GTFSGraph()
+    )
+    assert set(build_times) == {"stops", "north", "south", "transfers"}
+
+    stops = ["A", "B", "C"]
+    for feed_name, obj in controllers.items():
+        g, __ = build_network(
+            {**config, "service_id": obj.get_service_ids_by_date(THE_DATE)}, obj, GTFSGraph()
+        )
+        for orig in stops:
+            for depart_min in [0, 10, 13]:
+                __, costs = g.query_origin_stop_time(None, orig, depart_min, cutoff=60)
+                __, costs_merged = g_merged.query_origin_stop_time(None, f"{feed_name}:{orig}", depart_min, cutoff=60)
+                stop_costs, __ = g.reduce_costs_by_stop(costs, access=g.get_origin_access(orig))
+                stop_costs_merged, __ = g_merged.reduce_costs_by_stop(
+                    costs_merged, access=g_merged.get_origin_access(f"{feed_name}:{orig}")
+                )
+                np.testing.assert_allclose(
+                    stop_costs_merged[g_merged.encode_stops([f"{feed_name}:{s}" for s in stops])],
+                    stop_costs[g.encode_stops(stops)],
+                )
+                # (the other feed is not reached)
+                assert np.isfinite(stop_costs_merged).sum() == np.isfinite(stop_costs).sum()
@@ -5,6 +5,7 @@ import numpy as np
 import pandas as pd
 
 from script.GTFSGraph import GTFSGraph, GTFSEdge, EdgeMode
+from script.compiled_feed import CompiledFeed
 
 
 # generate skeleton nodes over time-space for one stop
@@ -33,23 +34,25 @@ def generate_ts_edges(
         stop_times: pd.DataFrame,
         G_obj: GTFSGraph
 ) -> None:
-    stop_times['arrive_minute'] = pd.to_timedelta(stop_times['arrival_time']).dt.total_seconds() / 60
-    stop_times['departure_minute'] = pd.to_timedelta(stop_times['departure_time']).dt.total_seconds() / 60
+    # parse times into local arrays (the input stop_times is not modified)
+    arr_ts = pd.to_timedelta(stop_times['arrival_time']).dt.total_seconds().to_numpy() / 60
+    dep_ts = pd.to_timedelta(stop_times['departure_time']).dt.total_seconds().to_numpy() / 60
     # set time info to whole minute
-    stop_times['arrive_minute'] = stop_times['arrive_minute'].astype("float32")
-    stop_times['departure_minute'] = stop_times['departure_minute'].astype("float32")
-
-    stop_times = stop_times[~stop_times['arrive_minute'].isna()]
-    stop_times = stop_times[~stop_times['departure_minute'].isna()]
+    arr_ts = arr_ts.astype("float32")
+    dep_ts = dep_ts.astype("float32")
 
+    filt = ~np.isnan(arr_ts) & ~np.isnan(dep_ts)
     # ser_1trip_stops: trips stops of one trip_id
-    stop_ids = stop_times['stop_id'].tolist()
-    arr_ts = stop_times['arrive_minute'].tolist()
+    stop_ids = stop_times['stop_id'].to_numpy()[filt].tolist()
+    arr_ts = arr_ts[filt].tolist()
 
     for i in range(len(stop_ids) - 1):
         # stop names and arrival times
         stop_i, stop_j = stop_ids[i], stop_ids[i + 1]
         ti, tj = arr_ts[i], arr_ts[i + 1]
+        if G_obj.time_resolution > 1:
+            # the first departure rounded down, the arrivals up (see GTFSGraph.bucket_tod)
+            ti, tj = G_obj.bucket_tod(ti, round_up=i > 0), G_obj.bucket_tod(tj, round_up=True)
         # node ids
         start_nid = G_obj.query_node_or_create(stop_id=stop_i, tod=ti)
         end_nid = G_obj.query_node_or_create(stop_id=stop_j, tod=tj)
@@ -57,6 +60,8 @@ def generate_ts_edges(
         travel_time = tj - ti
         # only add edge if travel time is positive...
         if travel_time >= 0:
+            if G_obj.time_resolution > 1:  # between the time buckets
+                travel_time = G_obj.node_tod[end_nid] - G_obj.node_tod[start_nid]
             G_obj.add_edge(
                 node_a=start_nid, node_b=end_nid,
                 properties=GTFSEdge(
@@ -75,6 +80,57 @@ def add_edges_all_stop_times(
     stop_times.groupby(["trip_id"]).apply(generate_ts_edges, G_obj)
 
 
+# add all edges+nodes from the compiled feed arrays: a faster ingest path only, the nodes
+# are still keyed by string stop ids in the graph (integer ids are its side index)
+def add_edges_compiled_stop_times(
+        feed: CompiledFeed,
+        G_obj: GTFSGraph,
+        trip_mask: np.ndarray | None = None,  # selected trips (e.g., by service ids)
+) -> None:
+    stop_i, stop_j, t_i, t_j, hop_trip = feed.get_hops(trip_mask, return_trips=True)
+
+    # create all (stop, minute) nodes at once
+    stops_all = np.concatenate([stop_i, stop_j]).astype("int64")
+    tods_all = np.concatenate([t_i, t_j]).astype("int64")  # truncated to whole minutes
+    if G_obj.time_resolution > 1:
+        # arrivals rounded up, and the departures which don't continue from the arrival of
+        # the hop before of the same trip (the first stop of a trip) rounded down (see GTFSGraph.bucket_tod)
+        r = G_obj.time_resolution
+        continues = np.zeros(len(stop_i), dtype="bool")
+        continues[1:] = (stop_j[:-1] == stop_i[1:]) & (t_j[:-1] == t_i[1:])
+        continues[1:] &= hop_trip[:-1] == hop_trip[1:]  # (not a trip leaving where another ended)
+        round_up = np.concatenate([continues, np.ones(len(stop_j), dtype="bool")])
+        t_all = np.concatenate([t_i, t_j])
+        tods_all = np.where(round_up, np.ceil(t_all / r) * r, tods_all // r * r).astype("int64")
+    # (stop, minute) packed in one integer: the minute takes the low 20 bits
+    if len(tods_all) > 0 and (tods_all.min() < 0 or tods_all.max() >= 1 << 20):
+        raise ValueError(f"stop times out of range: {tods_all.min()} to {tods_all.max()} minutes")
+    keys, inverse = np.unique((stops_all << 20) + tods_all, return_inverse=True)
+    stop_ids = feed.stop_ids.tolist()
+    key_node_ids = np.array([
+        G_obj.query_node_or_create(stop_id=stop_ids[key >> 20], tod=key & 0xFFFFF)
+        for key in keys.tolist()
+    ], dtype="int64")
+    start_nids = key_node_ids[inverse[:len(stop_i)]].tolist()
+    end_nids = key_node_ids[inverse[len(stop_i):]].tolist()
+
+    # only add edge if travel time is positive...
+    travel_times = t_j - t_i
+    keep = np.flatnonzero(travel_times >= 0).tolist()
+    if G_obj.time_resolution > 1:  # between the time buckets
+        node_tods = np.asarray(G_obj.node_tod)
+        travel_times = node_tods[end_nids] - node_tods[start_nids]
+    travel_times = travel_times.tolist()
+    G_obj.add_edges([
+        GTFSEdge(
+            start_node=start_nids[k], end_node=end_nids[k],
+            trip_t=travel_times[k], wait_t=0, walk_t=0,
+            mode=EdgeMode.TRIP
+        )
+        for k in keep
+    ])
+
+
 # # visualize one stop'fs information over time
 # def plot_one_stop_over_time(G_subgraph):
 #     fig, ax = plt.subplots(1, 1, figsize=(40, 4))
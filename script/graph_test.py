@@ -2,9 +2,14 @@
 Test to safeguard the graph behaviors...
 """
 import pandas as pd
+import pytest
 import numpy as np
 
-from script.GTFSGraph import GTFSGraph, GTFSEdge, EdgeMode
+import script.graph_pipeline as gtfs_pipeline
+from script.compiled_feed import CompiledFeed
+from script.compiled_feed_test import get_feed_tables
+from script.GTFSGraph import GTFSGraph, GTFSEdge, EdgeMode, StopNeighbors, SearchWorkspace
+from script.analysis.transfer_patterns import compute_transfer_patterns
 
 
 def test_query_node_or_create():
@@ -19,6 +24,18 @@ def test_query_node_or_create():
     assert str(g.G.nodes()) == "[<A,100,A_100>, <B,200,B_200>, <C,100,C_100>]"
 
 
+def test_node_stop_idx():
+    g = GTFSGraph()
+    g.set_stop_ids(["B", "A"])
+    g.query_node_or_create(stop_id="A", tod=100)
+    g.query_node_or_create(stop_id="B", tod=200)
+    g.query_node_or_create(stop_id="C", tod=100.4)
+    g.add_hyper_nodes()
+    assert g.stop_ids == ["B", "A", "C"]
+    assert g.node_stop_idx == [1, 0, 2, 1, 0, 2]
+    assert g.node_tod == [100, 200, 100, -1, -1, -1]
+
+
 def test_add_skeleton_nodes():
     g = GTFSGraph()
     g.add_skeleton_nodes(
@@ -145,6 +162,29 @@ def test_add_edges_walkable_stops():
     assert str(g.G.nodes()) == "[<A,10,A_10>, <A,20,A_20>, <B,10,B_10>, <B,20,B_20>, <B,16,B_16>, <B,26,B_26>, <A,16,A_16>, <A,26,A_26>, <A,-1,A_D>, <B,-1,B_D>]"
 
 
+def get_ab_neighbors() -> StopNeighbors:
+    # stops A and B 0.1 mile apart (each is also its own neighbor)
+    return StopNeighbors(
+        stop_ids=np.array(["A", "B"]),
+        indptr=np.array([0, 2, 4]),
+        indices=np.array([0, 1, 0, 1]),
+        dists=np.array([0, 0.1, 0.1, 0]),
+    )
+
+
+def test_add_edges_walkable_stops_csr():
+    g = GTFSGraph()
+    g.add_skeleton_nodes(stop_dict={"stop_id": "A"}, times_info=[10, 20])
+    g.add_skeleton_nodes(stop_dict={"stop_id": "B"}, times_info=[10, 20])
+    # same neighbors as test_add_edges_walkable_stops, given as CSR arrays
+    nei = get_ab_neighbors()
+    g.add_edges_walkable_stops(stops_b=nei, walk_speed=1)
+    g.add_edges_within_same_stops()
+    g.add_hyper_nodes()
+    assert g.stop_neighbors is nei
+    assert str(g.G.nodes()) == "[<A,10,A_10>, <A,20,A_20>, <B,10,B_10>, <B,20,B_20>, <B,16,B_16>, <B,26,B_26>, <A,16,A_16>, <A,26,A_26>, <A,-1,A_D>, <B,-1,B_D>]"
+
+
 def test_query_origin_stop_time():
     g = GTFSGraph()
     # add nodes to graph...
@@ -175,7 +215,6 @@ def test_query_origin_stop_time():
     # add edges to graph...
     g.add_edges_walkable_stops(stops_b=df, walk_speed=1)
     g.add_edges_within_same_stops()
-    g.add_hyper_nodes()
 
     res_paths, res_dists = g.query_origin_stop_time(
         stops_df=df,
@@ -223,7 +262,6 @@ def test_query_od_stops_time():
     # add edges to graph...
     g.add_edges_walkable_stops(stops_b=df, walk_speed=1)
     g.add_edges_within_same_stops()
-    g.add_hyper_nodes()
 
     pth = g.query_od_stops_time(
         stop_orig_ids=["A"],
@@ -234,6 +272,508 @@ def test_query_od_stops_time():
     print("all nodes:", g.G.nodes())
     print("all edges:", g.G.edges())
     print(pth)
-    assert pth == [10, 0, 4, 9]
+    assert pth == [8, 0, 4]  # A_9 -> A_10 -> B_16
+
+
+def get_two_stops_graph() -> GTFSGraph:
+    # stops A and B are 0.1 mile apart, both served at minutes 10 and 20
+    g = GTFSGraph()
+    g.add_skeleton_nodes(stop_dict={"stop_id": "A"}, times_info=[10, 20])
+    g.add_skeleton_nodes(stop_dict={"stop_id": "B"}, times_info=[10, 20])
+    nei = get_ab_neighbors()
+    g.add_edges_walkable_stops(stops_b=nei, walk_speed=1)
+    g.add_edges_within_same_stops()
+    return g
+
+
+def test_query_origin_stop_time_keeps_walk_time():
+    g = get_two_stops_graph()
+    num_nodes = g.G.num_nodes()
+    __, res_dists = g.query_origin_stop_time(
+        stops_df=None, stop_id="A", depart_min=9, walk_speed=3, cutoff=1000
+    )
+    # walking to B takes 2 minutes (arrive at 11), the next node of B is at 16
+    assert abs(res_dists[g.nodes_name_map["B_16"]] - 7) < 1e-9
+    # the temporary origin node is removed from the graph and from the results
+    assert g.G.num_nodes() == num_nodes and "A_9" not in g.nodes_name_map
+    assert set(res_dists) <= set(g.G.node_indices())
+    assert abs(res_dists[g.nodes_name_map["A_10"]] - 1) < 1e-9
+
+
+def test_query_origin_coords_time():
+    from script.analysis.spatial_index import StopSpatialIndex
+
+    g = get_two_stops_graph()
+    g.stop_index = StopSpatialIndex(pd.DataFrame({
+        "stop_id": ["A", "B"],
+        "stop_lat": [36.0, 36.001447],  # 0.1 mile to the north
+        "stop_lon": [-84.0, -84.0],
+    }))
+    num_nodes = g.G.num_nodes()
+    num_edges = g.G.num_edges()
+    # start 0.05 mile south of A: 1 minute walk to A at 3 mph
+    res_paths, res_dists = g.query_origin_coords_time(
+        lat=36.0 - 0.0007235, lon=-84.0, depart_min=8, cutoff=1000, bw_mile=0.5, walk_speed=3
+    )
+    # the temporary origin node is removed
+    assert g.G.num_nodes() == num_nodes and g.G.num_edges() == num_edges
+    a10, b16 = g.nodes_name_map["A_10"], g.nodes_name_map["B_16"]
+    assert abs(res_dists[a10] - 2) < 1e-3  # walk 1 + wait 1
+    assert abs(res_dists[b16] - 8) < 1e-3  # then walk to B_16 (6 minutes)
+    assert res_paths[a10] == [a10] and res_paths[b16] == [b16]  # B is an access stop
+    # out of walking distance: nothing is reached
+    res_paths, res_dists = g.query_origin_coords_time(
+        lat=37.0, lon=-84.0, depart_min=8, cutoff=1000, bw_mile=0.5
+    )
+    assert len(res_dists) == 0
+
+
+def test_query_od_matrix():
+    g = get_two_stops_graph()
+    m = g.query_od_matrix(
+        depart_min=9, cutoff=1000, orig_stop_ids=["A", "B"], dest_stop_ids=["A", "B", "C"]
+    )
+    # the origin itself at once, wait 1 minute for the first node, then walk 6 minutes to the other stop
+    np.testing.assert_allclose(m.total[:, :2], [[0, 7], [7, 0]])
+    np.testing.assert_allclose(m.walk[:, :2], [[0, 6], [6, 0]])
+    np.testing.assert_allclose(m.total, m.transit + m.wait + m.walk)
+    assert np.isnan(m.total[:, 2]).all()  # unknown stop
+    # beyond the cutoff
+    m = g.query_od_matrix(depart_min=19, cutoff=3, orig_stop_ids=["A", "B"], dest_stop_ids=["A", "B"])
+    assert np.isnan(m.total[0, 1]) and np.isnan(m.total[1, 0])
+    assert m.total[0, 0] == 0 and m.total[1, 1] == 0
+
+
+def test_query_od_matrix_coords():
+    from script.analysis.spatial_index import StopSpatialIndex
+
+    g = get_two_stops_graph()
+    g.stop_index = StopSpatialIndex(pd.DataFrame({
+        "stop_id": ["A", "B"],
+        "stop_lat": [36.0, 36.001447],
+        "stop_lon": [-84.0, -84.0],
+    }))
+    # 0.05 mile south of A (1 minute walk at 3 mph) to B itself
+    m = g.query_od_matrix(
+        depart_min=8, cutoff=1000,
+        orig_coords=[(36.0 - 0.0007235, -84.0)], dest_coords=[(36.001447, -84.0), (37.0, -84.0)],
+        bw_mile=0.5, walk_speed=3,
+    )
+    assert m.total.shape == (1, 2)
+    # walk 1 to A, then egress from A to B on foot (2 minutes at 3 mph), no wait at A
+    assert abs(m.total[0, 0] - 3) < 1e-3
+    assert abs(m.wait[0, 0]) < 1e-3 and abs(m.walk[0, 0] - 3) < 1e-3
+    assert np.isnan(m.total[0, 1])  # no stop within walking distance
+
+
+def test_query_dest_stop_time():
+    g = get_two_stops_graph()
+    # arrive at B by 21: the latest node of B is B_20
+    res_paths, res_costs = g.query_dest_stop_time(stop_id="B", arrive_min=21, cutoff=1000)
+    assert abs(res_costs[g.nodes_name_map["B_20"]] - 1) < 1e-9
+    # from A_10: walk 6 minutes to B_16, then wait for B_20 (A_20 is too late)
+    a10, b16, b20 = g.nodes_name_map["A_10"], g.nodes_name_map["B_16"], g.nodes_name_map["B_20"]
+    assert abs(res_costs[a10] - 11) < 1e-9
+    assert g.nodes_name_map["A_20"] not in res_costs
+    assert res_paths[a10] == [a10, b16, b20]
+    latest = g.get_latest_departures(res_costs, arrive_min=21)
+    assert abs(latest["A"] - 10) < 1e-9 and abs(latest["B"] - 20) < 1e-9
+    # nothing arrives before the first node
+    __, res_costs = g.query_dest_stop_time(stop_id="B", arrive_min=5, cutoff=1000)
+    assert len(res_costs) == 0
+
+
+def test_reversed_graph_is_rebuilt():
+    g = get_two_stops_graph()
+    G_rev = g.get_reversed_graph()
+    assert g.get_reversed_graph() is G_rev
+    a10, b20 = g.nodes_name_map["A_10"], g.nodes_name_map["B_20"]
+    assert G_rev.has_edge(g.nodes_name_map["A_16"], a10)  # waiting edge A_10 -> A_16
+    # new edges (e.g., a trip) invalidate the reversed copy
+    g.add_edge(a10, b20, GTFSEdge(a10, b20, trip_t=10, wait_t=0, walk_t=0, mode=EdgeMode.TRIP))
+    assert g.get_reversed_graph().has_edge(b20, a10)
+    # the arrive-by search leaves the reversed graph unchanged
+    num_nodes = g.get_reversed_graph().num_nodes()
+    g.query_dest_stop_time(stop_id="B", arrive_min=21, cutoff=1000)
+    assert g.get_reversed_graph().num_nodes() == num_nodes
+
+
+def test_reduce_costs_by_stop():
+    g = get_two_stops_graph()
+    a10, a16, b16 = (g.nodes_name_map[n] for n in ["A_10", "A_16", "B_16"])
+    # unknown (e.g., temporary) nodes are skipped
+    res_costs = {a10: 0, a16: 6, b16: 6, 1000: 0}
+    stop_costs, stop_nodes = g.reduce_costs_by_stop(res_costs)
+    idx_a, idx_b = g.encode_stops(["A", "B"])
+    assert stop_costs[idx_a] == 0 and stop_nodes[idx_a] == a10
+    assert stop_costs[idx_b] == 6 and stop_nodes[idx_b] == b16
+    assert g.encode_stops(["C"])[0] == -1
+    # stops not reached
+    stop_costs, stop_nodes = g.reduce_costs_by_stop({a16: 6})
+    assert np.isinf(stop_costs[idx_b]) and stop_nodes[idx_b] == -1
+
+
+def test_query_od_astar():
+    # stops A and B as in get_two_stops_graph, and a trip from B at 20 to stop C at 25
+    g = GTFSGraph()
+    g.add_skeleton_nodes(stop_dict={"stop_id": "A"}, times_info=[10, 20])
+    g.add_skeleton_nodes(stop_dict={"stop_id": "B"}, times_info=[10, 20])
+    b20 = g.nodes_name_map["B_20"]
+    c25 = g.query_node_or_create(stop_id="C", tod=25)
+    g.add_edge(b20, c25, GTFSEdge(b20, c25, trip_t=5, wait_t=0, walk_t=0, mode=EdgeMode.TRIP))
+    nei = get_ab_neighbors()
+    g.add_edges_walkable_stops(stops_b=nei, walk_speed=1)
+    g.add_edges_within_same_stops()
+
+    idx_a, idx_b, idx_c = g.encode_stops(["A", "B", "C"])
+    bounds = g.get_stop_lower_bounds(np.array([idx_c]))
+    assert bounds[idx_a] == 11 and bounds[idx_b] == 5 and bounds[idx_c] == 0
+    # the bounds are consistent: no reduced cost is negative (A* uses them as they are)
+    node_stops = np.asarray(g.node_stop_idx)
+    reduced = [e.total_t - (bounds[node_stops[e.start_node]] - bounds[node_stops[e.end_node]]) for e in g.G.edges()]
+    assert min(reduced) >= 0
+
+    pth, cost = g.query_od_stops_time(["A"], ["C"], depart_min=9, cutoff=1000, return_costs=True)
+    settled = g.last_search_stats["nodes_settled"]
+    pth_a, cost_a = g.query_od_stops_time(
+        ["A"], ["C"], depart_min=9, cutoff=1000, return_costs=True, method="astar"
+    )
+    assert abs(cost - cost_a) < 1e-9 and pth_a == pth
+    assert g.last_search_stats["method"] == "astar"
+    assert g.last_search_stats["nodes_settled"] <= settled
+    # several origins, and a cutoff below the travel time
+    pth_a, cost_a = g.query_od_stops_time(
+        ["A", "B"], ["C"], depart_min=9, cutoff=1000, return_costs=True, method="astar"
+    )
+    assert pth_a[0] == g.nodes_name_map["B_9"] and abs(cost_a - 16) < 1e-9
+    assert g.query_od_stops_time(["A"], ["C"], depart_min=9, cutoff=10, method="astar") == []
 
 
+def get_next_departure_graph(transfer_mode: str) -> GTFSGraph:
+    # stops A and B 0.1 mile apart, and a trip from B at 20 to stop C at 25
+    g = GTFSGraph()
+    g.add_skeleton_nodes(stop_dict={"stop_id": "A"}, times_info=[10, 20, 30])
+    g.add_skeleton_nodes(stop_dict={"stop_id": "B"}, times_info=[10, 20, 30])
+    b20 = g.nodes_name_map["B_20"]
+    c25 = g.query_node_or_create(stop_id="C", tod=25)
+    g.add_edge(b20, c25, GTFSEdge(b20, c25, trip_t=5, wait_t=0, walk_t=0, mode=EdgeMode.TRIP))
+    nei = get_ab_neighbors()
+    g.add_edges_walkable_stops(stops_b=nei, walk_speed=1, transfer_mode=transfer_mode)
+    g.add_edges_within_same_stops()
+    return g
+
+
+def test_add_edges_next_departures():
+    g_all = get_next_departure_graph("all")
+    g = get_next_departure_graph("next_departure")
+    # no node at the end of the walks (but after the last time node, e.g., B_36)
+    assert "B_16" not in g.nodes_name_map and "B_36" in g.nodes_name_map
+    assert g.G.num_nodes() < g_all.G.num_nodes() and g.G.num_edges() < g_all.G.num_edges()
+    a10, b20 = g.nodes_name_map["A_10"], g.nodes_name_map["B_20"]
+    edge = g.G.get_edge_data(a10, b20)
+    assert edge.mode == EdgeMode.WALK and edge.walk_t == 6 and edge.wait_t == 4
+
+    # same travel times, also for destinations reached on foot (arrival before the wait)
+    for orig, dest, depart_min in [("A", "C", 9), ("A", "B", 10), ("A", "B", 12), ("B", "A", 21), ("C", "A", 9)]:
+        for method in ["dijkstra", "astar"]:
+            __, cost = g.query_od_stops_time([orig], [dest], depart_min, cutoff=1000, return_costs=True, method=method)
+            __, cost_all = g_all.query_od_stops_time(
+                [orig], [dest], depart_min, cutoff=1000, return_costs=True, method=method
+            )
+            assert cost == cost_all or abs(cost - cost_all) < 1e-9
+    pth, cost = g.query_od_stops_time(["A"], ["B"], 10, cutoff=1000, return_costs=True)
+    assert abs(cost - 6) < 1e-9 and pth == [a10, b20]
+    # the walk arrival is still subject to the cutoff
+    assert g.query_od_stops_time(["A"], ["B"], 10, cutoff=5) == []
+
+
+def assert_same_travel_times(g: GTFSGraph, g_ref: GTFSGraph) -> None:
+    # one-to-all, OD matrix and transfer patterns give the travel times of the reference graph
+    assert g.stop_ids == g_ref.stop_ids
+    stops = ["A", "B", "C"]
+    for depart_min in [9, 10, 12, 21]:
+        for orig in ["A", "B"]:  # (C has no walking neighbors)
+            stop_costs, stop_costs_ref = (
+                graph.reduce_costs_by_stop(
+                    graph.query_origin_stop_time(None, orig, depart_min, cutoff=60)[1],
+                    access=graph.get_origin_access(orig),
+                )[0]
+                for graph in (g, g_ref)
+            )
+            np.testing.assert_allclose(stop_costs, stop_costs_ref)
+        m, m_ref = (
+            graph.query_od_matrix(depart_min, cutoff=60, orig_stop_ids=stops, dest_stop_ids=stops, max_workers=1)
+            for graph in (g, g_ref)
+        )
+        for name in ["total", "transit", "wait", "walk"]:
+            np.testing.assert_allclose(getattr(m, name), getattr(m_ref, name))
+    tp = compute_transfer_patterns(g, cutoff=60, max_workers=1)
+    for orig in stops:
+        for dest in stops:
+            for depart_min in [9, 10, 12, 21]:
+                __, cost = g_ref.query_od_stops_time([orig], [dest], depart_min, cutoff=60, return_costs=True)
+                expected = np.inf if cost is None else depart_min + cost
+                assert np.isclose(tp.earliest_arrival(orig, dest, depart_min), expected)
+
+
+def test_next_departures_travel_times():
+    # stops reached on foot: the arrival before waiting for the next departure
+    g_all = get_next_departure_graph("all")
+    g = get_next_departure_graph("next_departure")
+    idx_b = g.encode_stops(["B"])[0]
+    __, res_costs = g.query_origin_stop_time(None, "A", 10, cutoff=60)
+    stop_costs, __ = g.reduce_costs_by_stop(res_costs)
+    assert stop_costs[idx_b] == 6  # walk A_10 -> B (B_16 in g_all), not B_20
+    # from A at 9: B on foot at 15 (g_all: B_16)
+    __, res_costs = g.query_origin_stop_time(None, "A", 9, cutoff=60)
+    stop_costs, __ = g.reduce_costs_by_stop(res_costs, access=g.get_origin_access("A"))
+    assert stop_costs[idx_b] == 6 and stop_costs[g.encode_stops(["A"])[0]] == 0
+    assert_same_travel_times(g, g_all)
+
+
+def test_apply_transfers():
+    nei = StopNeighbors(
+        stop_ids=np.array(["A", "B", "C"]),
+        indptr=np.array([0, 2, 4, 5]),
+        indices=np.array([0, 1, 0, 1, 2]),
+        dists=np.array([0, 0.1, 0.1, 0, 0]),
+    )
+    transfers = pd.DataFrame({
+        "from_stop_id": ["A", "B", "A", "C"],
+        "to_stop_id": ["B", "A", "A", "A"],
+        "transfer_type": [2, 3, 2, 2],
+        "min_transfer_time": [120, None, 60, 300],
+    })
+    nei_t = nei.apply_transfers(transfers, walk_speed=3)
+    # A -> B: 2 minutes at 3 mph, B -> A: not possible, C -> A: added, A -> A: kept
+    ids, dists = nei_t.get_neighbors("A")
+    assert ids.tolist() == ["A", "B"] and np.allclose(dists, [0, 0.1])
+    assert nei_t.get_neighbors("B")[0].tolist() == ["B"]
+    ids, dists = nei_t.get_neighbors("C")
+    assert ids.tolist() == ["A", "C"] and np.allclose(dists, [0.25, 0])
+    # no stop-to-stop rule: unchanged
+    assert nei.apply_transfers(transfers.iloc[[2]], walk_speed=3) is nei
+
+
+def test_contract_wait_chains():
+    g_plain = get_next_departure_graph("all")
+    g = get_next_departure_graph("all")
+    # B_16 (walking arrival from A_10) and A_26, B_26, ... only wait for the next node
+    num_nodes, num_edges = g.G.num_nodes(), g.G.num_edges()
+    assert g.contract_wait_chains() == (num_nodes - g.G.num_nodes(), num_edges - g.G.num_edges())
+    assert "B_16" not in g.nodes_name_map and "B_20" in g.nodes_name_map
+    assert 16 not in g.nodes_time_map["B"] and g.node_stop_idx[g_plain.nodes_name_map["B_16"]] == -1
+    a10, b20 = g.nodes_name_map["A_10"], g.nodes_name_map["B_20"]
+    edge = g.G.get_edge_data(a10, b20)
+    assert edge.mode == EdgeMode.WALK and edge.walk_t == 6 and edge.wait_t == 4
+
+    # same travel times, and the paths expanded with the nodes waited through
+    for orig, dest, depart_min in [("A", "C", 9), ("A", "B", 10), ("A", "B", 12), ("B", "A", 21)]:
+        for method in ["dijkstra", "astar"]:
+            __, cost = g.query_od_stops_time([orig], [dest], depart_min, cutoff=1000, return_costs=True, method=method)
+            __, cost_plain = g_plain.query_od_stops_time(
+                [orig], [dest], depart_min, cutoff=1000, return_costs=True, method=method
+            )
+            assert abs(cost - cost_plain) < 1e-9
+    pth, cost = g.query_od_stops_time(["A"], ["C"], 9, cutoff=1000, return_costs=True)
+    pth_plain = g_plain.query_od_stops_time(["A"], ["C"], 9, cutoff=1000)
+    assert g.expand_path(pth) == [g_plain.G[v].name for v in pth_plain]
+    assert g.get_travel_time_info_from_pth(g.G, pth) == g_plain.get_travel_time_info_from_pth(g_plain.G, pth_plain)
+    # the walks replaced still arrive at the stop before their end node
+    assert g.walk_arrival_edges[(a10, b20)] == 6
+    assert_same_travel_times(g, g_plain)
+    g = get_next_departure_graph("next_departure")
+    g.contract_wait_chains()
+    assert_same_travel_times(g, g_plain)
+
+
+def test_add_edges_compiled_stop_times():
+    stops, trips, stop_times = get_feed_tables()
+    feed = CompiledFeed.from_tables(stops, trips, [stop_times])
+    g = GTFSGraph()
+    gtfs_pipeline.add_edges_compiled_stop_times(feed, g)
+    g_str = GTFSGraph()
+    gtfs_pipeline.add_edges_all_stop_times(stop_times.sort_values(["trip_id", "stop_sequence"]), g_str)
+    # same nodes and trip edges as the string-keyed path
+    assert set(g.nodes_name_map) == set(g_str.nodes_name_map)
+
+    def get_edges(graph):
+        return sorted((graph.G[a].name, graph.G[b].name, e.trip_t) for a, b, e in graph.G.weighted_edge_list())
+    assert get_edges(g) == get_edges(g_str)
+
+
+def test_time_resolution():
+    stops, trips, stop_times = get_feed_tables()
+    feed = CompiledFeed.from_tables(stops, trips, [stop_times])
+    g = GTFSGraph()
+    g.time_resolution = 5
+    g.set_stop_ids(feed.stop_ids.tolist())
+    g.add_skeleton_nodes(stop_dict={"stop_id": "A"}, times_info=[0, 482, 1440])
+    gtfs_pipeline.add_edges_compiled_stop_times(feed, g)
+    # departures at the start of their 5-minute bucket, arrivals at its end (e.g., 25:10:30 -> 1515)
+    assert list(g.nodes_time_map["A"]) == [0, 480, 490, 1440]
+    assert list(g.nodes_time_map["C"]) == [500, 1515]
+    assert g.query_node_or_create(stop_id="A", tod=483.7) == g.nodes_name_map["A_480"]
+    # trip costs are the differences of the buckets (never less than the real ride)
+    b485, c1515 = g.nodes_name_map["B_485"], g.nodes_name_map["C_1515"]
+    assert g.G.get_edge_data(b485, c1515).trip_t == 1030
+
+    # walking times rounded up to the resolution (6 -> 10 minutes)
+    nei = StopNeighbors(
+        stop_ids=np.array(["A", "B"]),
+        indptr=np.array([0, 1, 2]),
+        indices=np.array([1, 0]),
+        dists=np.array([0.1, 0.1]),
+    )
+    g.add_edges_walkable_stops(stops_b=nei, walk_speed=1)
+    g.add_edges_within_same_stops()
+    a480, b490 = g.nodes_name_map["A_480"], g.nodes_name_map["B_490"]
+    assert g.G.get_edge_data(a480, b490).walk_t == 10
+    # departures at the start of their bucket too
+    __, cost = g.query_od_stops_time(["A"], ["B"], depart_min=482, cutoff=60, return_costs=True)
+    assert cost == 5  # the trip at 08:00 (A_480 -> B_485)
+
+
+def test_time_resolution_bound():
+    # one trip A -> B -> C at odd minutes and seconds, a second one from B
+    stops, trips, __ = get_feed_tables()
+    stop_times = pd.DataFrame([
+        [101, "08:01:00", "08:01:00", "A", 1],
+        [101, "08:07:00", "08:07:00", "B", 2],
+        [101, "08:13:30", "08:13:30", "C", 3],
+        [102, "08:11:00", "08:11:00", "B", 1],
+        [102, "08:24:00", "08:24:00", "A", 2],
+    ], columns=["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"])
+    feed = CompiledFeed.from_tables(stops, trips, [stop_times])
+    graphs = {}
+    for r in [1, 5]:
+        g = GTFSGraph()
+        g.time_resolution = r
+        g.set_stop_ids(feed.stop_ids.tolist())
+        for stop_id in ["A", "B", "C"]:
+            g.add_skeleton_nodes(stop_dict={"stop_id": stop_id}, times_info=[0, 1440])
+        gtfs_pipeline.add_edges_compiled_stop_times(feed, g)
+        g.add_edges_within_same_stops()
+        graphs[r] = g
+    # arrival 08:07 rounded up, the first departure 08:11 down: both at B_490
+    assert list(graphs[5].nodes_time_map["B"]) == [0, 490, 1440]
+    assert list(graphs[5].nodes_time_map["C"]) == [0, 495, 1440]
+    for orig, dest, depart_min in [("A", "C", 480), ("A", "B", 480), ("B", "A", 485), ("B", "A", 490)]:
+        __, cost = graphs[5].query_od_stops_time([orig], [dest], depart_min, cutoff=100, return_costs=True)
+        __, cost_1 = graphs[1].query_od_stops_time([orig], [dest], depart_min, cutoff=100, return_costs=True)
+        # never earlier than at the full resolution, and less than one bucket later
+        assert cost_1 <= cost < cost_1 + 5
+
+
+def test_time_resolution_back_to_back_trips():
+    # trip 102 leaves B at the minute trip 101 arrives there: still the first stop of its trip
+    stops, trips, __ = get_feed_tables()
+    stop_times = pd.DataFrame([
+        [101, "08:01:00", "08:01:00", "A", 1],
+        [101, "08:07:00", "08:07:00", "B", 2],
+        [102, "08:07:00", "08:07:00", "B", 1],
+        [102, "08:13:00", "08:13:00", "C", 2],
+    ], columns=["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"])
+    feed = CompiledFeed.from_tables(stops, trips, [stop_times])
+    g = GTFSGraph()
+    g.time_resolution = 5
+    g.set_stop_ids(feed.stop_ids.tolist())
+    gtfs_pipeline.add_edges_compiled_stop_times(feed, g)
+    # arrival of 101 rounded up (B_490), departure of 102 rounded down (B_485)
+    assert list(g.nodes_time_map["B"]) == [485, 490]
+    b485, c495 = g.nodes_name_map["B_485"], g.nodes_name_map["C_495"]
+    assert g.G.get_edge_data(b485, c495).trip_t == 10
+
+    # times beyond the packed minute range
+    stop_times.loc[3, ["arrival_time", "departure_time"]] = "20000:00:00"
+    feed = CompiledFeed.from_tables(stops, trips, [stop_times])
+    with pytest.raises(ValueError):
+        gtfs_pipeline.add_edges_compiled_stop_times(feed, g)
+
+
+def test_freeze():
+    g_plain = get_next_departure_graph("all")
+    g = get_next_departure_graph("all")
+    g.contract_wait_chains()
+    g_contracted = get_next_departure_graph("all")
+    g_contracted.contract_wait_chains()
+    old_edges, G_rev = g.G.weighted_edge_list(), g.get_reversed_graph()
+    g.freeze()
+    assert g.frozen and g.nodes_name_map is None and g.nodes_time_map is None
+    # nodes numbered by (stop, time), the same stops and times as before
+    assert g.G.node_indices() == list(range(g.G.num_nodes())) and g.G.num_edges() == g_contracted.G.num_edges()
+    keys = [(g.node_stop_idx[v], g.node_tod[v]) for v in g.G.node_indices()]
+    assert keys == sorted(keys)
+    for stop_id in ["A", "B", "C"]:
+        assert list(g.get_stop_tods(stop_id)) == list(g_contracted.nodes_time_map[stop_id])
+    assert g.find_next_node("B", 17) == (20, g.get_node_id("B", 20))
+    assert g.find_prev_node("B", 19) == (10, g.get_node_id("B", 10)) and g.find_prev_node("B", 9) is None
+    assert g.G[g.get_node_id("C", 25)].name == "C_25" and g.get_node_id("C", 26) is None
+    # new edge payloads: the edges of the graph before freezing keep their node ids
+    assert all(e.start_node == a and e.end_node == b for a, b, e in old_edges)
+    assert all(e.start_node == b and e.end_node == a for a, b, e in G_rev.weighted_edge_list())
+    assert all(e.start_node == a and e.end_node == b for a, b, e in g.G.weighted_edge_list())
+    assert g.get_reversed_graph() is not G_rev
+
+    # same travel times and paths, no node added by the queries
+    num_nodes = g.G.num_nodes()
+    for orig, dest, depart_min in [("A", "C", 9), ("A", "B", 10), ("A", "B", 12), ("B", "A", 21)]:
+        for method in ["dijkstra", "astar"]:
+            pth, cost = g.query_od_stops_time([orig], [dest], depart_min, cutoff=1000, return_costs=True, method=method)
+            __, cost_plain = g_plain.query_od_stops_time(
+                [orig], [dest], depart_min, cutoff=1000, return_costs=True, method=method
+            )
+            assert abs(cost - cost_plain) < 1e-9
+            # (without the origin node added at the departure time by the unfrozen graph)
+            pth_contracted = g_contracted.query_od_stops_time([orig], [dest], depart_min, cutoff=1000, method=method)
+            names, names_contracted = g.expand_path(pth), g_contracted.expand_path(pth_contracted)
+            assert names_contracted[-len(names):] == names and len(names_contracted) - len(names) <= 1
+    assert g.G.num_nodes() == num_nodes
+    __, res_costs = g.query_origin_stop_time(None, "A", depart_min=9, cutoff=60)
+    assert abs(res_costs[g.get_node_id("C", 25)] - 16) < 1e-9
+    assert_same_travel_times(g, g_plain)
+
+    # read-only
+    with pytest.raises(ValueError):
+        g.query_node_or_create(stop_id="A", tod=11)
+    with pytest.raises(ValueError):
+        g.add_edge(0, 1, GTFSEdge(0, 1, trip_t=1, wait_t=0, walk_t=0, mode=EdgeMode.TRIP))
+
+
+def test_search_workspace():
+    g = get_next_departure_graph("all")
+    workspace = SearchWorkspace()
+    # the query would add an origin node to the graph
+    with pytest.raises(ValueError):
+        g.query_od_stops_time(["A"], ["C"], 9, cutoff=1000, workspace=workspace)
+    g.freeze()
+    num_nodes, num_edges, G_rev = g.G.num_nodes(), g.G.num_edges(), g.get_reversed_graph()
+    # one workspace reused by the queries: same results as fresh visitors
+    for orig, dest, depart_min in [("A", "C", 9), ("A", "B", 10), ("B", "A", 21), ("C", "A", 9)]:
+        for method in ["dijkstra", "astar"]:
+            res = g.query_od_stops_time([orig], [dest], depart_min, cutoff=1000, return_costs=True, method=method)
+            res_ws = g.query_od_stops_time(
+                [orig], [dest], depart_min, cutoff=1000, return_costs=True, method=method, workspace=workspace
+            )
+            assert res_ws == res
+        for return_paths in [True, False]:
+            res = g.query_origin_access_stops([orig], np.zeros(1), depart_min, 60, return_paths=return_paths)
+            res_ws = g.query_origin_access_stops(
+                [orig], np.zeros(1), depart_min, 60, return_paths=return_paths, workspace=workspace
+            )
+            assert res_ws == res
+        # stop costs read from the arrays of the workspace
+        stop_costs, __ = g.reduce_costs_by_stop(res[1], access=([orig], np.zeros(1)))
+        stop_costs[stop_costs > 60] = np.inf
+        res_ws = g.query_origin_stop_costs([orig], np.zeros(1), depart_min, 60, workspace=workspace)
+        assert np.array_equal(res_ws, stop_costs)
+        assert np.array_equal(g.query_origin_stop_costs([orig], np.zeros(1), depart_min, 60), stop_costs)
+    dests = g.get_access_stops(["A", "B", "C"])
+    res = g.query_one_to_many(["A"], np.zeros(1), dests, 9, 60)
+    assert np.array_equal(g.query_one_to_many(["A"], np.zeros(1), dests, 9, 60, workspace=workspace), res, equal_nan=True)
+    # sized once (nodes and the temporary ones), reset by the epoch
+    size = len(workspace.costs)
+    g.query_od_stops_time(["A"], ["C"], 9, cutoff=1000, workspace=workspace)
+    assert len(workspace.costs) == size and size <= g.G.num_nodes() + 2
+    # no node or edge left behind: the reversed graph is not rebuilt
+    assert (g.G.num_nodes(), g.G.num_edges()) == (num_nodes, num_edges) and g.get_reversed_graph() is G_rev
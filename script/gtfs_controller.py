@@ -2,9 +2,11 @@
 This module creates an object that records
 important path information of the interested GTFS
 """
-from functools import reduce
+import hashlib
+from dataclasses import dataclass
 import datetime
 import glob
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 from shapely.geometry import Point, LineString
@@ -17,18 +19,39 @@ import folium
 import script.visualization.folium_plots as folium_plots
 
 import script.graph_pipeline as gtfs_pipeline
-from script.GTFSGraph import GTFSGraph
-import script.analysis.graph_analysis as graph_analysis
+from script.GTFSGraph import GTFSGraph, StopNeighbors
+from script.service_calendar import ServiceCalendar
+from script.compiled_feed import CompiledFeed
+import script.analysis.geo_analysis as geo_analysis
+from script.analysis.spatial_index import build_stop_index
+
+# preprocessed data of built networks (e.g., landmarks), one file per network id
+PREPROCESSED_DIR = "GTFS_preprocessed"
 
 
 class GTFSController:
-    def __init__(self, root_dir):
+    def __init__(self, root_dir, stream_stop_times=False, chunksize=500_000, dfs=None):
         self.root_dir = root_dir
         self.file_names = ["agency.txt", "stops.txt", "calendar.txt", "calendar_dates.txt",
                            "routes.txt", "shapes.txt", "stop_times.txt", "trips.txt"]
         self.dfs = {}  # hold all data here
-        self.load_txt_files()
+        # for very large feeds, "stop_times.txt" is not loaded but streamed when building networks
+        self.stream_stop_times = stream_stop_times
+        self.chunksize = chunksize
+        # names of the source feeds if several feeds are merged (ids are prefixed by them)
+        self.feed_names: list[str] = []
+        # tables can also be given directly (e.g., several feeds merged together)
+        if dfs is None:
+            self.load_txt_files()
+        else:
+            self.dfs = dfs
         self.shapes_gdf = self.process_shapes()
+        # compile calendar tables once (service x date matrix)
+        self.service_calendar = ServiceCalendar.from_dfs(self.dfs)
+        # integer-id arrays of the feed, compiled on first use
+        # (per set of service ids when "stop_times.txt" is streamed, see get_compiled_feed)
+        self.compiled_feed: CompiledFeed | None = None
+        self.compiled_feeds_by_services: dict[frozenset, CompiledFeed] = {}
 
     def load_txt_files(self):
         # load txt files into memory
@@ -37,20 +60,54 @@ class GTFSController:
         print("fns", fns)
         for file in fns:
             fn = file.split('/')[-1]
+            if fn == "stop_times.txt" and self.stream_stop_times:
+                continue
             self.dfs[fn] = pd.read_csv(file)
         
         # change stops ids to string
         stops = self.dfs["stops.txt"]
         stops["stop_id"] = stops["stop_id"].astype(str)
         # change stop ids for stop_times
-        stop_times = self.dfs["stop_times.txt"]
-        stop_times["stop_id"] = stop_times["stop_id"].astype(str)
+        if "stop_times.txt" in self.dfs.keys():
+            stop_times = self.dfs["stop_times.txt"]
+            stop_times["stop_id"] = stop_times["stop_id"].astype(str)
         # set calendar type
         if "calendar.txt" in self.dfs.keys():
             cal = self.dfs["calendar.txt"]
             cal["start_date"] = cal["start_date"].astype(str)
             cal["end_date"] = cal["end_date"].astype(str)
 
+    def iter_stop_times(self, trip_ids: list | None = None, chunksize: int | None = None):
+        """
+            Read "stop_times.txt" chunk by chunk and only keep rows of the given trips.
+            Rows of one trip are expected to be contiguous in the file (as written by
+            most producers), so the last trip of each chunk is held back until
+            the next chunk completes it; every yielded chunk has complete trips only.
+        """
+        if chunksize is None:
+            chunksize = self.chunksize
+        if trip_ids is not None:
+            trip_ids = pd.Index(pd.unique(np.asarray(trip_ids)))
+
+        carry = None
+        reader = pd.read_csv(f"{self.root_dir}/stop_times.txt", chunksize=chunksize)
+        for chunk in reader:
+            if trip_ids is not None:
+                chunk = chunk[chunk["trip_id"].isin(trip_ids)]
+            if carry is not None:
+                chunk = pd.concat([carry, chunk])
+                carry = None
+            if len(chunk) == 0:
+                continue
+            chunk = chunk.assign(stop_id=chunk["stop_id"].astype(str))
+            # hold back the last trip (it may continue in the next chunk)
+            is_last = (chunk["trip_id"] == chunk["trip_id"].iloc[-1]).to_numpy()
+            carry = chunk[is_last]
+            if (~is_last).any():
+                yield chunk[~is_last]
+        if carry is not None and len(carry) > 0:
+            yield carry
+
     def process_shapes(self):
         df_shapes = self.dfs["shapes.txt"]
 
@@ -74,6 +131,28 @@ class GTFSController:
         df_shapes = gpd.GeoDataFrame(df_shapes, geometry=df_shapes['line'])
         return df_shapes
 
+    def get_compiled_feed(self, service_ids: list | None = None) -> CompiledFeed:
+        # a streamed "stop_times.txt" is only read for the trips of the given services
+        # (the trips/stops tables are still compiled whole, so ids are the same for all services)
+        if self.stream_stop_times and "stop_times.txt" not in self.dfs and service_ids is not None:
+            key = frozenset(str(sid) for sid in service_ids)
+            if key not in self.compiled_feeds_by_services:
+                trips = self.dfs["trips.txt"]
+                trip_ids = trips.loc[trips["service_id"].astype(str).isin(key), "trip_id"]
+                self.compiled_feeds_by_services[key] = CompiledFeed.from_controller(self, trip_ids=trip_ids)
+            return self.compiled_feeds_by_services[key]
+        if self.compiled_feed is None:
+            self.compiled_feed = CompiledFeed.from_controller(self)
+        return self.compiled_feed
+
+    def get_service_ids_by_date(self, the_date: datetime.date) -> list:
+        # active services on the date, from both "calendar.txt" and "calendar_dates.txt"
+        return self.service_calendar.active_service_ids(the_date)
+
+    def get_service_ids_by_dates(self, dates: list[datetime.date]) -> dict:
+        # {date: active service ids} for multi-date studies
+        return self.service_calendar.active_service_ids_by_dates(dates)
+
     def display_table(self, fn):
         # TODO: set width and height
         if fn in self.dfs.keys():
@@ -119,146 +198,154 @@ class GTFSController:
         folium_static(m, width=width, height=height)
 
 
+@dataclass
+class FeedView:
+    """
+        A filtered "view" of the loaded feed: row positions into GTFS_OBJ.dfs tables.
+        The base tables are never copied into the view nor modified by it, so
+        many dates/scenarios can be built from the same loaded feed.
+        (the trips themselves are read from the compiled feed, see CompiledFeed)
+    """
+    GTFS_OBJ: GTFSController
+    stops_idx: np.ndarray  # row positions in "stops.txt" of the stops served by the trips
+
+    @property
+    def stops(self) -> pd.DataFrame:
+        return self.GTFS_OBJ.dfs["stops.txt"].iloc[self.stops_idx]
+
+
+def create_feed_view(
+        GTFS_OBJ: GTFSController,
+        service_ids: list,
+) -> FeedView:
+    # trips -> stop_times -> stops, as a row-index array over the base stops table
+    # (read from the compiled feed, so it also works when "stop_times.txt" is streamed)
+    feed = GTFS_OBJ.get_compiled_feed(service_ids)
+    trip_mask = feed.trip_mask_by_services(service_ids)
+    stop_ids = feed.decode_stops(np.unique(feed.st_stop[feed.stop_times_mask_by_trips(trip_mask)]))
+
+    stops = GTFS_OBJ.dfs["stops.txt"]
+    stops_idx = np.flatnonzero(stops["stop_id"].isin(stop_ids).to_numpy())
+    return FeedView(GTFS_OBJ=GTFS_OBJ, stops_idx=stops_idx)
+
+
 # given configurations, build network
-def build_network(
+# networks built from the same feed and configuration share one id (used by caches)
+def get_network_id(network_config_info, GTFS_OBJ: GTFSController) -> str:
+    info = (
+        GTFS_OBJ.root_dir,
+        sorted(str(sid) for sid in network_config_info["service_id"]),
+        network_config_info["bw_mile"],
+        network_config_info["walk_speed"],
+        network_config_info.get("spatial_index", "balltree"),
+        network_config_info.get("transfer_mode", "all"),
+        network_config_info.get("contract_waits", False),
+        network_config_info.get("time_resolution", 1),
+        network_config_info.get("freeze", False),  # node ids differ once renumbered
+    )
+    return hashlib.sha1(repr(info).encode()).hexdigest()
+
+
+# optional ALT preprocessing: load the landmarks of the network, or compute and save them
+def prepare_landmarks(network_config_info, GRAPH_OBJ: GTFSGraph) -> None:
+    num_landmarks = network_config_info.get("num_landmarks", 0)
+    if num_landmarks <= 0:
+        return
+    folder = network_config_info.get("preprocessed_dir", PREPROCESSED_DIR)
+    if GRAPH_OBJ.load_landmarks(folder) and len(GRAPH_OBJ.landmarks) == num_landmarks:
+        print("landmarks loaded:", len(GRAPH_OBJ.landmarks))
+        return
+    GRAPH_OBJ.compute_landmarks(num_landmarks)
+    print("landmarks saved to:", GRAPH_OBJ.save_landmarks(folder))
+
+
+# walking edges between neighboring stops ("transfer_mode": "all" or "next_departure")
+def add_transfer_edges(
         network_config_info,
         GTFS_OBJ: GTFSController,
         GRAPH_OBJ: GTFSGraph,
-) -> None | tuple[GTFSGraph, pd.DataFrame]:
-    if len(network_config_info) == 0:
-        return None
-
-    # load configuration variables
-    service_ids = network_config_info["service_id"]
-    bw_mile = network_config_info["bw_mile"]
+        stop_neighbors: StopNeighbors,
+) -> None:
     walk_speed = network_config_info["walk_speed"]
+    transfer_mode = network_config_info.get("transfer_mode", "all")
+    # the rules of "transfers.txt" (if any) only apply to the pruned transfers
+    if transfer_mode == "next_departure" and "transfers.txt" in GTFS_OBJ.dfs:
+        stop_neighbors = stop_neighbors.apply_transfers(GTFS_OBJ.dfs["transfers.txt"], walk_speed)
+    GRAPH_OBJ.add_edges_walkable_stops(stop_neighbors, walk_speed=walk_speed, transfer_mode=transfer_mode)
 
-    # filter stop_times dataframe based on service ids
-    trips_subset = filter_trips_by_service_ids(GTFS_OBJ, service_ids)
-    trips_ids = trips_subset["trip_id"].tolist()
-    stop_times = filter_stop_times_by_trip_ids(GTFS_OBJ, trips_ids)
 
-    # filter the stops that is used in "stop_times" get stops information
-    stop_ids = list(set(stop_times["stop_id"].to_list()))
-    stops = filter_stops_by_stop_ids(GTFS_OBJ, stop_ids)
-    stops = graph_analysis.find_stops_neighbors_within_buffer(stops, bw_mile=bw_mile)
+# the steps shared by the network builders (build_network, feed_merge.build_merged_network),
+# around their own way of adding the trip edges
+def configure_graph(network_config_info, GTFS_OBJ: GTFSController, GRAPH_OBJ: GTFSGraph) -> None:
+    GRAPH_OBJ.network_id = get_network_id(network_config_info, GTFS_OBJ)
+    # coarser time nodes for smaller networks (see GTFSGraph.bucket_tod for the error bound)
+    GRAPH_OBJ.time_resolution = network_config_info.get("time_resolution", 1)
 
-    # build spatio-temporal networks
+
+def add_network_stops(
+        network_config_info,
+        GRAPH_OBJ: GTFSGraph,
+        stops: pd.DataFrame,  # the stops served by the selected trips
+) -> tuple[gpd.GeoDataFrame, StopNeighbors]:
+    # spatial index, walking neighbors and skeleton nodes of the stops
+    # (skeleton nodes are merged into the nodes already created by trips, if any)
+    stops = geo_analysis.get_stops_gdf(stops)
+    # the spatial index is built once and kept on the graph for coordinate queries
+    GRAPH_OBJ.stop_index = build_stop_index(
+        stops, backend=network_config_info.get("spatial_index", "balltree")
+    )
+    stop_neighbors = geo_analysis.find_stops_neighbors_csr(
+        stops, bw_mile=network_config_info["bw_mile"], stop_index=GRAPH_OBJ.stop_index
+    )
     gtfs_pipeline.add_nodes_all_stops(stops, GRAPH_OBJ, t_step=1440)
-    gtfs_pipeline.add_edges_all_stop_times(stop_times, GRAPH_OBJ)  # actual transit trips
-    GRAPH_OBJ.add_edges_walkable_stops(stops, walk_speed=walk_speed)  # transfer between stops
+    return stops, stop_neighbors
+
+
+def finish_network(
+        network_config_info,
+        GTFS_OBJ: GTFSController,
+        GRAPH_OBJ: GTFSGraph,
+        stop_neighbors: StopNeighbors,
+) -> None:
+    # the steps after the trip edges: transfers, waits at stops and the optional steps
+    add_transfer_edges(network_config_info, GTFS_OBJ, GRAPH_OBJ, stop_neighbors)  # transfer between stops
     GRAPH_OBJ.add_edges_within_same_stops()  # add edges within the same stop
-    GRAPH_OBJ.add_hyper_nodes()  # add destination nodes
+    if network_config_info.get("contract_waits", False):
+        GRAPH_OBJ.contract_wait_chains()  # remove the nodes only passed through by waiting
+    if network_config_info.get("freeze", False):
+        GRAPH_OBJ.freeze()  # renumber the nodes by (stop, time), read-only afterwards
+    prepare_landmarks(network_config_info, GRAPH_OBJ)
 
     # print information
     print("num. of nodes:", len(GRAPH_OBJ.G.nodes()))
     print("num. of edges:", len(GRAPH_OBJ.G.edges()))
-    return GRAPH_OBJ, stops
 
 
-# -----------Below are some filter methods for data query-----------
-# get subset trips given service ids
-def filter_trips_by_service_ids(
+def build_network(
+        network_config_info,
         GTFS_OBJ: GTFSController,
-        service_ids: list[int],
-) -> pd.DataFrame:
-    trips = GTFS_OBJ.dfs["trips.txt"]
-    filt = trips["service_id"].isin(service_ids)
-    trips_subset = trips[filt]  # ["trip_id"].tolist()
-    return trips_subset
+        GRAPH_OBJ: GTFSGraph,
+) -> None | tuple[GTFSGraph, pd.DataFrame]:
+    if len(network_config_info) == 0:
+        return None
 
+    # load configuration variables
+    service_ids = network_config_info["service_id"]
+    configure_graph(network_config_info, GTFS_OBJ, GRAPH_OBJ)
 
-def filter_stop_times_by_trip_ids(
-        GTFS_OBJ: GTFSController,
-        trip_ids: list[int],
-) -> pd.DataFrame:
-    stop_times = GTFS_OBJ.dfs["stop_times.txt"]
-    filt = stop_times["trip_id"].isin(trip_ids)
-    stop_times_subset = stop_times[filt]
-    return stop_times_subset
+    # filter trips/stop_times/stops by service ids (base tables are not modified)
+    feed_view = create_feed_view(GTFS_OBJ, list(service_ids))
+    print("num of stop ids: ", len(feed_view.stops_idx))
 
+    # the graph shares the integer stop ids of the compiled feed
+    # (compiled chunk by chunk from the active trips only when "stop_times.txt" is streamed)
+    feed = GTFS_OBJ.get_compiled_feed(service_ids)
+    GRAPH_OBJ.set_stop_ids(feed.stop_ids.tolist())
+    trip_mask = feed.trip_mask_by_services(service_ids)
 
-def filter_stops_by_stop_ids(
-        GTFS_OBJ: GTFSController,
-        stop_ids: list[int],
-) -> pd.DataFrame:
-    print("num of stop ids: ", len(stop_ids))
-    stops = GTFS_OBJ.dfs["stops.txt"]
-    filt = stops["stop_id"].isin(stop_ids)
-    print("filt sum:", filt.sum())
-    # only keep filtered stops...
-    GTFS_OBJ.dfs["stops.txt"] = stops[filt]
-    return GTFS_OBJ.dfs["stops.txt"]
-
-
-def filt_service_id_by_weekday(
-        services: pd.DataFrame,
-        sel_weekday: str,  # selected weekdays
-):
-    # services = GTFS_OBJ.dfs["calendar.txt"]
-    dfs = []
-    filt = (services[sel_weekday] == 1)
-    return filt
-
-
-def filter_service_id_by_date(
-    services: pd.DataFrame,
-    the_date: datetime.datetime | None,
-) -> pd.DataFrame:
-    WEEKDAYS = {
-        0: "monday",
-        1: "tuesday",
-        2: "wednesday",
-        3: "thursday",
-        4: "friday",
-        5: "saturday",
-        6: "sunday"
-    }
-    the_date = pd.to_datetime(the_date).date()
-    the_weekday = WEEKDAYS[the_date.weekday()]
-
-    services["start_date"] = pd.to_datetime(
-        services["start_date"], format="%Y%m%d"
-    ).dt.date
-    services["end_date"] = pd.to_datetime(
-        services["end_date"], format="%Y%m%d"
-    ).dt.date
-
-    filts = []
-    # the queried time range is totally covered by the time range...
-    if the_date is not None:
-        filts += [services["start_date"] <= the_date]
-        filts += [services["end_date"] >= the_date]
-        # also, filter by weekday...
-        filts += [filt_service_id_by_weekday(services, the_weekday)]
-    else:
-        st.error(f"{the_date} is not a valid date for analysis")
-    # get weekday also...
-
-    concat_and = lambda x, y: x & y
-    filt = reduce(concat_and, filts)
-    print("the date for analysis:", the_date)
-
-    if filt.sum() == 0:
-        st.error("no feasible services for that date found.")
-
-    return services.loc[filt, :]
-
-
-def filter_service_id_by_date_v2(
-    services: pd.DataFrame,
-    the_date: datetime.datetime,
-) -> tuple[list[int], list[int]]:
-    # part 1: get services from the "calendar_dates.txt" file
-    the_date = pd.to_datetime(the_date).date()
-    services['date'] = pd.to_datetime(services['date'], format="%Y%m%d")
-    services['date'] = services['date'].dt.date
-    
-    filt = (services['date'] == the_date) & (services['exception_type'] == 1)
-    sids_included = services.loc[filt, "service_id"].tolist()
-
-    # part 2: get services from the "calendar.txt" file
-    filt = (services['date'] == the_date) & (services['exception_type'] == 2)
-    sids_excluded = services.loc[filt, "service_id"].tolist()
-    return sids_included, sids_excluded
+    # build spatio-temporal networks
+    stops, stop_neighbors = add_network_stops(network_config_info, GRAPH_OBJ, feed_view.stops)
+    gtfs_pipeline.add_edges_compiled_stop_times(feed, GRAPH_OBJ, trip_mask)  # actual transit trips
+    finish_network(network_config_info, GTFS_OBJ, GRAPH_OBJ, stop_neighbors)
+    return GRAPH_OBJ, stops
 
@@ -0,0 +1,95 @@
+"""
+Test to safeguard the controller behaviors (loading, streaming, building networks)...
+"""
+import numpy as np
+import pandas as pd
+
+from script.GTFSGraph import GTFSGraph
+from script.gtfs_controller import GTFSController, build_network
+from script.compiled_feed_test import get_feed_tables
+
+
+def write_feed(folder, stops, trips, stop_times) -> None:
+    # a minimal feed folder: the given tables plus one calendar entry per service and one shape
+    folder.mkdir(parents=True, exist_ok=True)
+    stops.to_csv(folder / "stops.txt", index=False)
+    trips.to_csv(folder / "trips.txt", index=False)
+    stop_times.to_csv(folder / "stop_times.txt", index=False)
+    service_ids = pd.unique(trips["service_id"])
+    pd.DataFrame({
+        "service_id": service_ids,
+        **{day: 1 for day in ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]},
+        "start_date": 20240101,
+        "end_date": 20241231,
+    }).to_csv(folder / "calendar.txt", index=False)
+    pd.DataFrame({
+        "shape_id": ["S1", "S1"],
+        "shape_pt_lat": [36.0, 36.02],
+        "shape_pt_lon": [-84.0, -84.0],
+        "shape_pt_sequence": [1, 2],
+    }).to_csv(folder / "shapes.txt", index=False)
+
+
+def get_streamed_feed_tables():
+    # the toy feed with more trips, rows of each trip contiguous in the file
+    stops, __, __ = get_feed_tables()
+    trips = pd.DataFrame({
+        "trip_id": [101, 102, 103, 104],
+        "route_id": ["R1", "R1", "R1", "R2"],
+        "service_id": [0, 1, 0, 0],
+    })
+    stop_times = pd.DataFrame([
+        # trip_id, arrival_time, departure_time, stop_id, stop_sequence
+        [101, "00:10:00", "00:10:00", "A", 1],
+        [101, "00:15:00", "00:15:00", "B", 2],
+        [101, "00:25:00", "00:25:00", "C", 3],
+        [102, "00:12:00", "00:12:00", "A", 1],
+        [102, "00:20:00", "00:20:00", "C", 2],
+        [103, "00:14:00", "00:14:00", "B", 1],
+        [103, "00:18:00", "00:18:00", "C", 2],
+        [104, "00:21:00", "00:21:00", "C", 1],
+        [104, "00:30:00", "00:30:00", "A", 2],
+    ])
+    stop_times.columns = ["trip_id", "arrival_time", "departure_time", "stop_id", "stop_sequence"]
+    return stops, trips, stop_times
+
+
+def get_named_edges(GRAPH_OBJ: GTFSGraph) -> list:
+    # (start node, end node, total time, mode) with nodes named "{stop_id}_{tod}"
+    node_names = {nid: name for name, nid in GRAPH_OBJ.nodes_name_map.items()}
+    return sorted(
+        (node_names[e.start_node], node_names[e.end_node], e.total_t, e.mode.name)
+        for e in GRAPH_OBJ.G.edges()
+    )
+
+
+def test_iter_stop_times(tmp_path):
+    write_feed(tmp_path, *get_streamed_feed_tables())
+    GTFS_OBJ = GTFSController(str(tmp_path), stream_stop_times=True, chunksize=2)
+    assert "stop_times.txt" not in GTFS_OBJ.dfs
+
+    # every chunk has complete trips, and only the selected ones
+    chunks = list(GTFS_OBJ.iter_stop_times(trip_ids=[101, 104]))
+    trips_per_chunk = [set(chunk["trip_id"]) for chunk in chunks]
+    assert set.union(*trips_per_chunk) == {101, 104}
+    assert sum(len(trips) for trips in trips_per_chunk) == 2
+    assert sum(len(chunk) for chunk in chunks) == 5
+
+
+def test_build_network_streamed(tmp_path):
+    # the same network whether "stop_times.txt" is loaded or streamed
+    write_feed(tmp_path, *get_streamed_feed_tables())
+    network_config_info = {"service_id": [0], "bw_mile": 1, "walk_speed": 2}
+    graphs = {}
+    for stream in [False, True]:
+        GTFS_OBJ = GTFSController(str(tmp_path), stream_stop_times=stream, chunksize=2)
+        graphs[stream], __ = build_network(network_config_info, GTFS_OBJ, GTFSGraph())
+    assert sorted(graphs[True].nodes_name_map) == sorted(graphs[False].nodes_name_map)
+    assert get_named_edges(graphs[True]) == get_named_edges(graphs[False])
+    assert ("A_10", "B_15", 5, "TRIP") in get_named_edges(graphs[True])
+    assert not any(e[0] == "A_12" for e in get_named_edges(graphs[True]))  # trip 102 (service 1)
+
+    # the streamed feed only holds the stop times of the active trips (not trip 102)
+    feed = GTFS_OBJ.get_compiled_feed([0])
+    assert len(feed.st_trip) == 7
+    assert np.array_equal(np.unique(feed.trip_ids[feed.st_trip]), ["101", "103", "104"])
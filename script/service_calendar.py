@@ -0,0 +1,133 @@
+"""
+Compile "calendar.txt" and "calendar_dates.txt" into a service x date matrix...
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+
+def parse_gtfs_dates(dates) -> np.ndarray:
+    # GTFS dates are written as YYYYMMDD (either int or str after loading)
+    dates = pd.Series(dates).astype(str)
+    return pd.to_datetime(dates, format="%Y%m%d").to_numpy().astype("datetime64[D]")
+
+
+def to_datetime64(dates) -> np.ndarray:
+    # accept one date or a list of dates (datetime.date, str, Timestamp...)
+    dates = pd.to_datetime(pd.Series(np.atleast_1d(dates)))
+    return dates.to_numpy().astype("datetime64[D]")
+
+
+class ServiceCalendar:
+    """
+        A boolean matrix of shape (num. of services, num. of days).
+        active[i, j] is True if service_ids[i] runs on the date first_date + j.
+        Built once per feed, then each date (or date range) is a column lookup.
+    """
+    def __init__(
+            self,
+            calendar: pd.DataFrame | None = None,
+            calendar_dates: pd.DataFrame | None = None,
+    ):
+        if calendar is None:
+            calendar = pd.DataFrame(columns=["service_id", "start_date", "end_date"] + WEEKDAYS)
+        if calendar_dates is None:
+            calendar_dates = pd.DataFrame(columns=["service_id", "date", "exception_type"])
+
+        # collect all service ids from both tables (keep original order/type)
+        self.service_ids: np.ndarray = pd.unique(pd.concat([
+            calendar["service_id"], calendar_dates["service_id"]
+        ], ignore_index=True))
+        self.service_idx_map: dict = {sid: i for i, sid in enumerate(self.service_ids)}
+
+        cal_start = parse_gtfs_dates(calendar["start_date"])
+        cal_end = parse_gtfs_dates(calendar["end_date"])
+        exc_dates = parse_gtfs_dates(calendar_dates["date"])
+
+        # the validity range of the feed
+        all_dates = np.concatenate([cal_start, cal_end, exc_dates])
+        if len(all_dates) == 0:
+            self.first_date = np.datetime64("1970-01-01", "D")
+            self.active = np.zeros((len(self.service_ids), 0), dtype=bool)
+            return
+        self.first_date: np.datetime64 = all_dates.min()
+        num_days = int((all_dates.max() - self.first_date).astype(int)) + 1
+        self.active: np.ndarray = np.zeros((len(self.service_ids), num_days), dtype=bool)
+
+        # part 1: regular services from "calendar.txt" (weekday flags within date range)
+        if len(calendar) > 0:
+            rows = calendar["service_id"].map(self.service_idx_map).to_numpy()
+            flags = calendar[WEEKDAYS].to_numpy().astype(bool)  # (num. of rows, 7)
+            days = self.first_date + np.arange(num_days)
+            # 1970-01-01 is a Thursday (weekday 3)
+            weekdays = (days.astype(int) + 3) % 7
+            in_range = (
+                (cal_start[:, None] <= days[None, :]) &
+                (days[None, :] <= cal_end[:, None])
+            )
+            self.active[rows, :] |= flags[:, weekdays] & in_range
+
+        # part 2: exceptions from "calendar_dates.txt" (1: added, 2: removed)
+        if len(calendar_dates) > 0:
+            rows = calendar_dates["service_id"].map(self.service_idx_map).to_numpy()
+            cols = (exc_dates - self.first_date).astype(int)
+            exc_types = calendar_dates["exception_type"].to_numpy().astype(int)
+            added = exc_types == 1
+            removed = exc_types == 2
+            self.active[rows[added], cols[added]] = True
+            self.active[rows[removed], cols[removed]] = False
+
+    @classmethod
+    def from_dfs(cls, dfs: dict) -> "ServiceCalendar":
+        return cls(
+            calendar=dfs.get("calendar.txt"),
+            calendar_dates=dfs.get("calendar_dates.txt"),
+        )
+
+    @property
+    def last_date(self) -> np.datetime64:
+        return self.first_date + self.active.shape[1] - 1
+
+    def date_index(self, dates) -> np.ndarray:
+        # column indices of the dates (-1 if outside the feed validity range)
+        idx = (to_datetime64(dates) - self.first_date).astype(int)
+        idx[(idx < 0) | (idx >= self.active.shape[1])] = -1
+        return idx
+
+    def active_matrix(self, dates) -> np.ndarray:
+        # (num. of services, num. of dates), dates outside the range have no service
+        idx = self.date_index(dates)
+        mat = np.zeros((len(self.service_ids), len(idx)), dtype=bool)
+        valid = idx >= 0
+        mat[:, valid] = self.active[:, idx[valid]]
+        return mat
+
+    def active_service_ids(self, the_date: datetime.date) -> list:
+        mask = self.active_matrix(the_date)[:, 0]
+        return self.service_ids[mask].tolist()
+
+    def active_service_ids_by_dates(self, dates) -> dict:
+        dates = to_datetime64(dates)
+        mat = self.active_matrix(dates)
+        return {
+            d.astype(datetime.date): self.service_ids[mat[:, j]].tolist()
+            for j, d in enumerate(dates)
+        }
+
+    def active_service_ids_between(
+            self,
+            start_date: datetime.date,
+            end_date: datetime.date,
+    ) -> dict:
+        dates = np.arange(to_datetime64(start_date)[0], to_datetime64(end_date)[0] + 1)
+        return self.active_service_ids_by_dates(dates)
+
+    def num_active_days(self, start_date: datetime.date, end_date: datetime.date) -> pd.Series:
+        # how many days each service runs within [start_date, end_date]
+        dates = np.arange(to_datetime64(start_date)[0], to_datetime64(end_date)[0] + 1)
+        counts = self.active_matrix(dates).sum(axis=1)
+        return pd.Series(counts, index=self.service_ids, name="num_days")
@@ -0,0 +1,52 @@
+"""
+Test to safeguard the service calendar behaviors...
+"""
+import datetime
+
+import pandas as pd
+
+from script.service_calendar import ServiceCalendar
+
+
+def get_calendar_tables():
+    calendar = pd.DataFrame([
+        # service_id, mon, tue, wed, thu, fri, sat, sun, start_date, end_date
+        ["WK", 1, 1, 1, 1, 1, 0, 0, "20240805", "20240818"],
+        ["SA", 0, 0, 0, 0, 0, 1, 0, "20240805", "20240818"],
+    ])
+    calendar.columns = [
+        "service_id", "monday", "tuesday", "wednesday", "thursday",
+        "friday", "saturday", "sunday", "start_date", "end_date"
+    ]
+    calendar_dates = pd.DataFrame([
+        # service_id, date, exception_type
+        ["WK", 20240812, 2],  # holiday (weekday service removed)
+        ["SA", 20240812, 1],  # holiday (saturday service added)
+        ["EV", 20240820, 1],  # special event after the calendar range
+    ])
+    calendar_dates.columns = ["service_id", "date", "exception_type"]
+    return calendar, calendar_dates
+
+
+def test_active_service_ids():
+    cal = ServiceCalendar(*get_calendar_tables())
+    assert cal.active.shape == (3, 16)  # 2024-08-05 to 2024-08-20
+    assert cal.active_service_ids(datetime.date(2024, 8, 5)) == ["WK"]
+    assert cal.active_service_ids(datetime.date(2024, 8, 10)) == ["SA"]
+    assert cal.active_service_ids(datetime.date(2024, 8, 11)) == []
+    assert cal.active_service_ids(datetime.date(2024, 8, 12)) == ["SA"]
+    assert cal.active_service_ids(datetime.date(2024, 8, 20)) == ["EV"]
+    # outside the feed validity range
+    assert cal.active_service_ids(datetime.date(2023, 1, 1)) == []
+
+
+def test_active_service_ids_between():
+    cal = ServiceCalendar(*get_calendar_tables())
+    res = cal.active_service_ids_between(datetime.date(2024, 8, 11), datetime.date(2024, 8, 13))
+    assert res == {
+        datetime.date(2024, 8, 11): [],
+        datetime.date(2024, 8, 12): ["SA"],
+        datetime.date(2024, 8, 13): ["WK"],
+    }
+    counts = cal.num_active_days(datetime.date(2024, 8, 5), datetime.date(2024, 8, 20))
+    assert counts.to_dict() == {"WK": 9, "SA": 3, "EV": 1}
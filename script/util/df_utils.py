@@ -2,6 +2,7 @@
 Utility functions for processing dataframes
 """
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 
 
@@ -74,18 +75,21 @@ def display_stops_one_source(
     # print("stops head:")
     # print(stops.head())
 
-    stops_acc = pd.DataFrame.from_dict(one_source_access_dict, orient='index')
-    stops_acc = stops_acc.reset_index()
-    stops_acc.columns = ["node_id", "acc_time"]
-    print("stops_acc head:")
-    print(stops_acc.head())
-    print("stops_acc's shape:", stops_acc.shape)
+    # dense array of access time by (integer) node id, -1 for not visited
+    node_ids = np.fromiter(one_source_access_dict.keys(), dtype="int64")
+    acc_times = np.fromiter(one_source_access_dict.values(), dtype="float64")
+    node_acc = np.full(max(node_ids.max(initial=-1), stops["node_id"].max()) + 1, -1.0)
+    node_acc[node_ids] = acc_times
+    print("num. of visited nodes:", len(node_ids))
+    return display_stops_acc_times(stops, node_acc[stops["node_id"].to_numpy()])
 
-    stops = stops[["stop_id", "stop_lat", "stop_lon", "stop_name", "node_id"]]
-    stops = stops.merge(stops_acc, on="node_id", how="inner")
-    # print("stops head:")
-    # print(stops.head())
-    print("stops shape after merge:", stops.shape)
+
+def display_stops_acc_times(
+        stops: pd.DataFrame,
+        acc_times: np.ndarray,  # one per row of stops, -1 or inf if not accessible
+) -> gpd.GeoDataFrame:
+    stops = stops[["stop_id", "stop_lat", "stop_lon", "stop_name"]].copy()
+    stops["acc_time"] = acc_times
 
     stops = gpd.GeoDataFrame(
         stops,
@@ -94,6 +98,6 @@ def display_stops_one_source(
     stops = stops.set_crs('epsg:4326')
 
     # filter out -1 records (not accessible)
-    stops = stops.loc[stops["acc_time"] >= 0, :]
+    stops = stops.loc[(stops["acc_time"] >= 0) & np.isfinite(stops["acc_time"]), :]
     return stops
 
@@ -1,6 +1,7 @@
 """
 Contains function to generate folium in the app
 """
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 
@@ -64,27 +65,21 @@ def display_one_origin_map(
         GRAPH_OBJ: GTFSGraph,
         one_source_access_dict,
         one_source_path_dict,
+        access: tuple[list[str], np.ndarray] | None = None,  # see GTFSGraph.get_origin_access
 ) -> folium.Map:
-    stops_acc = pd.DataFrame.from_dict(one_source_access_dict, orient='index')
-    stops_acc = stops_acc.reset_index()
-    stops_acc.columns = ["stop_id", "acc_time"]
-    stops_pth = pd.DataFrame(pd.Series(one_source_path_dict))
-    stops_pth = stops_pth.reset_index()
-    stops_pth.columns = ["stop_id", "trajectory"]
+    # earliest arrival of each reached stop (integer stop ids) and the path to its node
+    stop_costs, stop_nodes = GRAPH_OBJ.reduce_costs_by_stop(one_source_access_dict, access=access)
+    reached = np.flatnonzero(np.isfinite(stop_costs))
+    stops_acc = pd.DataFrame({
+        "stop_idx": reached,
+        "acc_time": stop_costs[reached],
+        # (stops reached on foot from the origin have no node)
+        "trajectory": [one_source_path_dict.get(n, np.nan) for n in stop_nodes[reached].tolist()],
+    })
+    stops = stops[["stop_id", "stop_lat", "stop_lon", "stop_name", "stop_code"]].copy()
+    stops["stop_idx"] = stops["stop_id"].map(GRAPH_OBJ.stop_idx_map).fillna(-1).astype("int64")
 
-    # merge info
-    stops_acc = stops_acc.merge(stops_pth, on="stop_id", how="left")
-    stops_acc["stop_id"] = stops_acc["stop_id"].str[:-2]
-    print("stops_acc:")
-    print(stops_acc.head(2))
-    stops = stops[["stop_id", "stop_lat", "stop_lon", "stop_name", "stop_code"]]
-
-    stops['stop_id'] = stops['stop_id'].astype("string")
-    stops_acc['stop_id'] = stops_acc['stop_id'].astype("string")
-
-    stops = stops.merge(stops_acc, on="stop_id", how="left")
-    print("stops:")
-    print(stops.head(2))
+    stops = stops.merge(stops_acc, on="stop_idx", how="left")
     # init map
     m = folium_plots.display_map_background(stops=stops)
     m = folium_plots.display_one_origin_info(
@@ -0,0 +1,54 @@
+"""
+Run many independent graph queries in a process pool.
+The shared state (e.g., the graph) is handed to each worker once, through the
+pool initializer (inherited without pickling where processes are forked).
+rustworkx searches call back into Python visitors, so threads would share the GIL.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Iterable
+
+_WORKER_STATE: dict = {}
+
+
+def _init_worker(state: dict) -> None:
+    _WORKER_STATE.clear()
+    _WORKER_STATE.update(state)
+
+
+def get_num_cpus() -> int:
+    # CPUs this process may run on (not available on every platform)
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def get_worker_state() -> dict:
+    # the state given to parallel_map, inside a task
+    return _WORKER_STATE
+
+
+def parallel_map(
+        func: Callable[[Any], Any],  # a module-level function of one task
+        tasks: Iterable,
+        state: dict | None = None,
+        max_workers: int | None = None,
+) -> list:
+    tasks = list(tasks)
+    state = {} if state is None else state
+    if max_workers is None:
+        max_workers = min(get_num_cpus(), len(tasks))
+    if max_workers <= 1 or len(tasks) <= 1:
+        # run in this process (same code path for small jobs and tests)
+        previous = dict(_WORKER_STATE)
+        _init_worker(state)
+        try:
+            return [func(task) for task in tasks]
+        finally:
+            _init_worker(previous)
+    with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_worker,
+            initargs=(state,),
+    ) as executor:
+        return list(executor.map(func, tasks))
@@ -0,0 +1,233 @@
+"""
+LRU cache with a memory budget for query results shared by all sessions.
+Identical requests in flight are coalesced: the first caller computes,
+concurrent callers with the same key wait for its result.
+"""
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+from script.visualization.folium_plots import get_buffers
+
+
+def estimate_size(obj: Any, sample: int = 1000) -> int:
+    # rough memory footprint in bytes (large containers are sampled)
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, gpd.GeoSeries):
+        return int(shapely.get_num_coordinates(obj.to_numpy()).sum()) * 16 + obj.memory_usage(deep=True)
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return int(np.sum(obj.memory_usage(deep=True)))
+    if isinstance(obj, shapely.Geometry):
+        return shapely.get_num_coordinates(obj) * 16 + 64
+    if isinstance(obj, dict):
+        items = list(obj.items())
+        part = items[:sample]
+        per_item = sum(estimate_size(k) + estimate_size(v) for k, v in part) / max(len(part), 1)
+        return sys.getsizeof(obj) + int(per_item * len(items))
+    if isinstance(obj, (list, tuple, set)):
+        items = list(obj)
+        part = items[:sample]
+        per_item = sum(estimate_size(v) for v in part) / max(len(part), 1)
+        return sys.getsizeof(obj) + int(per_item * len(items))
+    return sys.getsizeof(obj)
+
+
+class ResultCache:
+    def __init__(self, max_bytes: int = 512 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict = OrderedDict()  # key -> (value, size in bytes)
+        self.num_bytes = 0
+        self.in_flight: dict[Hashable, Future] = {}
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self.lock:
+            return key in self.entries
+
+    def get_or_compute(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return self.entries[key][0]
+            future = self.in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self.in_flight[key] = future
+                self.stats["misses"] += 1
+            else:
+                self.stats["coalesced"] += 1
+        if not is_owner:
+            return future.result()  # raises if the computation failed
+
+        try:
+            value = func()
+        except BaseException as e:
+            with self.lock:
+                del self.in_flight[key]
+            future.set_exception(e)
+            raise
+        with self.lock:
+            self._put(key, value)
+            del self.in_flight[key]
+        future.set_result(value)
+        return value
+
+    def _put(self, key: Hashable, value: Any) -> None:
+        size = estimate_size(value)
+        if size > self.max_bytes:  # never cached
+            return
+        self.entries[key] = (value, size)
+        self.num_bytes += size
+        # evict least recently used entries
+        while self.num_bytes > self.max_bytes:
+            __, (__, old_size) = self.entries.popitem(last=False)
+            self.num_bytes -= old_size
+            self.stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.num_bytes = 0
+
+
+# one cache for the whole process (shared by all streamlit sessions)
+ISOCHRONE_CACHE = ResultCache()
+
+
+def get_isochrone_key(
+        GRAPH_OBJ,
+        stop_id: str,
+        depart_min: float,
+        cutoff: float,
+        walk_speed: float,
+        bucket_min: int = 1,
+) -> tuple:
+    # (network id, origin stop, departure minute bucket, cutoff, walk speed)
+    bucket = int(depart_min // bucket_min)
+    return GRAPH_OBJ.network_id, str(stop_id), bucket, float(cutoff), float(walk_speed)
+
+
+def query_origin_stop_time_cached(
+        GRAPH_OBJ,
+        stops_df: pd.DataFrame | None,
+        stop_id: str,
+        depart_min: float,
+        cutoff: float,
+        walk_speed: float = 1,
+        bucket_min: int = 1,
+        cache: ResultCache | None = None,
+) -> tuple[dict, dict]:
+    cache = ISOCHRONE_CACHE if cache is None else cache
+    key = get_isochrone_key(GRAPH_OBJ, stop_id, depart_min, cutoff, walk_speed, bucket_min)
+    # all departures of a bucket are answered from the start of the bucket
+    bucket_start = key[2] * bucket_min
+    return cache.get_or_compute(
+        key + ("search",),
+        lambda: GRAPH_OBJ.query_origin_stop_time(
+            stops_df=stops_df,
+            stop_id=stop_id,
+            depart_min=bucket_start,
+            cutoff=cutoff,
+            walk_speed=walk_speed,
+        ),
+    )
+
+
+def query_origin_coords_time_cached(
+        GRAPH_OBJ,
+        lat: float,
+        lon: float,
+        depart_min: float,
+        cutoff: float,
+        bw_mile: float = 0.5,
+        walk_speed: float = 1,
+        bucket_min: int = 1,
+        cache: ResultCache | None = None,
+) -> tuple[dict, dict]:
+    cache = ISOCHRONE_CACHE if cache is None else cache
+    origin = get_coords_origin(lat, lon)
+    key = get_isochrone_key(GRAPH_OBJ, origin, depart_min, cutoff, walk_speed, bucket_min)
+    bucket_start = key[2] * bucket_min
+    return cache.get_or_compute(
+        key + ("search", float(bw_mile)),
+        lambda: GRAPH_OBJ.query_origin_coords_time(
+            lat=lat,
+            lon=lon,
+            depart_min=bucket_start,
+            cutoff=cutoff,
+            bw_mile=bw_mile,
+            walk_speed=walk_speed,
+        ),
+    )
+
+
+def query_dest_time_cached(
+        GRAPH_OBJ,
+        dest: str | tuple[float, float],  # stop id or (lat, lon)
+        arrive_min: float,
+        cutoff: float,
+        bw_mile: float = 0.5,
+        walk_speed: float = 1,
+        bucket_min: int = 1,
+        cache: ResultCache | None = None,
+) -> tuple[dict, dict]:
+    # arrive-by searches, keyed apart from departures of the same place and minute
+    cache = ISOCHRONE_CACHE if cache is None else cache
+    is_coords = isinstance(dest, tuple)
+    place = get_coords_origin(*dest) if is_coords else dest
+    key = get_isochrone_key(GRAPH_OBJ, place, arrive_min, cutoff, walk_speed, bucket_min)
+    # all arrivals of a bucket are answered by the start of the bucket
+    bucket_start = key[2] * bucket_min
+    if is_coords:
+        return cache.get_or_compute(
+            key + ("arrive_by", "search", float(bw_mile)),
+            lambda: GRAPH_OBJ.query_dest_coords_time(
+                lat=dest[0],
+                lon=dest[1],
+                arrive_min=bucket_start,
+                cutoff=cutoff,
+                bw_mile=bw_mile,
+                walk_speed=walk_speed,
+            ),
+        )
+    return cache.get_or_compute(
+        key + ("arrive_by", "search"),
+        lambda: GRAPH_OBJ.query_dest_stop_time(
+            stop_id=dest,
+            arrive_min=bucket_start,
+            cutoff=cutoff,
+        ),
+    )
+
+
+def get_coords_origin(lat: float, lon: float) -> str:
+    # coordinates as an origin in cache keys (~0.1 m precision)
+    return f"{lat:.6f},{lon:.6f}"
+
+
+def get_buffers_cached(
+        key: tuple,  # from get_isochrone_key
+        stops_gdf: gpd.GeoDataFrame,
+        acc_times: list[float],
+        cache: ResultCache | None = None,
+) -> gpd.GeoSeries:
+    # polygons derived from the search result of the same key
+    cache = ISOCHRONE_CACHE if cache is None else cache
+    return cache.get_or_compute(
+        key + ("buffers", tuple(float(t) for t in acc_times)),
+        lambda: get_buffers(stops_gdf, acc_times),
+    )
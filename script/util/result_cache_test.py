@@ -0,0 +1,67 @@
+"""
+Test to safeguard the shared result cache...
+"""
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from script.util.result_cache import ResultCache, get_isochrone_key
+
+
+def test_lru_with_memory_budget():
+    cache = ResultCache(max_bytes=2500)
+    for i in range(3):
+        cache.get_or_compute(i, lambda: np.zeros(100))  # 800 bytes each
+    cache.get_or_compute(0, lambda: None)  # hit, 0 becomes the most recent
+    cache.get_or_compute(3, lambda: np.zeros(100))  # evicts 1
+    assert 1 not in cache and 0 in cache and 3 in cache
+    assert cache.num_bytes <= 2500
+    assert cache.stats["hits"] == 1 and cache.stats["evictions"] == 1
+    # values larger than the budget are returned but not kept
+    assert len(cache.get_or_compute("big", lambda: np.zeros(1000))) == 1000
+    assert "big" not in cache
+
+
+def test_in_flight_requests_are_coalesced():
+    cache = ResultCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return "result"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute("k", compute)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert results == ["result"] * 5
+    assert cache.stats["misses"] == 1 and cache.stats["coalesced"] == 4
+
+
+def test_failed_computation_is_not_cached():
+    cache = ResultCache()
+
+    def fail():
+        raise ValueError("no path")
+
+    with pytest.raises(ValueError):
+        cache.get_or_compute("k", fail)
+    assert "k" not in cache and len(cache.in_flight) == 0
+    assert cache.get_or_compute("k", lambda: 1) == 1
+
+
+def test_isochrone_key():
+    class Graph:
+        network_id = "net"
+
+    key = get_isochrone_key(Graph(), 10, 487.5, 120, 1.5, bucket_min=5)
+    assert key == ("net", "10", 97, 120.0, 1.5)
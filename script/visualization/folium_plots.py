@@ -7,6 +7,7 @@ import numpy as np
 
 from script.GTFSGraph import GTFSGraph
 import script.analysis.geo_analysis as gpd_ut
+from script.analysis.travel_time_surface import compute_travel_time_surface
 
 
 def get_stop_information(stops: pd.DataFrame) -> list[str]:
@@ -112,9 +113,9 @@ def display_one_origin_info(
             wt_lst, tt_lst = get_path_costs(GRAPH_OBJ, row_info["trajectory"])
         row_lst = row_info.values.tolist()
         popup_info = f"""
-        stop_id: {row_info[0]} <br>
-        travel time: {row_info[5]} <br>
-        trajectory: {row_info[6]} <br>
+        stop_id: {row_info["stop_id"]} <br>
+        travel time: {row_info["acc_time"]} <br>
+        trajectory: {row_info["trajectory"]} <br>
         tt costs: {tt_lst} <br>
         """
         if row_lst[5] == -1.0:
@@ -146,9 +147,9 @@ def get_path_costs(GRAPH_OBJ, nodes_lst):
     for i in range(len(nodes_lst) - 1):
         node_i = nodes_lst[i]
         node_j = nodes_lst[i + 1]
-        edge = GRAPH_OBJ.G.edges[node_i, node_j]
-        wt_lst += [round(float(edge['wt']), 2)]  # waiting time
-        tt_lst += [round(float(edge['tt']), 2)]  # travel time
+        edge = GRAPH_OBJ.G.get_edge_data(node_i, node_j)
+        wt_lst += [round(float(edge.wait_t), 2)]  # waiting time
+        tt_lst += [round(float(edge.trip_t), 2)]  # travel time
     return wt_lst, tt_lst
 
 
@@ -190,10 +191,12 @@ def plot_isochrone_combined_plot(
         acc_times: list[float],  # a list of departure/arrival time
         stops_gdf: gpd.GeoDataFrame,
         show_popup=True,
+        buffers: gpd.GeoSeries | None = None,  # precomputed (e.g., cached) buffers
 ) -> folium.Map:
     # convert the projection system to epsg:4326
     stops_gdf = stops_gdf.to_crs("epsg:4326")
-    buffers = get_buffers(stops_gdf, acc_times)
+    if buffers is None:
+        buffers = get_buffers(stops_gdf, acc_times)
     num_buffers = len(buffers)
 
     cmap_lst = cm.LinearColormap(
@@ -225,17 +228,45 @@ def plot_isochrone_combined_plot(
     return m
 
 
+def plot_isochrone_raster_plot(
+        acc_times: list[float],  # a list of departure/arrival time
+        stops_gdf: gpd.GeoDataFrame,
+        show_popup=True,
+        cell_m: float = 100,
+) -> folium.Map:
+    # one travel-time surface for all bands, shown as an image overlay
+    stops_gdf = stops_gdf.to_crs("epsg:4326")
+    acc_times = sorted(acc_times)
+    surface = compute_travel_time_surface(stops_gdf, max_time=acc_times[-1], cell_m=cell_m)
+
+    cmap_lst = cm.LinearColormap(
+        ["green", "yellow", "red"],
+        vmin=0,
+        vmax=acc_times[-1]
+    ).to_step(len(acc_times))
+    colors = [cmap_lst.rgba_floats_tuple(t)[:3] + (0.4,) for t in acc_times]
+
+    m = display_map_background(stops_gdf)
+    folium.raster_layers.ImageOverlay(
+        image=surface.to_rgba(acc_times, colors),
+        bounds=surface.bounds_latlon(),
+        mercator_project=False,  # the surface is already a web mercator grid
+        pixelated=False,
+    ).add_to(m)
+    # plot stations
+    m = display_gtfs_stops(stops_gdf, m, show_popup=show_popup)
+    cmap_lst.add_to(m)
+    return m
+
+
 def get_buffers(stops_gdf, acc_times):
-    # get buffers
-    buffers = []
-    for I, acct in enumerate(acc_times):
-        _df = stops_gdf.loc[(stops_gdf["acc_time"] <= acct), :]
-        _buff = gpd_ut.get_buffer_geom(stops_gdf, acc_times[I])[0]
-        buffers.append(_buff)
+    # get all nested buffers at once (each band grows from the smaller one)
+    buffers = gpd_ut.get_buffer_geoms(stops_gdf, acc_times).to_crs("epsg:4326")
     # change to GeoPandas type
     buffers = gpd.GeoSeries(
-        buffers,
-        name="geometry"
+        buffers.to_numpy(),
+        name="geometry",
+        crs="epsg:4326",
     )
     return buffers
 
@@ -94,6 +94,7 @@ def plot_isochrone_grid_plots(
     bds_miny = nodes_df['lat'].min()
     bds_maxy = nodes_df['lat'].max()
 
+    buffers = gpd_ut.get_buffer_geoms(stops_gdf, acc_times)
     for I, acct in enumerate(acc_times):
         i, j = int(I / 3), I % 3
         print(i, j)
@@ -109,7 +110,7 @@ def plot_isochrone_grid_plots(
             source=cx.providers.OpenStreetMap.Mapnik,
             crs=stops_gdf.crs
         )
-        _buff = gpd_ut.get_buffer_geom(stops_gdf, acc_times[I])[0]
+        _buff = buffers[I]
 
         geoInterface = _buff.__geo_interface__
         shpType = geoInterface['type']
@@ -144,10 +145,11 @@ def plot_isochrone_combined_plot(
     legends = [f"accessible range in {(i + 1) * 20} minutes" for i in range(6)]
 
     tot_num_buffers = len(acc_times)
+    buffers = gpd_ut.get_buffer_geoms(stops_gdf, acc_times)
     for I, acct in enumerate(acc_times):
         print(I)
         _df = stops_gdf.loc[(stops_gdf["acc_time"] <= acct), :]
-        _buff = gpd_ut.get_buffer_geom(stops_gdf, acc_times[I])[0]
+        _buff = buffers[I]
         geo_interface = _buff.__geo_interface__
         shp_type = geo_interface['type']
         if shp_type == "Polygon":